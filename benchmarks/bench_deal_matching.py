@@ -0,0 +1,186 @@
+"""
+Benchmark the hash-indexed deal matching engine against the original iterrows scan,
+or with --fuzzy, the blocked fuzzy matching of deals whose keys carry typos.
+
+Usage:
+    python -m benchmarks.bench_deal_matching [--fuzzy] [contact counts ...]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from pipeline_scripts.deal_matching import DealIndex, match_deals
+from pipeline_scripts.fuzzy_matching import FuzzyDealMatcher
+from pipeline_scripts.normalization import normalize_emails, normalize_names, normalize_phones
+
+# The row-wise scan is quadratic, so it is skipped above this many contacts.
+LEGACY_LIMIT = 5000
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'ton', 'ver', 'son', 'li', 'an', 'del', 'mar', 'ney', 'ber', 'quin', 'ell', 'os']
+FREE_MAIL_DOMAINS = ['gmail.com', 'outlook.com', 'bigpond.com', 'yahoo.com.au', 'icloud.com']
+
+
+def make_frames(contact_count: int, seed: int = 0) -> tuple:
+    """
+    Build synthetic contacts and deals with the match keys used by join_data.
+
+    Roughly one in ten contacts has a deal, split across name, email and phone matches.
+
+    Args:
+        contact_count (int): The number of contacts to generate.
+        seed (int): The random seed.
+
+    Returns:
+        tuple: The contacts and deals frames.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(contact_count)
+    contacts = pd.DataFrame({
+        'contactName_ghlc': [f'contact {i}' for i in ids],
+        'email_ghlc': [f'contact{i}@example.com' for i in ids],
+        'phone_ghlc': [f'04{i:08d}' for i in ids],
+    })
+
+    deal_count = max(contact_count // 10, 1)
+    owners = rng.choice(ids, size=deal_count)
+    key = rng.integers(0, 3, size=deal_count)
+    deals = pd.DataFrame({
+        'contactName_zd': np.where(key == 0, contacts['contactName_ghlc'].to_numpy()[owners], 'unknown'),
+        'email_zd': np.where(key == 1, contacts['email_ghlc'].to_numpy()[owners], 'nan'),
+        'phone_zd': np.where(key == 2, contacts['phone_ghlc'].to_numpy()[owners], 'nan'),
+        'Amount': rng.integers(100, 10000, size=deal_count).astype(float),
+        'Stage': rng.choice(['Checked & Signed Off', 'Deal Timed Out', 'Proposal'], size=deal_count),
+    })
+    return contacts, deals
+
+
+def _word(rng: np.random.Generator) -> str:
+    return ''.join(rng.choice(SYLLABLES, size=rng.integers(2, 4)))
+
+
+def _typo(rng: np.random.Generator, text: str) -> str:
+    """Substitute, delete or transpose one character."""
+    at = int(rng.integers(0, len(text) - 1))
+    kind = rng.integers(0, 3)
+    if kind == 0:
+        return text[:at] + rng.choice(list('abcdefghijklmnopqrstuvwxyz')) + text[at + 1:]
+    if kind == 1:
+        return text[:at] + text[at + 1:]
+    return text[:at] + text[at + 1] + text[at] + text[at + 2:]
+
+
+def make_fuzzy_frames(contact_count: int, seed: int = 0) -> tuple:
+    """
+    Build contacts and deals whose keys mostly differ by a typo.
+
+    One deal per ten contacts. Four in five deals belong to a contact and carry its
+    name, email and phone, each with a typo in half of the deals and each missing
+    in one in five; the rest belong to nobody.
+
+    Args:
+        contact_count (int): The number of contacts to generate.
+        seed (int): The random seed.
+
+    Returns:
+        tuple: The contacts frame, the deals frame and each deal's owning contact, -1 for none.
+    """
+    rng = np.random.default_rng(seed)
+    names = [f"{_word(rng)} {_word(rng)}{_word(rng)}" for _ in range(contact_count)]
+    domains = [rng.choice(FREE_MAIL_DOMAINS) if rng.random() < 0.7 else f"{_word(rng)}.com.au"
+               for _ in range(contact_count)]
+    emails = [f"{name.replace(' ', '.')}@{domain}" for name, domain in zip(names, domains)]
+    phones = [f"+614{number:08d}" for number in rng.integers(0, 10 ** 8, size=contact_count)]
+    contacts = pd.DataFrame({
+        'contactName_ghlc': normalize_names(pd.Series(names)),
+        'email_ghlc': normalize_emails(pd.Series(emails)),
+        'phone_ghlc': normalize_phones(pd.Series(phones)),
+    })
+
+    deal_count = max(contact_count // 10, 1)
+    owners = np.where(rng.random(deal_count) < 0.8, rng.integers(0, contact_count, size=deal_count), -1)
+    deal_keys = {'contactName_zd': [], 'email_zd': [], 'phone_zd': []}
+    for owner in owners:
+        if owner < 0:
+            keys = (f"{_word(rng)} {_word(rng)}{_word(rng)}", None, None)
+        else:
+            keys = (names[owner], emails[owner], phones[owner])
+        for column, key in zip(deal_keys, keys):
+            if key is not None and rng.random() < 0.5:
+                key = _typo(rng, key) if not key.startswith('+') else key[:-3] + _typo(rng, key[-3:])
+            deal_keys[column].append(None if owner >= 0 and rng.random() < 0.2 else key)
+
+    deals = pd.DataFrame({
+        'contactName_zd': normalize_names(pd.Series(deal_keys['contactName_zd'], dtype=object)),
+        'email_zd': normalize_emails(pd.Series(deal_keys['email_zd'], dtype=object)),
+        'phone_zd': normalize_phones(pd.Series(deal_keys['phone_zd'], dtype=object)),
+        'Amount': rng.integers(100, 10000, size=deal_count).astype(float),
+        'Stage': rng.choice(['Checked & Signed Off', 'Deal Timed Out', 'Proposal'], size=deal_count),
+    })
+    return contacts, deals, owners
+
+
+def legacy_match(contacts: pd.DataFrame, deals: pd.DataFrame) -> pd.DataFrame:
+    """The original join_data deal loop, kept as the benchmark baseline."""
+    result = contacts.copy()
+    for index, row in result.iterrows():
+        for key, value in row[['contactName_ghlc', 'email_ghlc', 'phone_ghlc']].items():
+            matching_row = deals[deals[key.replace('_ghlc', '_zd')] == value]
+            if not matching_row.empty:
+                result.at[index, 'Amount'] = matching_row['Amount'].values[0]
+                result.at[index, 'Stage'] = matching_row['Stage'].values[0]
+                break
+    return result[['Amount', 'Stage']]
+
+
+def time_call(func, *args) -> tuple:
+    """Return the result of func(*args) and the seconds it took."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def fuzzy_main(sizes: list) -> None:
+    print(f"{'contacts':>10} {'deals':>8} {'exact (s)':>10} {'index (s)':>10} {'fuzzy (s)':>10} "
+          f"{'pairs':>10} {'exact':>7} {'fuzzy':>7} {'recall':>7} {'+fuzzy':>7} {'precision':>9}")
+    for size in sizes:
+        contacts, deals, owners = make_fuzzy_frames(size)
+        index = DealIndex(deals)
+        positions, exact_time = time_call(index.resolve, contacts)
+        matcher, index_time = time_call(FuzzyDealMatcher, deals)
+        confidence = np.where(positions >= 0, 1.0, np.nan)
+        candidates = len(matcher.candidates(contacts, np.flatnonzero(positions < 0)))
+        (fuzzy_positions, _), fuzzy_time = time_call(matcher.resolve, contacts, positions, confidence)
+
+        # A deal is found if its owner ends up matched to it, or to another deal of theirs
+        owned = owners[owners >= 0]
+        exact_recall = (positions[owned] >= 0).mean()
+        recall = (fuzzy_positions[owned] >= 0).mean()
+        fuzzy = (positions < 0) & (fuzzy_positions >= 0)
+        correct = owners[fuzzy_positions[fuzzy]] == np.flatnonzero(fuzzy)
+        print(f"{size:>10} {len(deals):>8} {exact_time:>10.3f} {index_time:>10.3f} {fuzzy_time:>10.3f} "
+              f"{candidates:>10} {(positions >= 0).sum():>7} {fuzzy.sum():>7} {exact_recall:>7.1%} "
+              f"{recall:>7.1%} {correct.mean() if fuzzy.any() else 1:>9.1%}")
+
+
+def main(sizes: list) -> None:
+    print(f"{'contacts':>10} {'legacy (s)':>12} {'indexed (s)':>12} {'speedup':>10}")
+    for size in sizes:
+        contacts, deals = make_frames(size)
+        indexed, indexed_time = time_call(match_deals, contacts, deals)
+
+        if size > LEGACY_LIMIT:
+            print(f"{size:>10} {'-':>12} {indexed_time:>12.4f} {'-':>10}")
+            continue
+
+        legacy, legacy_time = time_call(legacy_match, contacts, deals)
+        pd.testing.assert_frame_equal(indexed, legacy, check_dtype=False)
+        print(f"{size:>10} {legacy_time:>12.4f} {indexed_time:>12.4f} {legacy_time / indexed_time:>9.0f}x")
+
+
+if __name__ == '__main__':
+    if '--fuzzy' in sys.argv[1:]:
+        fuzzy_main([int(size) for size in sys.argv[1:] if size != '--fuzzy'] or [10000, 100000, 1000000])
+    else:
+        main([int(size) for size in sys.argv[1:]] or [500, 1000, 5000, 100000, 1000000])
@@ -0,0 +1,90 @@
+"""
+Load-test the GHL and Zoho CRM retrievers against the local mock API server.
+
+Runs fetch_latest once per Zoho CRM page prefetch setting, with simulated latency,
+errors and rate limits, and reports the wall time and the mock server's request
+totals. Runs in a temporary directory with its own token files, so the real
+tokens and data files are left alone.
+
+With --locations N, the contacts are spread over N GHL locations and fetched with
+the multi-location mode, each location into its own partition.
+
+Usage:
+    python -m benchmarks.bench_fetch [--contacts N] [--records N] [--latency S]
+        [--prefetch 1 2 4 8] [--rate-limit N --rate-window S] [--error-rate R] [--locations N]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from shared_scripts.mock_api_server import MockApiServer, sample_contacts
+from zcrm_scripts.zcrm_stub_server import sample_records
+
+
+def prepare_workspace(directory: str, server: MockApiServer) -> None:
+    """Point the retrievers at the mock server and at token and data files inside the directory."""
+    for path in ['ghl_scripts/data', 'zcrm_scripts/data']:
+        os.makedirs(os.path.join(directory, path), exist_ok=True)
+    expired = {'access_token': None, 'refresh_token': 'mock', 'access_token_expiry': 0}
+    for name in ['ghl-tokens.json', 'zcrm-tokens.json']:
+        with open(os.path.join(directory, name), 'w') as file:
+            json.dump(expired, file)
+
+    os.environ.update({
+        'GHL_BASE_URL': f"{server.root_url}/",
+        'GHL_TOKEN_FILE': os.path.join(directory, 'ghl-tokens.json'),
+        'GHL_B4B_LOCATION': 'mock-location',
+        'ZCRM_BASE_URL': server.base_url,
+        'ZCRM_BULK_URL': server.bulk_url,
+        'ZCRM_ACCOUNTS_URL': f"{server.root_url}/",
+        'ZCRM_TOKEN_FILE': os.path.join(directory, 'zcrm-tokens.json'),
+    })
+    os.chdir(directory)
+
+
+def main(args) -> None:
+    locations = [f"location-{number}" for number in range(args.locations)] or None
+    server = MockApiServer(
+        sample_contacts(args.contacts, locations),
+        {module: sample_records(module, args.records) for module in ['Leads', 'Deals']},
+        latency=args.latency, error_rate=args.error_rate, rate_limit=args.rate_limit,
+        rate_window=args.rate_window, page_size=args.page_size, seed=0,
+    ).start()
+    workspace = tempfile.TemporaryDirectory()
+    prepare_workspace(workspace.name, server)
+
+    # Imported once the environment points at the mock server
+    from shared_scripts.async_fetch import fetch_latest_blocking
+    from zcrm_scripts import zcrm_records_retriever
+
+    print(f"{'prefetch':>8} {'wall (s)':>10} {'requests':>10} {'throttled':>10} {'errors':>10}", file=sys.stderr)
+    for prefetch in args.prefetch:
+        zcrm_records_retriever.PREFETCH_PAGES = prefetch
+        before = dict(server.stats)
+        start = time.perf_counter()
+        fetch_latest_blocking(locations=locations)
+        wall = time.perf_counter() - start
+        stats = {key: server.stats[key] - before[key] for key in before}
+        print(f"{prefetch:>8} {wall:>10.3f} {stats['requests']:>10} {stats['throttled']:>10} "
+              f"{stats['injected_errors']:>10}", file=sys.stderr)
+
+    server.stop()
+    workspace.cleanup()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load-test the retrievers against the mock API server.")
+    parser.add_argument('--contacts', type=int, default=5000, help="the number of GHL contacts")
+    parser.add_argument('--records', type=int, default=2000, help="the number of Zoho CRM records per module")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument('--page-size', type=int, default=100, help="the most GHL contacts per page")
+    parser.add_argument('--prefetch', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="the Zoho CRM page prefetch settings to compare")
+    parser.add_argument('--rate-limit', type=int, help="requests allowed per provider per window")
+    parser.add_argument('--rate-window', type=float, default=10.0, help="the rate limit window in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="the share of requests answered with a 503")
+    parser.add_argument('--locations', type=int, default=0, help="spread the contacts over this many GHL locations")
+    main(parser.parse_args())
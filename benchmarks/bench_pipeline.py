@@ -0,0 +1,183 @@
+"""
+Time every stage of main.py on synthetic data across scale tiers.
+
+Each tier runs in a fresh process, so its memory figures are not inflated by the
+tiers before it. Data sets are generated once per tier and seed and kept under
+benchmarks/data. Results are saved as JSON under benchmarks/results and can be
+compared against an earlier result to catch regressions.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--tiers 10000 100000 1000000] [--chunk-size N] [--workers N]
+    python -m benchmarks.bench_pipeline --compare benchmarks/results/BASELINE.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from .synthetic_data import write_dataset
+
+DEFAULT_TIERS = [10000, 100000, 1000000]
+DATA_DIR = './benchmarks/data'
+RESULTS_DIR = './benchmarks/results'
+# A stage is reported as a regression when it is this much slower than the baseline.
+REGRESSION_THRESHOLD = 1.2
+
+
+def dataset(contact_count: int, seed: int, file_format: str) -> dict:
+    """Return the paths of a tier's data set, generating it if it does not exist yet."""
+    directory = os.path.join(DATA_DIR, f"{contact_count}-seed{seed}")
+    paths = {name: os.path.join(directory, f"clean-{prefix}.{file_format}") for name, prefix in [
+        ('contacts', 'ghl-contacts'), ('leads', 'zcrm-leads'), ('deals', 'zcrm-deals'),
+    ]}
+    if not all(os.path.exists(path) for path in paths.values()):
+        print(f"Generating {contact_count} contacts in {directory}", file=sys.stderr)
+        write_dataset(directory, contact_count, seed, formats=(file_format,))
+    return paths
+
+
+def run_tier(contact_count: int, seed: int, file_format: str, chunk_size: int = None, trace_memory: bool = False,
+             workers: int = None) -> dict:
+    """
+    Run the pipeline once on a tier's data set in this process.
+
+    Args:
+        contact_count (int): The number of contacts.
+        seed (int): The data set seed.
+        file_format (str): 'parquet' or 'json'.
+        chunk_size (int): Stream the contacts in chunks of this many rows.
+        trace_memory (bool): Measure each stage's peak Python memory with tracemalloc.
+        workers (int): Rank the contacts in this many worker processes.
+
+    Returns:
+        dict: The run report.
+    """
+    paths = dataset(contact_count, seed, file_format)
+
+    # Imported here so that the run report's clock starts after any data generation
+    import main
+    main.metrics.configure(trace_memory)
+    with tempfile.TemporaryDirectory() as output:
+        main.run_pipeline(paths['contacts'], paths['leads'], paths['deals'],
+                          os.path.join(output, 'detailed.csv'), os.path.join(output, 'condensed.csv'), chunk_size,
+                          workers=workers)
+    return main.metrics.report()
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(tiers: list, seed: int, file_format: str, chunk_size: int = None, trace_memory: bool = False,
+                  workers: int = None) -> dict:
+    """
+    Run every tier in its own process.
+
+    Returns:
+        dict: The benchmark result, with the run report of each tier.
+    """
+    result = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'format': file_format,
+        'chunk_size': chunk_size,
+        'workers': workers,
+        'tiers': {},
+    }
+    for contact_count in tiers:
+        dataset(contact_count, seed, file_format)
+        command = [sys.executable, '-m', 'benchmarks.bench_pipeline', '--single', str(contact_count),
+                   '--seed', str(seed), '--format', file_format]
+        if chunk_size:
+            command += ['--chunk-size', str(chunk_size)]
+        if workers:
+            command += ['--workers', str(workers)]
+        if trace_memory:
+            command.append('--trace-memory')
+        report = json.loads(subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout)
+        result['tiers'][str(contact_count)] = report
+        print_tier(contact_count, report)
+    return result
+
+
+def print_tier(contact_count: int, report: dict) -> None:
+    print(f"\n{contact_count} contacts: {report['wall_seconds']:.2f}s, peak RSS {report['max_rss_mb']} MB")
+    print(f"{'stage':<22} {'wall (s)':>10} {'cpu (s)':>10} {'rows in':>10} {'rows out':>10} {'traced MB':>10}")
+    for name, stage in report['stages'].items():
+        print(f"{name:<22} {stage['wall_seconds']:>10.3f} {stage['cpu_seconds']:>10.3f} "
+              f"{stage['rows_in'] if stage['rows_in'] is not None else '-':>10} "
+              f"{stage['rows_out'] if stage['rows_out'] is not None else '-':>10} "
+              f"{stage['peak_traced_mb'] if stage['peak_traced_mb'] is not None else '-':>10}")
+
+
+def compare(result: dict, baseline: dict, threshold: float = REGRESSION_THRESHOLD) -> list:
+    """
+    Compare stage wall times with a baseline result.
+
+    Args:
+        result (dict): The new benchmark result.
+        baseline (dict): The baseline benchmark result.
+        threshold (float): The slowdown ratio reported as a regression.
+
+    Returns:
+        list: (tier, stage, baseline seconds, new seconds) for every regressed stage.
+    """
+    regressions = []
+    print(f"\nCompared with {baseline.get('git_revision')} ({baseline['created_at']}):")
+    for tier, report in result['tiers'].items():
+        base_stages = baseline['tiers'].get(tier, {}).get('stages', {})
+        for name, stage in report['stages'].items():
+            if name not in base_stages:
+                continue
+            before, after = base_stages[name]['wall_seconds'], stage['wall_seconds']
+            ratio = after / before if before else float('inf')
+            flag = ' REGRESSION' if ratio > threshold and after - before > 0.01 else ''
+            print(f"{tier:>8} {name:<22} {before:>9.3f}s -> {after:>9.3f}s ({ratio:.2f}x){flag}")
+            if flag:
+                regressions.append((tier, name, before, after))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the main.py stages on synthetic data.")
+    parser.add_argument('--tiers', type=int, nargs='+', default=DEFAULT_TIERS, help="the contact counts to run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', default='parquet', choices=['parquet', 'json'])
+    parser.add_argument('--chunk-size', type=int, help="stream the contacts in chunks of this many rows")
+    parser.add_argument('--workers', type=int, help="rank the contacts in this many worker processes")
+    parser.add_argument('--trace-memory', action='store_true', help="record per-stage tracemalloc peaks (slower)")
+    parser.add_argument('--compare', metavar='BASELINE', help="a saved result to compare stage times with")
+    parser.add_argument('--output', help="the result file, defaults to a timestamped file in benchmarks/results")
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        # Child process: report one tier on stdout, and keep stdout clean for it
+        stdout, sys.stdout = sys.stdout, sys.stderr
+        report = run_tier(args.single, args.seed, args.format, args.chunk_size, args.trace_memory, args.workers)
+        json.dump(report, stdout)
+        sys.exit(0)
+
+    benchmark = run_benchmark(args.tiers, args.seed, args.format, args.chunk_size, args.trace_memory, args.workers)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{benchmark['git_revision'] or 'unknown'}.json")
+    with open(output, 'w') as file:
+        json.dump(benchmark, file, indent=4)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(benchmark, json.load(file))
+        sys.exit(1 if regressions else 0)
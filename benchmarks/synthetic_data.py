@@ -0,0 +1,287 @@
+"""
+Generate seeded synthetic GHL contacts and Zoho CRM leads and deals.
+
+The records have the shapes main.py loads: cleaned GHL contacts with custom fields,
+attributions and tags, and cleaned Zoho CRM leads and deals. A share of the contacts
+match a lead or a deal, through each of the name, email and phone keys, and some
+keys are duplicated across contacts and deals. The same seed always gives the same
+data.
+
+Usage:
+    python -m benchmarks.synthetic_data OUTPUT_DIR [contact count] [--seed N] [--format parquet json]
+"""
+import argparse
+import json
+import os
+import random
+import string
+
+from pipeline_scripts.columnar_store import write_ghl_contacts, write_zcrm_records
+from pipeline_scripts.field_extraction import CUSTOM_FIELD_COLUMNS
+from zcrm_scripts.zcrm_records_retriever import DEAL_FIELDS, LEAD_FIELDS
+
+# The default shape of the generated data, as shares of the contacts.
+DEFAULT_PROFILE = {
+    'lead_rate': 0.3,        # contacts with a Zoho CRM lead on the same email
+    'deal_rate': 0.1,        # contacts with a Zoho CRM deal, split across the three match keys
+    'duplicate_rate': 0.02,  # contacts and deals that reuse another record's keys
+    'missing_rate': 0.05,    # contacts without an email, and separately without a phone
+    'unsold_rate': 0.2,      # deals without an amount
+}
+
+FIRST_NAMES = ['James', 'Olivia', 'Jack', 'Charlotte', 'Noah', 'Amelia', 'William', 'Isla', 'Thomas', 'Mia',
+               'Liam', 'Ava', 'Henry', 'Grace', 'Lucas', 'Chloe', 'Oliver', 'Sophie', 'Leo', 'Ruby']
+LAST_NAMES = ['Smith', 'Jones', 'Williams', 'Brown', 'Wilson', 'Taylor', 'Nguyen', 'Johnson', 'Martin', 'White',
+              'Anderson', 'Walker', 'Thompson', 'Harris', 'Lee', 'Ryan', 'Robinson', 'Kelly', 'King', 'Davis']
+EMAIL_DOMAINS = ['gmail.com', 'outlook.com', 'bigpond.com', 'yahoo.com.au', 'icloud.com', 'company.com.au']
+SOURCES = [('facebook form', 50), ('website', 25), ('google ads', 15), ('b4b - no txt conf form', 4),
+           ('B4B Website Survey', 3), ('bestforbusiness', 3)]
+TAGS = ['phone verified', 'facebook lead', 'callback', 'b4b', 'do not call']
+HANDSET_BANDS = ['1-2', '3-4', '5-9', '10-24', '25+', 'unsure']
+MEDIUMS = ['facebook', 'google', 'direct']
+DEAL_STAGES = [('Checked & Signed Off', 40), ('Proposal Sent', 25), ('Deal Timed Out', 20), ('Closed Lost', 15)]
+LEAD_STATUSES = ['Not Contacted', 'Attempted to Contact', 'Contacted', 'Qualified', 'Junk Lead']
+# Custom fields that are not extracted, so the flattening skips over them.
+NOISE_FIELD_IDS = ['aB3kLm9PqRsTuVwXyZ01', 'cD5nOp7QrStUvWxYz234']
+
+FIELD_IDS = {column: field_id for field_id, column in CUSTOM_FIELD_COLUMNS.items()}
+
+
+def _weighted(rng: random.Random, choices: list):
+    return rng.choices([value for value, _ in choices], weights=[weight for _, weight in choices])[0]
+
+
+def _record_id(rng: random.Random, length: int = 20) -> str:
+    return ''.join(rng.choices(string.ascii_letters + string.digits, k=length))
+
+
+def _mobile(rng: random.Random) -> str:
+    return f"4{rng.randrange(10 ** 8):08d}"
+
+
+def make_contact(rng: random.Random, index: int, profile: dict) -> dict:
+    """
+    Build one cleaned GHL contact.
+
+    Args:
+        rng (random.Random): The random source.
+        index (int): The contact number, which keeps names and emails unique.
+        profile (dict): The data profile.
+
+    Returns:
+        dict: The contact, as clean_contact_data returns it.
+    """
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    email = None if rng.random() < profile['missing_rate'] else f"{first}.{last}{index}@{rng.choice(EMAIL_DOMAINS)}".lower()
+    phone = None if rng.random() < profile['missing_rate'] else f"+61{_mobile(rng)}"
+
+    attributions = {}
+    for medium in rng.sample(MEDIUMS, rng.randint(1, 2)):
+        attributions[medium] = {
+            'utmCampaign': f"{medium}-campaign-{rng.randrange(12)}",
+            'utmMedium': 'paid' if medium != 'direct' else None,
+            'utmContent': f"creative-{rng.randrange(30)}",
+            'medium': medium,
+        }
+
+    custom_fields = [
+        {'id': FIELD_IDS['Handset_Count'], 'value': rng.choice(HANDSET_BANDS)},
+        {'id': FIELD_IDS['Ad_Name'], 'value': f"ad-{rng.randrange(40)}"},
+        {'id': FIELD_IDS['Business_in_AU'], 'value': rng.choice(['Yes', 'No'])},
+    ]
+    if rng.random() < 0.4:
+        custom_fields.append({'id': FIELD_IDS['Ph_verified'], 'value': [rng.choice(['True', 'False'])]})
+    if rng.random() < 0.25:
+        custom_fields.append({'id': FIELD_IDS['Qualified'], 'value': rng.choice(['True', 'False'])})
+    for field_id in NOISE_FIELD_IDS:
+        if rng.random() < 0.5:
+            custom_fields.append({'id': field_id, 'value': _record_id(rng, 8)})
+    rng.shuffle(custom_fields)
+
+    return {
+        'id': _record_id(rng),
+        'contactName': f"{first} {last} {index}",
+        'firstName': first,
+        'lastName': f"{last} {index}",
+        'companyName': f"{last} Holdings" if rng.random() < 0.6 else None,
+        'email': email,
+        'phone': phone,
+        'source': _weighted(rng, SOURCES),
+        'city': '',
+        'state': rng.choice(['NSW', 'VIC', 'QLD', 'WA', 'SA', '']),
+        'postalCode': '',
+        'address1': '',
+        'dateAdded': f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T09:00:00.000Z",
+        'dateUpdated': f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T10:00:00.000Z",
+        'tags': rng.sample(TAGS, rng.randint(0, 3)),
+        'country': 'AU',
+        'attributions': attributions,
+        'customFields': custom_fields,
+    }
+
+
+def make_lead(rng: random.Random, index: int, contact: dict = None) -> dict:
+    """
+    Build one cleaned Zoho CRM lead, on the contact's keys if one is given.
+
+    Args:
+        rng (random.Random): The random source.
+        index (int): The lead number.
+        contact (dict): The contact the lead matches.
+
+    Returns:
+        dict: The lead.
+    """
+    if contact is None:
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        name, email, phone = f"{first} {last} L{index}", f"{first}.{last}.l{index}@example.com", f"+61 {_mobile(rng)}"
+    else:
+        first, last = contact['firstName'], contact['lastName']
+        name, email, phone = contact['contactName'], contact['email'], contact['phone']
+        # Zoho keeps the case and spacing staff typed in
+        if email and rng.random() < 0.3:
+            email = email.upper()
+
+    record = {field: None for field in LEAD_FIELDS}
+    record.update({
+        'Company': f"{last} Holdings",
+        'Country': 'Australia',
+        'Created_Time': '2024-03-01T09:00:00+10:00',
+        'Email': email,
+        'First_Name': first,
+        'Full_Name': name,
+        'Last_Name': last,
+        'Lead_Number': str(100000 + index),
+        'Lead_Source': 'B4B',
+        'Lead_Status': rng.choice(LEAD_STATUSES),
+        'Phone': phone,
+    })
+    return record
+
+
+def make_deal(rng: random.Random, index: int, profile: dict, key: str = None, contact: dict = None) -> dict:
+    """
+    Build one cleaned Zoho CRM deal, matching the contact on one key if one is given.
+
+    Args:
+        rng (random.Random): The random source.
+        index (int): The deal number.
+        profile (dict): The data profile.
+        key (str): The key the deal matches the contact on: 'name', 'email' or 'phone'.
+        contact (dict): The contact the deal matches.
+
+    Returns:
+        dict: The deal.
+    """
+    name, email, phone = f"Deal Contact {index}", f"deal{index}@example.com", f"+61 {_mobile(rng)}"
+    if key == 'name':
+        name = contact['contactName']
+    elif key == 'email' and contact['email']:
+        email = contact['email']
+    elif key == 'phone' and contact['phone']:
+        phone = contact['phone'].replace('+61', '+61 ')
+
+    amount = None if rng.random() < profile['unsold_rate'] else float(rng.randrange(500, 50000))
+    record = {field: None for field in DEAL_FIELDS}
+    record.update({
+        'Deal_Name': f"{name} - mobiles",
+        'Stage': _weighted(rng, DEAL_STAGES),
+        'Created_Time': '2024-04-01T09:00:00+10:00',
+        'Emergency_Forward_No': phone,
+        'Generic_Email': email,
+        'Amount': amount,
+        'Contact_Name': {'id': _record_id(rng, 18), 'name': name},
+        'Lead_Source': 'B4B',
+        'Grand_Total': amount,
+        'Monthly_Sub_Total': None if amount is None else round(amount / 24, 2),
+        'Handsets_Required': str(rng.randint(1, 30)),
+    })
+    return record
+
+
+def generate(contact_count: int, seed: int = 0, profile: dict = None) -> tuple:
+    """
+    Generate a synthetic data set.
+
+    Args:
+        contact_count (int): The number of GHL contacts.
+        seed (int): The random seed.
+        profile (dict): Overrides for DEFAULT_PROFILE.
+
+    Returns:
+        tuple: The contacts, leads and deals lists.
+    """
+    profile = {**DEFAULT_PROFILE, **(profile or {})}
+    rng = random.Random(seed)
+
+    contacts = [make_contact(rng, index, profile) for index in range(contact_count)]
+    # Duplicate contacts share an earlier contact's email, phone or name
+    for contact in rng.sample(contacts, int(contact_count * profile['duplicate_rate'])):
+        other = rng.choice(contacts)
+        field = rng.choice(['email', 'phone', 'contactName'])
+        contact[field] = other[field]
+
+    # Leads are matched on email, so only contacts with an email get one
+    with_email = [contact for contact in contacts if contact['email']]
+    lead_count = min(int(contact_count * profile['lead_rate']), len(with_email))
+    leads = [make_lead(rng, index, contact) for index, contact in enumerate(rng.sample(with_email, lead_count))]
+    leads += [make_lead(rng, len(leads) + index) for index in range(len(leads) // 10)]
+    rng.shuffle(leads)
+
+    deals = [make_deal(rng, index, profile, rng.choice(['name', 'email', 'phone']), contact)
+             for index, contact in enumerate(rng.sample(contacts, int(contact_count * profile['deal_rate'])))]
+    # Duplicate deals repeat an existing deal's keys with a different stage and amount
+    deals += [{**make_deal(rng, len(deals) + index, profile), **{
+        field: original[field] for field in ['Contact_Name', 'Generic_Email', 'Emergency_Forward_No']
+    }} for index, original in enumerate(rng.sample(deals, int(len(deals) * profile['duplicate_rate'])))]
+    deals += [make_deal(rng, len(deals) + index, profile) for index in range(len(deals) // 10)]
+    rng.shuffle(deals)
+
+    return contacts, leads, deals
+
+
+def write_dataset(directory: str, contact_count: int, seed: int = 0, profile: dict = None,
+                  formats: tuple = ('parquet',)) -> dict:
+    """
+    Generate a synthetic data set and write it as the clean-*.parquet and/or clean-*.json files.
+
+    Args:
+        directory (str): The directory to write to.
+        contact_count (int): The number of GHL contacts.
+        seed (int): The random seed.
+        profile (dict): Overrides for DEFAULT_PROFILE.
+        formats (tuple): 'parquet' and/or 'json'.
+
+    Returns:
+        dict: Format -> {'contacts', 'leads', 'deals'} file paths.
+    """
+    os.makedirs(directory, exist_ok=True)
+    contacts, leads, deals = generate(contact_count, seed, profile)
+
+    paths = {}
+    for file_format in formats:
+        paths[file_format] = {name: os.path.join(directory, f"clean-{prefix}.{file_format}") for name, prefix in [
+            ('contacts', 'ghl-contacts'), ('leads', 'zcrm-leads'), ('deals', 'zcrm-deals'),
+        ]}
+        files = paths[file_format]
+        if file_format == 'parquet':
+            write_ghl_contacts(contacts, files['contacts'])
+            write_zcrm_records(leads, files['leads'], LEAD_FIELDS)
+            write_zcrm_records(deals, files['deals'], DEAL_FIELDS)
+        else:
+            for name, records in [('contacts', contacts), ('leads', leads), ('deals', deals)]:
+                with open(files[name], 'w') as file:
+                    json.dump(records, file)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic GHL and Zoho CRM data set.")
+    parser.add_argument('directory')
+    parser.add_argument('contacts', type=int, nargs='?', default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', nargs='+', default=['parquet'], choices=['parquet', 'json'])
+    args = parser.parse_args()
+
+    for file_format, files in write_dataset(args.directory, args.contacts, args.seed, formats=args.format).items():
+        print(f"Wrote {', '.join(files.values())}")
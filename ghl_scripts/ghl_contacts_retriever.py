@@ -1,14 +1,119 @@
 import requests
 import os
 import pprint
-import json
+from operator import attrgetter
 
 from dotenv import load_dotenv
 
-from .obtain_access_token import initialise_ghl_tokens
+from pipeline_scripts.columnar_store import GHL_CONTACT_SCHEMA, LOCATION_COLUMN, write_ghl_contacts
+from pipeline_scripts.sqlite_store import upsert_ghl_contacts
+from pipeline_scripts.streaming import iter_chunks
+from shared_scripts.fetch_checkpoint import PageCheckpoint
+from shared_scripts.json_records import write_json_array
+from shared_scripts.request_scheduler import get_scheduler
+from shared_scripts.sync_state import (
+    load_records,
+    load_sync_state,
+    merge_records,
+    needs_full_sync,
+    save_sync_state,
+    update_sync_state,
+)
+
+from .obtain_access_token import ghl_tokens
 
 load_dotenv()
 
+# Constants
+# Overridable to point at a local mock server
+BASE_URL = os.getenv("GHL_BASE_URL", "https://services.leadconnectorhq.com/")
+SEARCH_PAGE_LIMIT = 100
+RAW_CONTACTS_FILE = './ghl_scripts/data/raw-ghl-contacts.json'
+CLEAN_CONTACTS_FILE = './ghl_scripts/data/clean-ghl-contacts.parquet'
+SYNC_STATE_FILE = './ghl_scripts/data/sync-state.json'
+CONTACTS_CHECKPOINT_FILE = './ghl_scripts/data/contacts-checkpoint.json'
+SEARCH_CHECKPOINT_FILE = './ghl_scripts/data/search-checkpoint.json'
+# Locations fetched by ID are each kept in a 'locationId=ID' partition directory under this one.
+LOCATIONS_DIR = './ghl_scripts/data/locations/'
+# The fields of a cleaned contact, in order.
+CLEAN_CONTACT_FIELDS = GHL_CONTACT_SCHEMA.names + ['attributions', 'customFields']
+
+
+class GhlContact:
+    """
+    A cleaned GHL contact, holding only the fields the pipeline uses.
+
+    Each fetched contact is cleaned into one of these once, and written to Parquet
+    and the SQLite store from it. Slots make it smaller than the equivalent
+    dictionary, and the Parquet columns are read straight off the records.
+    """
+
+    __slots__ = tuple(CLEAN_CONTACT_FIELDS)
+
+    def __init__(self, contact: dict):
+        """
+        Args:
+            contact (dict): The contact, as the GHL API returns it.
+        """
+        self.id = contact["id"]
+        self.contactName = contact["contactName"]
+        self.firstName = contact["firstName"]
+        self.lastName = contact["lastName"]
+        self.companyName = contact["companyName"]
+        self.email = contact["email"]
+        self.phone = contact["phone"]
+        self.source = contact["source"]
+
+        # The address fields are empty strings when missing
+        city, state = contact.get("city"), contact.get("state")
+        postal_code, address = contact.get("postalCode"), contact.get("address1")
+        self.city = city if city is not None else ""
+        self.state = state if state is not None else ""
+        self.postalCode = postal_code if postal_code is not None else ""
+        self.address1 = address if address is not None else ""
+
+        self.dateAdded = contact["dateAdded"]
+        self.dateUpdated = contact["dateUpdated"]
+        self.tags = contact.get("tags") or []
+        self.country = contact.get("country", None)
+
+        # Attributions keyed by medium, keeping those with a medium and all three UTM keys
+        attributions = contact.get("attributions")
+        if attributions:
+            self.attributions = {
+                attribution["medium"]: {
+                    "utmCampaign": attribution["utmCampaign"],
+                    "utmMedium": attribution["utmMedium"],
+                    "utmContent": attribution["utmContent"],
+                    "medium": attribution["medium"],
+                }
+                for attribution in attributions
+                if attribution.get("medium") is not None
+                and "utmCampaign" in attribution and "utmMedium" in attribution and "utmContent" in attribution
+            }
+        else:
+            self.attributions = {"utmCampaign": None, "utmMedium": None, "utmContent": None}
+
+        self.customFields = [{"id": field["id"], "value": field["value"]} for field in contact.get("customFields") or []]
+
+    def as_dict(self) -> dict:
+        """Return the contact as clean_contact_data does."""
+        return {field: getattr(self, field) for field in CLEAN_CONTACT_FIELDS}
+
+    @staticmethod
+    def columns(contacts: list) -> dict:
+        """
+        Gather the fields of cleaned contacts into columns.
+
+        Args:
+            contacts (list): The GhlContact records.
+
+        Returns:
+            dict: Field -> the contacts' values, in CLEAN_CONTACT_FIELDS order.
+        """
+        return {field: list(map(attrgetter(field), contacts)) for field in CLEAN_CONTACT_FIELDS}
+
+
 def clean_contact_data(contact):
     """
     Clean up the contact data and return a dictionary with the desired fields.
@@ -19,144 +124,257 @@ def clean_contact_data(contact):
     Returns:
         dict: A dictionary with the cleaned-up contact data.
     """
-    
-    # Initialize an empty dictionary to store the cleaned-up contact data
-    cleaned_contact = {}
-    
-    # Add the id, contactName, firstNameRaw, lastNameRaw, companyName, email, phone fields
-    cleaned_contact["id"] = contact["id"]
-    cleaned_contact["contactName"] = contact["contactName"]
-    cleaned_contact["firstName"] = contact["firstName"]
-    cleaned_contact["lastName"] = contact["lastName"]
-    cleaned_contact["companyName"] = contact["companyName"]
-    cleaned_contact["email"] = contact["email"]
-    cleaned_contact["phone"] = contact["phone"]
-    
-    # Add the source field
-    cleaned_contact["source"] = contact["source"]
-    
-    # Add the city, state, postalCode, address1 fields if they exist
-    if "city" in contact and contact["city"] is not None:
-        cleaned_contact["city"] = contact["city"]
-    else:
-        cleaned_contact["city"] = ""
-        
-    if "state" in contact and contact["state"] is not None:
-        cleaned_contact["state"] = contact["state"]
-    else:
-        cleaned_contact["state"] = ""
-        
-    if "postalCode" in contact and contact["postalCode"] is not None:
-        cleaned_contact["postalCode"] = contact["postalCode"]
-    else:
-        cleaned_contact["postalCode"] = ""
-        
-    if "address1" in contact and contact["address1"] is not None:
-        cleaned_contact["address1"] = contact["address1"]
-    else:
-        cleaned_contact["address1"] = ""
-    
-    # Add the dateAdded and dateUpdated fields
-    cleaned_contact["dateAdded"] = contact["dateAdded"]
-    cleaned_contact["dateUpdated"] = contact["dateUpdated"]
-    
-    # Add the tags field
-    if "tags" in contact and len(contact["tags"]) > 0:
-        cleaned_contact["tags"] = contact["tags"]
-    else:
-        cleaned_contact["tags"] = []
-        
-    # Add the country field
-    cleaned_contact["country"] = contact.get("country", None)
-    
-    # Add the attributions fields
-    if "attributions" in contact and len(contact["attributions"]) > 0:
-        cleaned_contact["attributions"] = {}
-        for attribution in contact["attributions"]:
-            medium = attribution.get("medium", None)
-            if medium is not None and "utmCampaign" in attribution and "utmMedium" in attribution and "utmContent" in attribution:
-            
-                cleaned_contact["attributions"][attribution["medium"]] = {
-                    "utmCampaign": attribution.get("utmCampaign", None),
-                    "utmMedium": attribution.get("utmMedium", None),
-                    "utmContent": attribution.get("utmContent", None),
-                    "medium": attribution.get("medium", None),
-                }
-    else:
-        cleaned_contact["attributions"] = {"utmCampaign": None, "utmMedium": None, "utmContent": None}
-    
-    # Add the customFields field
-    if "customFields" in contact and len(contact["customFields"]) > 0:
-        cleaned_contact["customFields"] = []
-        for customField in contact["customFields"]:
-            cleaned_contact["customFields"].append({
-                "id": customField["id"],
-                "value": customField["value"]
-            })
-    else:
-        cleaned_contact["customFields"] = []
-    
-    return cleaned_contact
+    return GhlContact(contact).as_dict()
 
-def retrieve_contacts():
-    """
-    Retrieve all contacts from the GHL API.
-    
-    Saves the contacts to a JSON file named 'ghl-contacts.json'.
+def iter_contact_pages(headers: dict, location_id: str, session: requests.Session = None, cursor: dict = None):
     """
-    
-    # Get GHL B4B Location key from.env file
-    GHL_B4B_LOCATION = os.getenv("GHL_B4B_LOCATION")
+    Page through every contact in a GHL location, one page at a time.
 
-    access_token = initialise_ghl_tokens()
-
-    url = "https://services.leadconnectorhq.com/contacts/"
+    Args:
+        headers (dict): The request headers.
+        location_id (str): The GHL location to fetch.
+        session (requests.Session): The session to send the requests on.
+        cursor (dict): The paging position to start from. It is updated in place to the
+            position of the next page before each page is yielded, so it can be saved.
 
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "Version": "2021-07-28",
-        "Accept": "application/json"
-    }
+    Yields:
+        list: The raw contacts of the next page.
+    """
+    url = f"{BASE_URL}contacts/"
 
-    # Initialize variables to keep track of pagination
-    start_after_id = None
-    start_after_num = None
-    all_contacts = []
+    # Keep track of pagination
+    cursor = cursor if cursor is not None else {}
+    cursor.setdefault('startAfter', None)
+    cursor.setdefault('startAfterId', None)
+    cursor.setdefault('fetched', 0)
 
     while True:
         querystring = {
-            "locationId": GHL_B4B_LOCATION,
+            "locationId": location_id,
             "limit": "100",
-            "startAfter": start_after_num,
-            "startAfterId": start_after_id,
+            "startAfter": cursor['startAfter'],
+            "startAfterId": cursor['startAfterId'],
             "query": "",
         }
 
         print(f'Making request to {url}')
-        response = requests.get(url, headers=headers, params=querystring)
-
-        if response.status_code != 200:
-            raise Exception(f"Failed to retrieve contacts. Status code: {response.status_code}")
+        response = get_scheduler('ghl').request('GET', url, session, headers=headers, params=querystring,
+                                                auth=ghl_tokens())
 
         # Get the contacts and metadata from the response
-        contacts = response.json()['contacts']
-        metadata = {}
-        for key, value in response.json()['meta'].items():
-            metadata[key] = value
+        payload = response.json()
+        contacts = payload['contacts']
+        metadata = payload['meta']
 
-        # Update start_after_id for next API call
-        start_after_id = metadata['startAfterId']
-        start_after_num = metadata['startAfter']
+        # Move the cursor past this page for the next API call
+        cursor['startAfterId'] = metadata['startAfterId']
+        cursor['startAfter'] = metadata['startAfter']
+        cursor['fetched'] += len(contacts)
 
-        all_contacts.extend(contacts)
+        if contacts:
+            yield contacts
 
         # If there are no more contacts to retrieve, break the loop
-        if not contacts or (metadata and 'total' in metadata and metadata['total'] <= len(all_contacts)):
+        if not contacts or (metadata and 'total' in metadata and metadata['total'] <= cursor['fetched']):
+            break
+
+
+def fetch_all_contacts(headers: dict, location_id: str, session: requests.Session = None,
+                       checkpoint_file: str = CONTACTS_CHECKPOINT_FILE) -> list:
+    """
+    Page through every contact in a GHL location.
+
+    Progress is checkpointed after every page, so a fetch that fails part way resumes
+    from the last completed page on the next run.
+
+    Args:
+        headers (dict): The request headers.
+        location_id (str): The GHL location to fetch.
+        session (requests.Session): The session to send the requests on.
+        checkpoint_file (str): The checkpoint file, one per location fetched at the same time.
+
+    Returns:
+        list: The raw contacts.
+    """
+    checkpoint = PageCheckpoint(checkpoint_file, {"endpoint": "contacts/", "locationId": location_id})
+    cursor, all_contacts = checkpoint.resume()
+    if all_contacts:
+        print(f"Resuming the contacts fetch after {len(all_contacts)} contacts")
+
+    cursor = cursor or {}
+    for contacts in iter_contact_pages(headers, location_id, session, cursor):
+        all_contacts.extend(contacts)
+        checkpoint.save(cursor, contacts)
+
+    checkpoint.clear()
+    return all_contacts
+
+
+def stream_clean_contacts(chunk_size: int, session: requests.Session = None):
+    """
+    Stream cleaned contacts straight from the GHL API pages, without storing them.
+
+    Args:
+        chunk_size (int): The maximum number of contacts per chunk.
+        session (requests.Session): The session to send the requests on.
+
+    Yields:
+        list: The next chunk of contacts, as returned by clean_contact_data.
+    """
+    pages = iter_contact_pages(ghl_headers(), os.getenv("GHL_B4B_LOCATION"), session)
+    contacts = (clean_contact_data(contact) for page in pages for contact in page)
+    yield from iter_chunks(contacts, chunk_size)
+
+
+def fetch_updated_contacts(headers: dict, location_id: str, since: str, session: requests.Session = None,
+                           checkpoint_file: str = SEARCH_CHECKPOINT_FILE) -> list:
+    """
+    Page through the contacts in a GHL location updated after a point in time.
+
+    Uses the contact search endpoint, filtered and sorted on dateUpdated. Progress is
+    checkpointed after every page, like fetch_all_contacts.
+
+    Args:
+        headers (dict): The request headers.
+        location_id (str): The GHL location to fetch.
+        since (str): The ISO 8601 dateUpdated high-water mark.
+        session (requests.Session): The session to send the requests on.
+        checkpoint_file (str): The checkpoint file, one per location fetched at the same time.
+
+    Returns:
+        list: The raw contacts updated after the mark.
+    """
+    url = f"{BASE_URL}contacts/search"
+    checkpoint = PageCheckpoint(checkpoint_file, {"endpoint": "contacts/search", "locationId": location_id, "since": since})
+    cursor, updated_contacts = checkpoint.resume()
+    page = cursor['page'] if cursor else 1
+
+    while True:
+        body = {
+            "locationId": location_id,
+            "page": page,
+            "pageLimit": SEARCH_PAGE_LIMIT,
+            "filters": [{"field": "dateUpdated", "operator": "range", "value": {"gt": since}}],
+            "sort": [{"field": "dateUpdated", "direction": "asc"}],
+        }
+
+        print(f'Making request to {url} (page {page})')
+        response = get_scheduler('ghl').request('POST', url, session, headers=headers, json=body,
+                                                auth=ghl_tokens())
+
+        payload = response.json()
+        contacts = payload['contacts']
+        updated_contacts.extend(contacts)
+        page += 1
+        checkpoint.save({"page": page}, contacts)
+
+        # The server may cap the page below SEARCH_PAGE_LIMIT, so stop on the total or an empty page
+        if not contacts or payload.get('total', 0) <= len(updated_contacts):
             break
+
+    checkpoint.clear()
+    return updated_contacts
+
+
+def location_files(location_id: str = None) -> dict:
+    """
+    Find the files a location's contacts and sync progress are kept in.
+
+    Args:
+        location_id (str): The GHL location, None for the GHL_B4B_LOCATION files.
+
+    Returns:
+        dict: 'raw', 'clean', 'sync_state', 'contacts_checkpoint' and 'search_checkpoint' -> file path.
+    """
+    if location_id is None:
+        return {
+            'raw': RAW_CONTACTS_FILE,
+            'clean': CLEAN_CONTACTS_FILE,
+            'sync_state': SYNC_STATE_FILE,
+            'contacts_checkpoint': CONTACTS_CHECKPOINT_FILE,
+            'search_checkpoint': SEARCH_CHECKPOINT_FILE,
+        }
+    directory = f"{LOCATIONS_DIR}locationId={location_id}/"
+    return {
+        'raw': f"{directory}raw-ghl-contacts.json",
+        'clean': f"{directory}clean-ghl-contacts.parquet",
+        'sync_state': f"{directory}sync-state.json",
+        'contacts_checkpoint': f"{directory}contacts-checkpoint.json",
+        'search_checkpoint': f"{directory}search-checkpoint.json",
+    }
+
+
+def ghl_headers() -> dict:
+    """
+    Build the GHL API request headers.
+
+    The Authorization header is added to each request by the shared GHL token
+    manager, so a long fetch always sends a valid token.
+
+    Returns:
+        dict: The request headers.
+    """
+    return {
+        "Version": "2021-07-28",
+        "Accept": "application/json"
+    }
+
+
+def retrieve_contacts(session: requests.Session = None, incremental: bool = False, location_id: str = None):
+    """
+    Retrieve all contacts from the GHL API.
     
-    with open('./ghl_scripts/data/raw-ghl-contacts.json', 'w') as f:
-        json.dump(all_contacts, f, indent=4)
+    Saves the raw contacts to 'raw-ghl-contacts.json' and the cleaned contacts, with
+    their attributions and custom fields flattened, to 'clean-ghl-contacts.parquet'.
+    The fetched contacts are also upserted into the SQLite store.
+
+    In incremental mode only the contacts updated since the stored dateUpdated
+    high-water mark are fetched and merged into the stored contacts by ID. A full
+    fetch still runs when there is no mark yet or the last full reconciliation is
+    older than RECONCILE_AFTER_SECONDS.
+
+    Given a location ID, that location is fetched instead of GHL_B4B_LOCATION, into
+    its own partition of LOCATIONS_DIR with its own cursors, checkpoints and sync
+    state, so several locations can be fetched at the same time. Each contact is
+    tagged with its 'locationId', and the SQLite store keeps the other locations'
+    contacts.
+
+    Args:
+        session (requests.Session): The session to send the requests on, so pages reuse one connection.
+        incremental (bool): Fetch only the contacts changed since the last sync.
+        location_id (str): The GHL location to fetch into its partition.
+    """
+    files = location_files(location_id)
+    if location_id is not None:
+        os.makedirs(os.path.dirname(files['raw']), exist_ok=True)
+
+    # Get GHL B4B Location key from.env file
+    location = location_id or os.getenv("GHL_B4B_LOCATION")
+
+    headers = ghl_headers()
+
+    state = load_sync_state(files['sync_state'])
+    full = not incremental or needs_full_sync(state)
+
+    if full:
+        changed_contacts = fetch_all_contacts(headers, location, session, files['contacts_checkpoint'])
+        all_contacts = changed_contacts
+    else:
+        changed_contacts = fetch_updated_contacts(headers, location, state['watermark'], session,
+                                                  files['search_checkpoint'])
+        all_contacts = merge_records(load_records(files['raw']), changed_contacts)
+
+    if location_id is not None:
+        for contact in all_contacts:
+            contact.setdefault(LOCATION_COLUMN, location_id)
+
+    write_json_array(files['raw'], all_contacts)
 
-    with open('./ghl_scripts/data/clean-ghl-contacts.json', 'w') as f:
-        json.dump([clean_contact_data(contact) for contact in all_contacts], f, indent=4)
+    # Each contact is cleaned once; a full fetch upserts the same records it writes
+    contacts = [GhlContact(contact) for contact in all_contacts]
+    write_ghl_contacts(GhlContact.columns(contacts), files['clean'], location_id=location_id)
+    changed = contacts if full else [GhlContact(contact) for contact in changed_contacts]
+    # The store holds every location, so a full fetch replaces only this location's contacts
+    upsert_ghl_contacts((contact.as_dict() for contact in changed), replace_all=full, location_id=location_id)
 
+    save_sync_state(files['sync_state'], update_sync_state(state, changed_contacts, 'dateUpdated', full))
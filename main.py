@@ -1,75 +1,109 @@
-import json
-import pandas as pd
+import argparse
+import os
+import sys
+import tempfile
+from itertools import repeat
+from typing import TYPE_CHECKING
 
-from zcrm_scripts.zcrm_records_retriever import zcrm_get_latest
-from ghl_scripts.ghl_contacts_retriever import retrieve_contacts
+# The pipeline modules are imported by the functions that use them, so that importing
+# this module and fetching never load pandas, numpy or pyarrow before they are needed
+from shared_scripts.json_records import iter_json_array
+from shared_scripts.run_metrics import start_run
 
-# Retrieve the latest Zoho CRM and GHL data and save to files.
-zcrm = zcrm_get_latest()
-ghl = retrieve_contacts()
+if TYPE_CHECKING:
+    import pandas as pd
 
-# Load data from JSON files
-def load_data(file_path):
-    """Load data from a JSON file"""
-    return pd.read_json(file_path)
+GHL_CONTACTS_FILE = "./ghl_scripts/data/clean-ghl-contacts.parquet"
+GHL_RAW_CONTACTS_FILE = "./ghl_scripts/data/raw-ghl-contacts.json"
+# Locations fetched by ID each have a 'locationId=ID' partition here, with their own clean contacts file
+GHL_LOCATIONS_DIR = "./ghl_scripts/data/locations/"
+ZCRM_LEADS_FILE = "./zcrm_scripts/data/clean-zcrm-leads.parquet"
+ZCRM_DEALS_FILE = "./zcrm_scripts/data/clean-zcrm-deals.parquet"
+ZCRM_RAW_LEADS_FILE = "./zcrm_scripts/data/raw-zcrm-leads.json"
+# The raw deals, stored in the same order as the cleaned ones, give the deals their Zoho CRM IDs
+ZCRM_RAW_DEALS_FILE = "./zcrm_scripts/data/raw-zcrm-deals.json"
+# Contacts per chunk when ranking straight from the GHL API without a chunk size
+LIVE_CHUNK_SIZE = 1000
+CAMPAIGN_ROLLUP_FILE = "campaign_rollup.csv"
+CAMPAIGN_TRENDS_FILE = "campaign_trends.csv"
+# Archived snapshots cleaned, joined and ranked together when backfilling
+BACKFILL_BATCH_SIZE = 30
+# Key columns prefixed with the snapshot number when ranking snapshots together, so rows only match within a snapshot
+SNAPSHOT_KEY_COLUMNS = ['email_ghlc', 'phone_ghlc', 'contactName_ghlc', 'email_zl', 'email_zd', 'phone_zd', 'contactName_zd']
+# GHL contact fields that clean_contact_data needs and contact webhooks may leave out
+WEBHOOK_CONTACT_FIELDS = ['contactName', 'firstName', 'lastName', 'companyName', 'email', 'phone', 'source',
+                          'dateAdded', 'dateUpdated']
+
+# Record stage timings and HTTP totals for the run report
+metrics = start_run()
+# The read-only data a parallel ranking worker process was started with
+worker_state = None
+
+# Load data from Parquet or JSON files
+def load_data(file_path, columns=None):
+    """Load data from a Parquet file, reading only the given columns, or from a JSON file"""
+    import pandas as pd
+    from pipeline_scripts.columnar_store import read_frame
+    if file_path.endswith('.parquet'):
+        return read_frame(file_path, columns)
+    return pd.read_json(file_path, dtype=False)
 
 
 # Clean GHL contacts data
-def clean_ghl_contacts(data):
-    """Clean GHL contacts data"""
+def clean_ghl_contacts(data, custom_field_columns=None, attribution_columns=None):
+    """
+    Clean GHL contacts data.
+
+    Args:
+        data (pd.DataFrame): The stored contacts.
+        custom_field_columns (dict): Custom field ID -> column, defaults to CUSTOM_FIELD_COLUMNS.
+        attribution_columns (list): The attribution columns to flatten the attributions into, if they are
+            not flattened yet; defaults to the columns these contacts have.
+
+    Returns:
+        pd.DataFrame: The cleaned contacts, in compact dtypes.
+    """
+    from pipeline_scripts.columnar_store import GHL_CONTACT_SCHEMA
+    from pipeline_scripts.field_extraction import extract_contact_fields
+    from pipeline_scripts.frame_schema import AUTO, GHL_CONTACT_DTYPES, compact_frame
+    from pipeline_scripts.normalization import normalize_emails, normalize_names, normalize_phones
+    from pipeline_scripts.ranking import EXCLUDED_SOURCES
     data.drop(['id', 'firstName', 'lastName', 'city', 'state', 'postalCode', 'address1', 'dateAdded', 'dateUpdated', 'country'], axis=1, inplace=True)
     
+    # Take out the attributions and custom fields, unless already flattened when stored
+    if 'customFields' in data:
+        flattened = extract_contact_fields(data, custom_field_columns, attribution_columns)
+        data.drop(['attributions', 'customFields'], axis=1, inplace=True)
+    else:
+        flattened = data.drop(columns=GHL_CONTACT_SCHEMA.names, errors='ignore')
+        data.drop(flattened.columns, axis=1, inplace=True)
+
     # Standardize values for matching
-    data['email_ghlc'] = data['email'].astype(str).str.lower()
-    data['phone_ghlc'] = data['phone'].astype(str).str.lower().str.replace('61', '0').str.replace(' ', '').str.replace('.0', '')
-    data['contactName_ghlc'] = data['contactName'].astype(str).str.lower()
-    
-    # Extract 'attributions' data
-    for attribution in data['attributions'].iloc[0].keys():
-        for key in data['attributions'].iloc[0][attribution].keys():
-            new_column_name = f"{attribution}_{key}"
-            data[new_column_name] = data['attributions'].apply(lambda row: row.get(attribution, {}).get(key, None))
+    data['email_ghlc'] = normalize_emails(data['email'])
+    data['phone_ghlc'] = normalize_phones(data['phone'])
+    data['contactName_ghlc'] = normalize_names(data['contactName'])
     
-    # Extract custom fields values
-    business_in_au_field_id = "rXRaOb44Zgb853REc5Wo"
-    handset_count_field_id = "vq0Esn3nuJ2jknUuvjhU"
-    ad_name_field_id = "WY19sqzAA5ApOI573VVl"
-    ph_verified_field_id = "zAKDOxzWoIGAX7Nadsqk"
-    qualified_field_id = "uV1tzJy3WNtlIw8UIdYP"
-    
-    def extract_value(row, id):
-        custom_fields = row.get('customFields', [])
-        for field in custom_fields:
-            if field['id'] == id:
-                value = field['value']
-                if isinstance(value, list):
-                    return value[0]
-                return value
-        return None
-    
-    data['Business_in_AU'] = data.apply(lambda row: extract_value(row, business_in_au_field_id), axis=1)
-    data['Handset_Count'] = data.apply(lambda row: extract_value(row, handset_count_field_id), axis=1)
-    data['Ad_Name'] = data.apply(lambda row: extract_value(row, ad_name_field_id), axis=1)
-    data['Ph_verified'] = data.apply(lambda row: extract_value(row, ph_verified_field_id), axis=1)
-    data['Qualified'] = data.apply(lambda row: extract_value(row, qualified_field_id), axis=1)
-    
-    data.drop(['attributions', 'customFields'], axis=1, inplace=True)
+    # Add the 'attributions' and custom fields values
+    data = data.join(flattened)
 
-    # drop any rows that have a source of 'b4b - no txt conf form' or 'B4B Website Survey'
-    data = data[~((data['source'] == 'b4b - no txt conf form') | (data['source'] == 'B4B Website Survey') | (data['source'] == 'bestforbusiness'))]
-    
-    return data
+    # drop any rows that have a source of 'b4b - no txt conf form', 'B4B Website Survey' or 'bestforbusiness'
+    data = data[~data['source'].isin(EXCLUDED_SOURCES)]
+
+    # Store enumerations, flags and tags compactly; the attribution columns are categories when they repeat
+    return compact_frame(data, GHL_CONTACT_DTYPES, other=AUTO)
 
 
 # Clean ZCRM leads
 def clean_zcrm_leads(data):
     """Clean ZCRM leads data"""
+    from pipeline_scripts.frame_schema import ZCRM_LEAD_DTYPES, compact_frame
+    from pipeline_scripts.normalization import normalize_emails, normalize_names, normalize_phones
     
     # Standardize values for matching
-    data['email_zl'] = data['Email'].astype(str).str.lower()
+    data['email_zl'] = normalize_emails(data['Email'])
     data.drop('Email', axis=1, inplace=True)
-    data['phone_zl'] = data['Phone'].astype(str).str.lower().str.replace('+61', '0').str.replace(' ', '')
-    data['contactName_zl'] = data['Full_Name'].astype(str).str.lower()
+    data['phone_zl'] = normalize_phones(data['Phone'])
+    data['contactName_zl'] = normalize_names(data['Full_Name'])
 
     # Drop unused columns
     data.drop(
@@ -81,131 +115,968 @@ def clean_zcrm_leads(data):
         axis=1, inplace=True
     )
     
-    return data
+    return compact_frame(data, ZCRM_LEAD_DTYPES)
 
 
 # Clean ZCRM deal data
 def clean_zcrm_deals(data):
     """Clean ZCRM deals data"""
+    from pipeline_scripts.frame_schema import ZCRM_DEAL_DTYPES, compact_frame
+    from pipeline_scripts.normalization import normalize_emails, normalize_names, normalize_phones
     data.drop(['Checked_Signed_off', 'Created_Time', 'Agreement_Approved', 'Solution_delivered', 'Accepted_by_Provisioning', 'SAF_Sent', 'Agreement_Returned_On', 'Proposal_Sent', 'Lead_Source'], axis=1, inplace=True)
     
     # Standardize values for matching
-    data['email_zd'] = data['Generic_Email'].astype(str).str.lower()
-    data['phone_zd'] = data['Emergency_Forward_No'].astype(str).str.lower().str.replace('+61', '0').str.replace(' ', '')
+    data['email_zd'] = normalize_emails(data['Generic_Email'])
+    data['phone_zd'] = normalize_phones(data['Emergency_Forward_No'])
     data.drop(['Generic_Email', 'Emergency_Forward_No'], axis=1, inplace=True)
     
-    data['contactName_zd'] = data['Contact_Name'].apply(lambda x: x['name']).astype(str).str.lower()
+    data['contactName_zd'] = normalize_names(data['Contact_Name'].apply(lambda x: x['name'] if isinstance(x, dict) else None))
     data.drop('Contact_Name', axis=1, inplace=True)
     
-    return data
+    return compact_frame(data, ZCRM_DEAL_DTYPES)
 
 
 # Join data
-def join_data(ghl_contacts, zcrm_leads, zcrm_deals):
-    """Join GHL contacts, ZCRM leads, and ZCRM deals data"""
+def join_data(ghl_contacts, zcrm_leads, zcrm_deals, deal_columns=None, deal_index=None, fuzzy_matcher=None):
+    """
+    Join GHL contacts, ZCRM leads, and ZCRM deals data.
+
+    Args:
+        ghl_contacts (pd.DataFrame): The cleaned contacts.
+        zcrm_leads (pd.DataFrame): The cleaned leads.
+        zcrm_deals (pd.DataFrame): The cleaned deals.
+        deal_columns (list): The deal columns to copy onto matched contacts, defaults to DEFAULT_DEAL_COLUMNS.
+        deal_index (DealIndex): A prebuilt index over zcrm_deals, built here if not given.
+        fuzzy_matcher (FuzzyDealMatcher): Matches the contacts the exact keys miss, if given.
+
+    Returns:
+        pd.DataFrame: The contacts with their lead and deal columns and match confidence.
+    """
+    import numpy as np
+    from pipeline_scripts.deal_matching import DEFAULT_DEAL_COLUMNS, DealIndex
+    # Contacts and leads without an email have no key to join on
+    zcrm_leads = zcrm_leads[zcrm_leads['email_zl'].notna()]
     result = ghl_contacts.merge(zcrm_leads, how='left', left_on='email_ghlc', right_on='email_zl', suffixes=('_ghlc', '_zl'))
     
-    # Match ZCRM deals to GHL contacts
-    for index, row in result.iterrows():
-        match = False
-        for key, value in row[['contactName_ghlc', 'email_ghlc', 'phone_ghlc']].items():
-            matching_row = zcrm_deals[zcrm_deals[key.replace('_ghlc', '_zd')] == value]
-            if not matching_row.empty:
-                match = True
-                result.at[index, 'Amount'] = matching_row['Amount'].values[0]
-                result.at[index, 'Stage'] = matching_row['Stage'].values[0]
-                # Add as many fields as you need
-                break
-        if not match:
-            result.at[index, 'Deal_ID'] = None
-            result.at[index, 'Deal_Owner'] = None
+    # Match ZCRM deals to GHL contacts on name, then email, then phone
+    deal_columns = list(deal_columns or DEFAULT_DEAL_COLUMNS)
+    deal_index = deal_index or DealIndex(zcrm_deals)
+    positions = deal_index.resolve(result)
+    confidence = np.where(positions >= 0, 1.0, np.nan)
+    if fuzzy_matcher is not None:
+        positions, confidence = fuzzy_matcher.resolve(result, positions, confidence)
+    result[deal_columns] = deal_index.take(positions, deal_columns, result.index)
+    result['match_confidence'] = confidence
+    for column in ['Deal_ID', 'Deal_Owner']:
+        if column not in result:
+            result[column] = None
                 
     return result
 
 
-def assign_ranking(data: pd.DataFrame) -> pd.DataFrame:
-    """Assign ranking to the data"""
-    def assign_rank(row):
-        if (
-            row['tags'] is None or 'phone verified' not in row['tags']
-        ) and str(row['Amount']) == 'nan' and (
-            row['Ph_verified'] is None and row['Qualified'] is None
-        ):
-            return (1, 'Spammer')
-        else:
-            if row['Stage'] == "Deal Timed Out":
-                return (0, 'Unknown')
-            elif row['Handset_Count'] == "1-2":
-                if str(row['Amount']) != 'nan' and row['Stage'] != "Deal Timed Out":
-                    return (12, 'Sold and delivered')
-                if (row['Ph_verified'] == "True" or row['Qualified'] == "True") and str(row['Amount']) == 'nan':
-                    return (7, '1-2 line | responded | no sale')
-                if row['Ph_verified'] is None and row['Qualified'] is None:
-                    return (2, '1-2 line | no response')                
-            elif row['Handset_Count'] == "3-4":
-                if str(row['Amount']) != 'nan' and (row['Stage'] == "Checked & Signed Off" and row['Stage'] != "Deal Timed Out"):
-                    return (12, 'Sold and delivered')
-                if (row['Ph_verified'] == "True" or row['Qualified'] == "True") and str(row['Amount']) == 'nan':
-                    return (8, '3-4 line | responded | no sale')
-                if row['Ph_verified'] is None and row['Qualified'] is None:
-                    return (3, '3-4 line | no response')  
-            elif row['Handset_Count'] == "5-9":
-                if str(row['Amount']) != 'nan' and row['Stage'] != "Deal Timed Out":
-                    return (12, 'Sold and delivered')
-                if (row['Ph_verified'] == "True" or row['Qualified'] == "True") and str(row['Amount']) == 'nan':
-                    return (9, '5-9 line | responded | no sale')
-                if row['Ph_verified'] is None and row['Qualified'] is None:
-                    return (4, '5-9 line | no response')   
-            elif row['Handset_Count'] == "10-24":
-                if str(row['Amount']) != 'nan' and row['Stage'] != "Deal Timed Out":
-                    return (12, 'Sold and delivered')
-                if (row['Ph_verified'] == "True" or row['Qualified'] == "True") and str(row['Amount']) == 'nan':
-                    return (10, '10-24 line | responded | no sale')
-                if row['Ph_verified'] is None and row['Qualified'] is None:
-                    return (5, '10-24 line | no response')
-            elif row['Handset_Count'] == "25+":
-                if str(row['Amount']) != 'nan' and row['Stage'] != "Deal Timed Out":
-                    return (12, 'Sold and delivered')
-                if (row['Ph_verified'] == "True" or row['Qualified'] == "True") and str(row['Amount']) == 'nan':
-                    return (11, '25+ line | responded | no sale')
-                if row['Ph_verified'] is None and row['Qualified'] is None:
-                    return (6, '25+ line | no response')
-            else:
-                return (0, 'Unknown')
-    
-    result = data.copy()
-    result[['ranking', 'ranking_desc']] = result.apply(assign_rank, axis=1, result_type='expand')
-    return result
+def assign_ranking(data: 'pd.DataFrame', rules=None) -> 'pd.DataFrame':
+    """Assign ranking to the data in place, using the ranking rule table"""
+    from pipeline_scripts.ranking import rank_contacts
+    data['ranking'], data['ranking_desc'] = rank_contacts(data, rules)
+    return data
 
 
-if __name__ == '__main__':
-    # Load data
-    ghl_contacts = load_data("./ghl_scripts/data/clean-ghl-contacts.json")
-    zcrm_leads = load_data("./zcrm_scripts/data/clean-zcrm-leads.json")
-    zcrm_deals = load_data("./zcrm_scripts/data/clean-zcrm-deals.json")
-    
-    # Clean data
-    ghl_contacts_cleaned = clean_ghl_contacts(ghl_contacts)
-    zcrm_leads_cleaned = clean_zcrm_leads(zcrm_leads)
-    zcrm_deals_cleaned = clean_zcrm_deals(zcrm_deals)
-    
-    # Join data
-    result = join_data(ghl_contacts_cleaned, zcrm_leads_cleaned, zcrm_deals_cleaned)
-    
-    # Assign ranking
-    result = assign_ranking(result)
-    
-    # Save results to CSV
-    result.to_csv('detailed_results.csv', index=False)
-
+def condense_results(result: 'pd.DataFrame') -> 'pd.DataFrame':
+    """Drop spammer and unknown contacts and the columns only used for matching"""
     # Drop rows with a ranking of 1 (spammer) or 0 (unknown)
-    result = result[result['ranking'] != 1]
-    result = result[result['ranking'] != 0]
+    result = result[~result['ranking'].isin([0, 1])]
 
-    result.drop(
+    return result.drop(
         columns=['tags', 'Company', 'Lead_Number', 'Lead_Source', 'Lead_Status',
                  'phone_zl', 'email_ghlc', 'phone_ghlc', 'contactName_ghlc', 
                  'email_zl', 'contactName_zl', 'Deal_ID', 
                  'Deal_Owner', 
                  ]
-    ).to_csv('condensed_results.csv', index=False)
\ No newline at end of file
+    )
+
+
+def iter_contact_frames(contacts_path, chunk_size):
+    """
+    Read the stored GHL contacts in frames of at most chunk_size rows.
+
+    Args:
+        contacts_path (str): A Parquet file or a JSON array of contacts.
+        chunk_size (int): The most contacts per frame.
+
+    Returns:
+        iterator: The frames.
+    """
+    import pandas as pd
+    from pipeline_scripts.columnar_store import iter_frames
+    from pipeline_scripts.streaming import iter_chunks
+    if contacts_path.endswith('.parquet'):
+        return iter_frames(contacts_path, chunk_size)
+    return (pd.DataFrame(chunk) for chunk in iter_chunks(iter_json_array(contacts_path), chunk_size))
+
+
+def collect_stored_attribution_columns(contacts_path, chunk_size):
+    """
+    Collect the attribution columns of every stored GHL contact.
+
+    Args:
+        contacts_path (str): A Parquet file or a JSON array of contacts.
+        chunk_size (int): The contacts to read at a time.
+
+    Returns:
+        list: The columns, or None for Parquet, whose contacts are stored with their attributions flattened.
+    """
+    import pandas as pd
+    from pipeline_scripts.field_extraction import collect_attribution_columns
+    from pipeline_scripts.streaming import iter_chunks
+    if contacts_path.endswith('.parquet'):
+        return None
+    columns = {}
+    for chunk in iter_chunks(iter_json_array(contacts_path), chunk_size):
+        attributions = pd.DataFrame({'attributions': [contact.get('attributions') for contact in chunk]})
+        columns.update(dict.fromkeys(collect_attribution_columns(attributions)))
+    return list(columns)
+
+
+def build_fuzzy_matcher(zcrm_deals, fuzzy_threshold=None):
+    """Build the fuzzy deal matcher's blocking indexes, or return None if fuzzy matching is off"""
+    from pipeline_scripts.fuzzy_matching import FuzzyDealMatcher
+    if fuzzy_threshold is None:
+        return None
+    return metrics.call('build_fuzzy_matcher', FuzzyDealMatcher, zcrm_deals, threshold=fuzzy_threshold)
+
+
+def run_streaming(contact_chunks, zcrm_leads, zcrm_deals, detailed_path, condensed_path, fuzzy_threshold=None,
+                  collect_contributions=False, attribution_columns=None):
+    """
+    Clean, join and rank GHL contacts chunk by chunk, appending the results to CSV.
+
+    Args:
+        contact_chunks (iterable): The contacts, as frames.
+        zcrm_leads (pd.DataFrame): The cleaned leads.
+        zcrm_deals (pd.DataFrame): The cleaned deals.
+        detailed_path (str): The detailed results CSV file.
+        condensed_path (str): The condensed results CSV file.
+        fuzzy_threshold (float): The fuzzy deal match threshold, None to match exactly only.
+        collect_contributions (bool): Whether to return the contacts' campaign contributions.
+        attribution_columns (list): The attribution columns of all contacts, so every chunk gets the same
+            columns; each chunk gets its own if not given.
+
+    Returns:
+        pd.DataFrame: The campaign contributions, or None if not asked for.
+    """
+    import pandas as pd
+    from pipeline_scripts.campaign_rollup import campaign_contributions
+    from pipeline_scripts.deal_matching import DealIndex
+    from pipeline_scripts.streaming import CsvAppender
+    deal_index = metrics.call('build_deal_index', DealIndex, zcrm_deals)
+    fuzzy_matcher = build_fuzzy_matcher(zcrm_deals, fuzzy_threshold)
+    detailed = CsvAppender(detailed_path)
+    condensed = CsvAppender(condensed_path)
+    contributions = []
+
+    for chunk in contact_chunks:
+        cleaned = metrics.call('clean_ghl_contacts', clean_ghl_contacts, chunk, attribution_columns=attribution_columns)
+        result = metrics.call('join_data', join_data, cleaned, zcrm_leads, zcrm_deals, deal_index=deal_index,
+                                fuzzy_matcher=fuzzy_matcher)
+        result = metrics.call('assign_ranking', assign_ranking, result)
+        # Keep the ranking format the same across chunks, whether or not a chunk has unranked contacts
+        result['ranking'] = result['ranking'].astype(float)
+
+        metrics.call('write_detailed_csv', detailed.append, result)
+        metrics.call('write_condensed_csv', condensed.append, metrics.call('condense_results', condense_results, result))
+        if collect_contributions:
+            contributions.append(metrics.call('campaign_contributions', campaign_contributions, result))
+
+    return pd.concat(contributions, ignore_index=True) if contributions else None
+
+
+def start_rank_worker(state):
+    """Keep the data shared by the parent process for the partitions this worker ranks"""
+    global worker_state
+    worker_state = state
+
+
+def rank_partition(number, partition, output_dir, float_ranking=False):
+    """
+    Clean, join and rank one partition of the GHL contacts in a worker process.
+
+    Args:
+        number (int): The partition number; only partition 0 writes the CSV headers.
+        partition: The partition's contacts, or its (start, stop) rows of the inherited contacts.
+        output_dir (str): The directory to write the CSV part files to.
+        float_ranking (bool): Whether to write the rankings as decimals.
+
+    Returns:
+        dict: The part files, result columns, ranking format, contributions and stage metrics.
+    """
+    import pandas as pd
+    from pipeline_scripts.campaign_rollup import campaign_contributions
+    # Each partition's stages are recorded in a run of its own and added to the parent's run
+    global metrics
+    metrics = start_run(trace_memory=worker_state['trace_memory'])
+
+    if not isinstance(partition, pd.DataFrame):
+        start, stop = partition
+        # Cleaning drops and replaces columns without writing to them, so the partition
+        # can share the inherited contacts' data rather than copy it
+        partition = worker_state['contacts'].iloc[start:stop].copy(deep=False)
+    cleaned = metrics.call('clean_ghl_contacts', clean_ghl_contacts, partition,
+                           attribution_columns=worker_state['attribution_columns'])
+    result = metrics.call('join_data', join_data, cleaned, worker_state['zcrm_leads'], worker_state['zcrm_deals'],
+                          deal_index=worker_state['deal_index'], fuzzy_matcher=worker_state['fuzzy_matcher'])
+    result = metrics.call('assign_ranking', assign_ranking, result)
+    unranked = bool(result['ranking'].isna().any())
+    if float_ranking:
+        result['ranking'] = result['ranking'].astype(float)
+
+    # Only the first part carries the CSV headers
+    detailed_part = os.path.join(output_dir, f"detailed-{number}.csv")
+    condensed_part = os.path.join(output_dir, f"condensed-{number}.csv")
+    with metrics.stage('write_detailed_csv', len(result)):
+        result.to_csv(detailed_part, index=False, header=number == 0)
+    condensed = metrics.call('condense_results', condense_results, result)
+    with metrics.stage('write_condensed_csv', len(condensed)):
+        condensed.to_csv(condensed_part, index=False, header=number == 0)
+    contributions = None
+    if worker_state['collect_contributions']:
+        contributions = metrics.call('campaign_contributions', campaign_contributions, result)
+
+    return {
+        'columns': list(result.columns),
+        'unranked': unranked,
+        'float_ranking': result['ranking'].dtype.kind == 'f',
+        'detailed': detailed_part,
+        'condensed': condensed_part,
+        'contributions': contributions,
+        'stages': metrics.report()['stages'],
+    }
+
+
+def run_parallel(ghl_contacts, zcrm_leads, zcrm_deals, detailed_path, condensed_path, workers, partition_size=None,
+                 fuzzy_threshold=None, collect_contributions=False):
+    """
+    Clean, join and rank partitions of the GHL contacts in worker processes.
+
+    The partitions' results are joined in order, into the same files a serial run writes.
+
+    Args:
+        ghl_contacts (pd.DataFrame): The stored contacts.
+        zcrm_leads (pd.DataFrame): The cleaned leads.
+        zcrm_deals (pd.DataFrame): The cleaned deals.
+        detailed_path (str): The detailed results CSV file.
+        condensed_path (str): The condensed results CSV file.
+        workers (int): The number of worker processes.
+        partition_size (int): The contacts per partition, defaults to an even split between the workers.
+        fuzzy_threshold (float): The fuzzy deal match threshold, None to match exactly only.
+        collect_contributions (bool): Whether to return the contacts' campaign contributions.
+
+    Returns:
+        pd.DataFrame: The campaign contributions, or None if not asked for.
+    """
+    import pandas as pd
+    from pipeline_scripts.deal_matching import DealIndex
+    from pipeline_scripts.field_extraction import collect_attribution_columns
+    from pipeline_scripts.parallel import concatenate_files, partition_bounds, process_pool, shares_memory
+    state = {
+        # Forked workers read their partitions from the inherited contacts; others are sent them
+        'contacts': ghl_contacts if shares_memory() else None,
+        # Every partition gets the attribution columns the whole frame would
+        'attribution_columns': collect_attribution_columns(ghl_contacts) if 'customFields' in ghl_contacts else None,
+        'zcrm_leads': zcrm_leads,
+        'zcrm_deals': zcrm_deals,
+        'deal_index': metrics.call('build_deal_index', DealIndex, zcrm_deals),
+        'fuzzy_matcher': build_fuzzy_matcher(zcrm_deals, fuzzy_threshold),
+        'trace_memory': metrics.trace_memory,
+        'collect_contributions': collect_contributions,
+    }
+    partitions = partition_bounds(len(ghl_contacts), workers, partition_size)
+    if state['contacts'] is None:
+        partitions = [ghl_contacts.iloc[start:stop] for start, stop in partitions]
+
+    output_dir = os.path.dirname(os.path.abspath(detailed_path))
+    with tempfile.TemporaryDirectory(dir=output_dir) as parts_dir:
+        with metrics.stage('rank_partitions', len(ghl_contacts)) as run, \
+                process_pool(workers, start_rank_worker, (state,)) as pool:
+            numbers = range(len(partitions))
+            parts = list(pool.map(rank_partition, numbers, partitions, repeat(parts_dir)))
+            # A serial run writes whole-number rankings only if every contact is ranked,
+            # so partitions that were all ranked are written again with decimal rankings
+            if any(part['unranked'] for part in parts):
+                redo = [number for number in numbers if not parts[number]['float_ranking']]
+                redone = pool.map(rank_partition, redo, [partitions[number] for number in redo],
+                                  repeat(parts_dir), repeat(True))
+                for number, part in zip(redo, redone):
+                    parts[number] = part
+            run.rows_out = sum(part['stages']['assign_ranking']['rows_out'] for part in parts)
+
+        if any(part['columns'] != parts[0]['columns'] for part in parts):
+            raise Exception("Partitions produced different result columns")
+        for part in parts:
+            metrics.add_stages(part['stages'])
+
+        with metrics.stage('join_partitions'):
+            concatenate_files([part['detailed'] for part in parts], detailed_path)
+            concatenate_files([part['condensed'] for part in parts], condensed_path)
+
+    if collect_contributions:
+        return pd.concat([part['contributions'] for part in parts], ignore_index=True)
+    return None
+
+
+def cached(cache, name, key, compute):
+    """Return a stage's output from the stage cache, or compute it and cache it, if given a cache"""
+    if cache is None:
+        return compute()
+    with metrics.stage(f'{name}_cache_read') as run:
+        value = cache.get(key)
+        if value is not None:
+            run.rows_out = len(value)
+    if value is None:
+        value = compute()
+        with metrics.stage(f'{name}_cache_write', len(value)):
+            cache.put(key, value)
+    return value
+
+
+def stage_cache_key(cache, name, input_files, code, settings=None):
+    """
+    Build a stage's cache key, or return None without a cache.
+
+    Args:
+        cache (StageCache): The stage cache, or None.
+        name (str): The stage name.
+        input_files (list): The files the stage reads.
+        code (list): The functions and modules the stage depends on, besides the loading and cleaning code.
+        settings: The stage's other inputs.
+
+    Returns:
+        str: The key.
+    """
+    from pipeline_scripts import columnar_store, frame_schema, normalization
+    from pipeline_scripts.stage_cache import code_version
+    if cache is None:
+        return None
+    return cache.key(name, input_files, code_version(load_data, columnar_store, normalization, frame_schema, *code), settings)
+
+
+def load_zcrm_data(leads_path, deals_path, cache=None):
+    """Load and clean the stored ZCRM leads and deals, or read them from the stage cache"""
+    zcrm_leads_cleaned = cached(
+        cache, 'clean_zcrm_leads', stage_cache_key(cache, 'clean_zcrm_leads', [leads_path], [clean_zcrm_leads]),
+        lambda: metrics.call('clean_zcrm_leads', clean_zcrm_leads, metrics.call('load_zcrm_leads', load_data, leads_path)))
+    zcrm_deals_cleaned = cached(
+        cache, 'clean_zcrm_deals', stage_cache_key(cache, 'clean_zcrm_deals', [deals_path], [clean_zcrm_deals]),
+        lambda: metrics.call('clean_zcrm_deals', clean_zcrm_deals, metrics.call('load_zcrm_deals', load_data, deals_path)))
+    return zcrm_leads_cleaned, zcrm_deals_cleaned
+
+
+def load_joined_data(contacts_path, leads_path, deals_path, fuzzy_threshold=None, cache=None):
+    """Load, clean and join the stored data, reusing cached stage outputs"""
+    from pipeline_scripts import field_extraction
+    from pipeline_scripts.ranking import EXCLUDED_SOURCES
+    zcrm_leads_cleaned, zcrm_deals_cleaned = load_zcrm_data(leads_path, deals_path, cache)
+    ghl_contacts_cleaned = cached(
+        cache, 'clean_ghl_contacts',
+        stage_cache_key(cache, 'clean_ghl_contacts', [contacts_path], [clean_ghl_contacts, field_extraction],
+                        EXCLUDED_SOURCES),
+        lambda: metrics.call('clean_ghl_contacts', clean_ghl_contacts,
+                             metrics.call('load_ghl_contacts', load_data, contacts_path)))
+
+    fuzzy_matcher = build_fuzzy_matcher(zcrm_deals_cleaned, fuzzy_threshold)
+    return metrics.call('join_data', join_data, ghl_contacts_cleaned, zcrm_leads_cleaned, zcrm_deals_cleaned,
+                        fuzzy_matcher=fuzzy_matcher)
+
+
+def rank_stored(contacts_path, leads_path, deals_path, detailed_path, condensed_path, fuzzy_threshold=None, cache=None,
+                collect_contributions=False):
+    """
+    Load, clean, join and rank the stored data in one pass and save the results.
+
+    Args:
+        contacts_path (str): The stored GHL contacts.
+        leads_path (str): The stored ZCRM leads.
+        deals_path (str): The stored ZCRM deals.
+        detailed_path (str): The detailed results CSV file.
+        condensed_path (str): The condensed results CSV file.
+        fuzzy_threshold (float): The fuzzy deal match threshold, None to match exactly only.
+        cache (StageCache): The stage cache, or None.
+        collect_contributions (bool): Whether to return the contacts' campaign contributions.
+
+    Returns:
+        pd.DataFrame: The campaign contributions, or None if not asked for.
+    """
+    from pipeline_scripts import deal_matching, field_extraction, fuzzy_matching
+    from pipeline_scripts.campaign_rollup import campaign_contributions
+    from pipeline_scripts.ranking import EXCLUDED_SOURCES
+    # Unchanged data skips straight to ranking
+    join_key = stage_cache_key(
+        cache, 'join_data', [contacts_path, leads_path, deals_path],
+        [clean_ghl_contacts, field_extraction, clean_zcrm_leads, clean_zcrm_deals, join_data, deal_matching,
+         fuzzy_matching],
+        (EXCLUDED_SOURCES, fuzzy_threshold))
+    result = cached(cache, 'join_data', join_key,
+                    lambda: load_joined_data(contacts_path, leads_path, deals_path, fuzzy_threshold, cache))
+
+    # Assign ranking
+    result = metrics.call('assign_ranking', assign_ranking, result)
+
+    # Save results to CSV
+    with metrics.stage('write_detailed_csv', len(result)):
+        result.to_csv(detailed_path, index=False)
+    condensed = metrics.call('condense_results', condense_results, result)
+    with metrics.stage('write_condensed_csv', len(condensed)):
+        condensed.to_csv(condensed_path, index=False)
+
+    if collect_contributions:
+        return metrics.call('campaign_contributions', campaign_contributions, result)
+    return None
+
+
+def update_rollup(rollup, contributions, rollup_path):
+    """Apply changed campaign contributions to the rollup, save it and write its report"""
+    changed = metrics.call('update_rollup', rollup.update, contributions)
+    print(f"Campaign rollup updated from {changed} changed contributions")
+    report = metrics.call('report_rollup', rollup.report)
+    with metrics.stage('write_rollup_csv', len(report)):
+        report.to_csv(rollup_path, index=False)
+    with metrics.stage('save_rollup'):
+        rollup.save()
+
+
+def run_pipeline(contacts_path, leads_path, deals_path, detailed_path, condensed_path, chunk_size=None, live=False,
+                 fuzzy_threshold=None, workers=None, cache=None, rollup=None, rollup_path=CAMPAIGN_ROLLUP_FILE):
+    """
+    Load, clean, join and rank the stored data and save the results.
+
+    Args:
+        contacts_path (str): The stored GHL contacts.
+        leads_path (str): The stored ZCRM leads.
+        deals_path (str): The stored ZCRM deals.
+        detailed_path (str): The detailed results CSV file.
+        condensed_path (str): The condensed results CSV file.
+        chunk_size (int): Stream the contacts in chunks of this many rows, or with workers, rank partitions
+            of this many rows.
+        live (bool): Stream the contacts straight from the GHL API instead of contacts_path.
+        fuzzy_threshold (float): The fuzzy deal match threshold, None to match exactly only.
+        workers (int): Rank in this many worker processes if more than one.
+        cache (StageCache): Reuse unchanged stage outputs from this cache, if given.
+        rollup (CampaignRollup): Update this campaign rollup, if given.
+        rollup_path (str): The CSV file to write the rollup's report to.
+    """
+    import pandas as pd
+
+    if live:
+        zcrm_leads_cleaned, zcrm_deals_cleaned = load_zcrm_data(leads_path, deals_path, cache)
+        # Imported here because it brings in the HTTP client and the GHL tokens
+        from ghl_scripts.ghl_contacts_retriever import stream_clean_contacts
+        from shared_scripts.http_session import create_session
+        with create_session(provider='ghl') as session:
+            contact_chunks = (pd.DataFrame(chunk) for chunk in stream_clean_contacts(chunk_size or LIVE_CHUNK_SIZE, session))
+            contributions = run_streaming(contact_chunks, zcrm_leads_cleaned, zcrm_deals_cleaned, detailed_path,
+                                          condensed_path, fuzzy_threshold, rollup is not None)
+    elif workers and workers > 1:
+        zcrm_leads_cleaned, zcrm_deals_cleaned = load_zcrm_data(leads_path, deals_path, cache)
+        ghl_contacts = metrics.call('load_ghl_contacts', load_data, contacts_path)
+        contributions = run_parallel(ghl_contacts, zcrm_leads_cleaned, zcrm_deals_cleaned, detailed_path,
+                                     condensed_path, workers, chunk_size, fuzzy_threshold, rollup is not None)
+    elif chunk_size:
+        zcrm_leads_cleaned, zcrm_deals_cleaned = load_zcrm_data(leads_path, deals_path, cache)
+        attribution_columns = metrics.call('collect_attribution_columns', collect_stored_attribution_columns,
+                                           contacts_path, chunk_size)
+        contributions = run_streaming(iter_contact_frames(contacts_path, chunk_size), zcrm_leads_cleaned, zcrm_deals_cleaned,
+                                      detailed_path, condensed_path, fuzzy_threshold, rollup is not None,
+                                      attribution_columns)
+    else:
+        contributions = rank_stored(contacts_path, leads_path, deals_path, detailed_path, condensed_path,
+                                    fuzzy_threshold, cache, rollup is not None)
+
+    if rollup is not None and contributions is not None:
+        update_rollup(rollup, contributions, rollup_path)
+
+
+def clean_contact_events(contacts):
+    """Clean GHL contacts received from webhooks, keeping their IDs"""
+    import pandas as pd
+    from pipeline_scripts.live_ranking import CONTACT_ID
+    # Imported here because it brings in the HTTP client and the GHL tokens
+    from ghl_scripts.ghl_contacts_retriever import clean_contact_data
+    records = [clean_contact_data({**dict.fromkeys(WEBHOOK_CONTACT_FIELDS), 'contactName': contact.get('name'), **contact})
+               for contact in contacts]
+    data = pd.DataFrame(records)
+    data[CONTACT_ID] = data['id']
+    return clean_ghl_contacts(data)
+
+
+def clean_deal_events(deals):
+    """Clean Zoho CRM deals received from webhooks, in the shape the API returns"""
+    import pandas as pd
+    from zcrm_scripts.zcrm_records_retriever import DEAL_FIELDS
+    return clean_zcrm_deals(pd.DataFrame(deals, columns=DEAL_FIELDS))
+
+
+def load_deal_ids(raw_deals_path, count):
+    """
+    Read the Zoho CRM ID of each stored deal from the raw deals.
+
+    Args:
+        raw_deals_path (str): The raw deals, stored in the same order as the cleaned ones.
+        count (int): The number of cleaned deals.
+
+    Returns:
+        list: The IDs, or None if there are no raw deals or they do not line up with the cleaned deals.
+    """
+    if not raw_deals_path or not os.path.exists(raw_deals_path):
+        return None
+    deal_ids = [record.get('id') for record in iter_json_array(raw_deals_path)]
+    if len(deal_ids) != count:
+        print(f"Ignoring {raw_deals_path}: it has {len(deal_ids)} deals and the cleaned deals {count}")
+        return None
+    return deal_ids
+
+
+def build_live_ranker(contacts_path, leads_path, deals_path, raw_deals_path=None, cache=None):
+    """Rank the stored data and keep it in memory, to be re-ranked from webhooks"""
+    from pipeline_scripts.deal_matching import LiveDealIndex
+    from pipeline_scripts.live_ranking import CONTACT_ID, LiveRanker
+    zcrm_leads_cleaned, zcrm_deals_cleaned = load_zcrm_data(leads_path, deals_path, cache)
+    ghl_contacts = metrics.call('load_ghl_contacts', load_data, contacts_path)
+    ghl_contacts[CONTACT_ID] = ghl_contacts['id']
+    ghl_contacts_cleaned = metrics.call('clean_ghl_contacts', clean_ghl_contacts, ghl_contacts)
+    result = metrics.call('join_data', join_data, ghl_contacts_cleaned, zcrm_leads_cleaned, zcrm_deals_cleaned)
+    result = metrics.call('assign_ranking', assign_ranking, result)
+    deal_ids = load_deal_ids(raw_deals_path, len(zcrm_deals_cleaned))
+    if deal_ids is None:
+        print("The stored deals have no Zoho CRM IDs, so deal webhooks can only add deals")
+    deal_index = metrics.call('build_live_deal_index', LiveDealIndex, zcrm_deals_cleaned, deal_ids)
+
+    def rank(contacts, index):
+        return assign_ranking(join_data(contacts, zcrm_leads_cleaned, zcrm_deals_cleaned, deal_index=index))
+
+    return LiveRanker(ghl_contacts_cleaned, result, deal_index, clean_contact_events, clean_deal_events, rank)
+
+
+def serve(host, port, cache=None):
+    """Rank the stored data, then serve webhook re-ranking and rank queries until interrupted"""
+    from pipeline_scripts.ranking_service import RankingServer
+    ranker = build_live_ranker(GHL_CONTACTS_FILE, ZCRM_LEADS_FILE, ZCRM_DEALS_FILE, ZCRM_RAW_DEALS_FILE, cache)
+    server = RankingServer(ranker, (host, port))
+    print(f"Serving rankings at {server.root_url}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def fetch(incremental=True, zcrm_only=False, locations=None):
+    """
+    Retrieve the changes since the last run and save them to files.
+
+    Args:
+        incremental (bool): Fetch only the records changed since the last run.
+        zcrm_only (bool): Fetch only the Zoho CRM leads and deals.
+        locations (list): GHL locations to fetch in parallel, each into its own partition, instead of
+            GHL_B4B_LOCATION.
+    """
+    # Imported here so that ranking from stored data never loads the HTTP clients or exchanges API tokens
+    with metrics.stage('fetch'):
+        if zcrm_only:
+            from shared_scripts.http_session import create_session
+            from zcrm_scripts.zcrm_records_retriever import zcrm_get_latest
+            with create_session(provider='zcrm') as session:
+                zcrm_get_latest(session, incremental=incremental)
+        else:
+            from shared_scripts.async_fetch import fetch_latest_blocking
+            fetch_latest_blocking(incremental=incremental, locations=locations)
+
+
+def location_file(file_path, location_id):
+    """Name a result file or directory for one GHL location, e.g. detailed_results-ID.csv"""
+    root, extension = os.path.splitext(file_path.rstrip('/'))
+    return f"{root}-{location_id}{extension}"
+
+
+def rank_locations(locations, args, cache=None):
+    """Rank each GHL location's contacts into their own result files and rollup"""
+    from pipeline_scripts.campaign_rollup import CampaignRollup
+    from pipeline_scripts.parallel import available_cpus
+    for location_id in locations:
+        contacts_path = f"{GHL_LOCATIONS_DIR}locationId={location_id}/clean-ghl-contacts.parquet"
+        if not os.path.exists(contacts_path):
+            raise Exception(f"No contacts have been fetched for location {location_id}, run 'fetch --location {location_id}' first")
+        print(f"Ranking location {location_id}")
+        rollup = None if args.no_rollup else CampaignRollup(location_file(args.rollup_dir, location_id))
+        run_pipeline(contacts_path, ZCRM_LEADS_FILE, ZCRM_DEALS_FILE,
+                     location_file('detailed_results.csv', location_id), location_file('condensed_results.csv', location_id),
+                     args.chunk_size, fuzzy_threshold=args.fuzzy,
+                     workers=available_cpus() if args.workers == 0 else args.workers, cache=cache, rollup=rollup,
+                     rollup_path=location_file(CAMPAIGN_ROLLUP_FILE, location_id))
+
+
+def contacts_source(location_id=None):
+    """Name the snapshot archive source of a GHL location's raw contacts"""
+    return 'ghl_contacts' if location_id is None else f"ghl_contacts-{location_id}"
+
+
+def snapshot_sources(locations=None, zcrm_only=False):
+    """
+    Find the raw files a fetch stored.
+
+    Args:
+        locations (list): The GHL locations fetched, None for GHL_B4B_LOCATION.
+        zcrm_only (bool): Whether only Zoho CRM was fetched, so the GHL contacts are left out.
+
+    Returns:
+        dict: Archive source -> file, for the files that exist.
+    """
+    sources = {}
+    if not zcrm_only:
+        for location_id in locations or [None]:
+            sources[contacts_source(location_id)] = (
+                GHL_RAW_CONTACTS_FILE if location_id is None
+                else f"{GHL_LOCATIONS_DIR}locationId={location_id}/raw-ghl-contacts.json")
+    sources['zcrm_leads'] = ZCRM_RAW_LEADS_FILE
+    sources['zcrm_deals'] = ZCRM_RAW_DEALS_FILE
+    return {source: file_path for source, file_path in sources.items() if os.path.exists(file_path)}
+
+
+def archive_snapshot(archive, sources):
+    """Append the stored raw records that changed to the snapshot archive"""
+    with metrics.stage('archive_snapshot') as run:
+        entry = archive.append({source: iter_json_array(file_path) for source, file_path in sources.items()})
+        run.rows_out = sum(archived['changed'] + archived['removed'] for archived in entry['sources'].values())
+    changes = ', '.join(f"{source} {archived['changed']} changed and {archived['removed']} removed"
+                        for source, archived in entry['sources'].items())
+    print(f"Archived snapshot {entry['snapshot']}: {changes}")
+
+
+def clean_snapshot_records(states, source, to_table, clean):
+    """
+    Clean an archived source's records in several snapshot states at once.
+
+    Records unchanged between snapshots are cleaned once.
+
+    Args:
+        states (list): (archive entry, state) pairs.
+        source (str): The archive source.
+        to_table (callable): Converts a list of records to an Arrow table.
+        clean (callable): Cleans a frame of the records.
+
+    Returns:
+        tuple: The states' cleaned rows stacked, and each row's snapshot number.
+    """
+    import numpy as np
+    from pipeline_scripts.columnar_store import table_to_frame
+    # Records unchanged between snapshots are the same objects, so each version is cleaned once
+    versions, records, positions, snapshots = {}, [], [], []
+    for entry, state in states:
+        for record in state[source]:
+            position = versions.setdefault(id(record), len(records))
+            if position == len(records):
+                records.append(record)
+            positions.append(position)
+        snapshots.append(np.full(len(state[source]), entry['snapshot'], dtype=np.int64))
+    cleaned = clean(table_to_frame(to_table(records)))
+
+    # Rows the cleaning dropped, e.g. of excluded sources, are dropped from every snapshot
+    rows = cleaned.index.get_indexer(positions)
+    kept = rows >= 0
+    return cleaned.take(rows[kept]).reset_index(drop=True), np.concatenate(snapshots)[kept]
+
+
+def prefix_snapshot_keys(data, snapshots, width):
+    """Prefix the match key columns with each row's snapshot number, in place"""
+    import pandas as pd
+    prefixes = pd.Series(snapshots, index=data.index).astype(str).str.zfill(width).astype('string[pyarrow]') + '|'
+    for column in SNAPSHOT_KEY_COLUMNS:
+        if column in data:
+            data[column] = prefixes + data[column].astype('string[pyarrow]')
+
+
+def rank_snapshots(states, location_id=None):
+    """
+    Clean, join and rank several archived snapshot states in one pass.
+
+    Args:
+        states (list): (archive entry, state) pairs.
+        location_id (str): The GHL location, None for GHL_B4B_LOCATION.
+
+    Returns:
+        pd.DataFrame: The ranked contacts of every state, with their 'snapshot' number.
+    """
+    from pipeline_scripts.columnar_store import ghl_contacts_table, zcrm_records_table
+    # Imported here because they bring in the HTTP clients and the API tokens
+    from ghl_scripts.ghl_contacts_retriever import GhlContact
+    from zcrm_scripts.zcrm_records_retriever import DEAL_FIELDS, LEAD_FIELDS
+
+    source = contacts_source(location_id)
+    ghl_contacts, contact_snapshots = metrics.call(
+        'clean_ghl_contacts', clean_snapshot_records, states, source,
+        lambda records: ghl_contacts_table(GhlContact.columns([GhlContact(record) for record in records]),
+                                           location_id=location_id),
+        clean_ghl_contacts)
+    zcrm_leads, lead_snapshots = metrics.call(
+        'clean_zcrm_leads', clean_snapshot_records, states, 'zcrm_leads',
+        lambda records: zcrm_records_table(records, LEAD_FIELDS), clean_zcrm_leads)
+    zcrm_deals, deal_snapshots = metrics.call(
+        'clean_zcrm_deals', clean_snapshot_records, states, 'zcrm_deals',
+        lambda records: zcrm_records_table(records, DEAL_FIELDS), clean_zcrm_deals)
+
+    # Keys carry their snapshot, so one join matches each snapshot's contacts with its own leads and deals
+    width = len(str(max(entry['snapshot'] for entry, _ in states)))
+    prefix_snapshot_keys(ghl_contacts, contact_snapshots, width)
+    prefix_snapshot_keys(zcrm_leads, lead_snapshots, width)
+    prefix_snapshot_keys(zcrm_deals, deal_snapshots, width)
+    ghl_contacts.insert(0, 'snapshot', contact_snapshots)
+
+    result = metrics.call('join_data', join_data, ghl_contacts, zcrm_leads, zcrm_deals)
+    result = metrics.call('assign_ranking', assign_ranking, result)
+    for column in SNAPSHOT_KEY_COLUMNS:
+        if column in result:
+            result[column] = result[column].str.slice(width + 1)
+    return result
+
+
+def campaign_trends(states, ranked):
+    """Build each snapshot's campaign report, stacked oldest first"""
+    import pandas as pd
+    from pipeline_scripts.campaign_rollup import CampaignRollup, campaign_contributions
+    snapshots = ranked['snapshot'].to_numpy()
+    reports = []
+    for entry, _ in states:
+        # Each snapshot's own contributions, so campaigns tied on value are reported in the order a normal run has them
+        contributions = campaign_contributions(ranked[snapshots == entry['snapshot']])
+        rollup = CampaignRollup(directory=None)
+        rollup.apply(contributions.iloc[:0], contributions)
+        report = rollup.report()
+        report.insert(0, 'snapshot', entry['snapshot'])
+        report.insert(1, 'taken_at', entry['taken_at'])
+        reports.append(report)
+    return pd.concat(reports, ignore_index=True)
+
+
+def write_trends(trends, states, location_id=None):
+    """Rank a batch of snapshot states and append their campaign reports to CSV"""
+    ranked = rank_snapshots(states, location_id)
+    report = metrics.call('campaign_trends', campaign_trends, states, ranked)
+    with metrics.stage('write_trends_csv', len(report)):
+        trends.append(report)
+    print(f"Ranked snapshots {states[0][0]['snapshot']} to {states[-1][0]['snapshot']}")
+
+
+def backfill(archive, since=None, until=None, batch_size=BACKFILL_BATCH_SIZE, location_id=None,
+             trends_path=CAMPAIGN_TRENDS_FILE):
+    """
+    Re-rank archived snapshots and write each one's campaign report to CSV.
+
+    Args:
+        archive (SnapshotArchive): The snapshot archive.
+        since (str): Only the snapshots taken at or after this ISO 8601 time.
+        until (str): Only the snapshots taken at or before this ISO 8601 time.
+        batch_size (int): The snapshots to rank together.
+        location_id (str): The GHL location, None for GHL_B4B_LOCATION.
+        trends_path (str): The CSV file to write the reports to.
+    """
+    from pipeline_scripts.streaming import CsvAppender
+    sources = [contacts_source(location_id), 'zcrm_leads', 'zcrm_deals']
+    entries = archive.snapshots(since, until)
+    if not entries:
+        raise Exception(f"No snapshots in {archive.directory} were taken in the given time range")
+    trends = CsvAppender(trends_path)
+    batch = []
+    # The archive is replayed once, however many batches there are
+    for entry, state in archive.iter_states([entry['snapshot'] for entry in entries], sources):
+        missing = [source for source in sources if source not in state]
+        if missing:
+            print(f"Skipping snapshot {entry['snapshot']}: it has no {', '.join(missing)}")
+            continue
+        batch.append((entry, state))
+        if len(batch) == batch_size:
+            write_trends(trends, batch, location_id)
+            batch = []
+    if batch:
+        write_trends(trends, batch, location_id)
+    if trends.columns is None:
+        raise Exception(f"No snapshots in {archive.directory} have all of {', '.join(sources)}")
+    print(f"Campaign trends written to {trends_path}")
+
+
+def rank_store(db_path):
+    """Rank every contact in the SQLite record store with SQL and store the run"""
+    from pipeline_scripts.sqlite_store import connect, record_rankings
+    connection = connect(db_path)
+    try:
+        with metrics.stage('rank_store'):
+            run_id = record_rankings(connection)
+    finally:
+        connection.close()
+    print(f"Stored ranking run {run_id} in {db_path}")
+
+
+def lookup(db_path, contact_id=None, email=None, phone=None, name=None):
+    """Print the current ranking of the store's contacts with an ID or match key"""
+    from pipeline_scripts.sqlite_store import connect, lookup_contacts
+    connection = connect(db_path)
+    try:
+        with metrics.stage('lookup'):
+            rows = lookup_contacts(connection, contact_id, email, phone, name)
+    finally:
+        connection.close()
+    if not rows:
+        print("No matching contacts")
+    for row in rows:
+        print(dict(row))
+
+
+def build_parser():
+    """Build the command line parser"""
+    from pipeline_scripts.campaign_rollup import DEFAULT_ROLLUP_DIR
+    from pipeline_scripts.fuzzy_matching import FUZZY_THRESHOLD
+    from pipeline_scripts.snapshot_archive import DEFAULT_ARCHIVE_DIR
+    from pipeline_scripts.sqlite_store import DEFAULT_DB_PATH
+    from pipeline_scripts.stage_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument('--report', default='run-report.json',
+                         help="the JSON file to write the run report to")
+    options.add_argument('--trace-memory', action='store_true',
+                         help="measure each stage's peak Python memory with tracemalloc")
+    options.add_argument('--profile', action='append', default=[], metavar='STAGE',
+                         help="run a stage under cProfile, writing STAGE.prof to --profile-dir; repeatable")
+    options.add_argument('--profile-dir', default='profiles',
+                         help="the directory to write stage profiles to")
+
+    fetching = argparse.ArgumentParser(add_help=False)
+    fetching.add_argument('--full', action='store_true',
+                          help="fetch every record instead of only the changes since the last run")
+    fetching.add_argument('--no-archive', action='store_true',
+                          help="skip adding the fetched raw records to the snapshot archive")
+
+    archiving = argparse.ArgumentParser(add_help=False)
+    archiving.add_argument('--archive-dir', default=DEFAULT_ARCHIVE_DIR,
+                           help="the directory the snapshot archive of fetched raw records is kept in")
+
+    locating = argparse.ArgumentParser(add_help=False)
+    locating.add_argument('--location', action='append', dest='locations', metavar='ID',
+                          help="fetch, rank or backfill this GHL location in its own partition instead of GHL_B4B_LOCATION; "
+                               "repeatable, locations are fetched in parallel and ranked one after another")
+
+    storing = argparse.ArgumentParser(add_help=False)
+    storing.add_argument('--db', default=DEFAULT_DB_PATH,
+                         help="the SQLite record store, by default the one fetches upsert records into")
+
+    ranking = argparse.ArgumentParser(add_help=False)
+    ranking.add_argument('--fuzzy', nargs='?', type=float, const=FUZZY_THRESHOLD, metavar='THRESHOLD',
+                         help="also match deals on similar names, emails and phones, scoring at least "
+                              f"THRESHOLD (default {FUZZY_THRESHOLD})")
+    ranking.add_argument('--chunk-size', type=int,
+                         help="stream the contacts through the pipeline in chunks of this many rows, "
+                              "or with --workers, rank partitions of this many rows")
+    ranking.add_argument('--workers', type=int,
+                         help="clean, join and rank the contacts in this many worker processes, 0 for one per CPU; "
+                              "the results are the same as a serial run's")
+    ranking.add_argument('--store', action='store_true',
+                         help="also rank every contact in the SQLite record store (--db) and store the run")
+    ranking.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                         help="the directory cleaned and joined data is cached in between runs")
+    ranking.add_argument('--cache-size', type=int, default=DEFAULT_MAX_BYTES // 1024 ** 2, metavar='MB',
+                         help="the most cached data to keep, evicting the least recently used first")
+    ranking.add_argument('--no-cache', action='store_true',
+                         help="clean and join the data again instead of using or filling the cache")
+    ranking.add_argument('--rollup-dir', default=DEFAULT_ROLLUP_DIR,
+                         help=f"the directory the campaign rollup is kept in between runs; its report is written "
+                              f"to {CAMPAIGN_ROLLUP_FILE}")
+    ranking.add_argument('--no-rollup', action='store_true',
+                         help="skip updating the campaign rollup")
+
+    parser = argparse.ArgumentParser(description="Rank GHL contacts against Zoho CRM leads and deals.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('fetch', parents=[options, fetching, archiving, locating],
+                        help="retrieve the latest GHL contacts and Zoho CRM leads and deals and store them")
+    commands.add_parser('rank', parents=[options, storing, ranking, locating],
+                        help="rank the stored data offline, without contacting the APIs")
+    run = commands.add_parser('run', parents=[options, fetching, archiving, storing, ranking, locating],
+                              help="fetch, then rank (the default)")
+    run.add_argument('--live', action='store_true',
+                     help="rank the GHL contacts page by page as they are fetched, without storing them")
+    backfilling = commands.add_parser('backfill', parents=[options, archiving, locating],
+                                      help="re-rank the archived snapshots and write each one's campaign report "
+                                           f"to {CAMPAIGN_TRENDS_FILE}")
+    backfilling.add_argument('--since', metavar='TIME',
+                             help="only the snapshots taken at or after this ISO 8601 date or time")
+    backfilling.add_argument('--until', metavar='TIME',
+                             help="only the snapshots taken at or before this ISO 8601 date or time; "
+                                  "a date includes the whole day")
+    backfilling.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE,
+                             help="the number of snapshots to clean, join and rank together")
+    serving = commands.add_parser('serve', parents=[options],
+                                  help="rank the stored data, then keep re-ranking it from GHL and Zoho CRM webhooks "
+                                       "and answer rank queries over HTTP")
+    serving.add_argument('--host', default='127.0.0.1', help="the address to listen on")
+    serving.add_argument('--port', type=int, default=8000, help="the port to listen on")
+    serving.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                         help="the directory cleaned leads and deals are cached in between runs")
+    serving.add_argument('--no-cache', action='store_true',
+                         help="clean the leads and deals again instead of using or filling the cache")
+    looking_up = commands.add_parser('lookup', parents=[options, storing],
+                                     help="show the matched deal and current ranking of contacts in the SQLite "
+                                          "record store")
+    keys = looking_up.add_mutually_exclusive_group(required=True)
+    keys.add_argument('--id', dest='contact_id', help="the GHL contact ID")
+    keys.add_argument('--email', help="the contact's email address")
+    keys.add_argument('--phone', help="the contact's phone number")
+    keys.add_argument('--name', help="the contact's name")
+    return parser
+
+
+def main(argv=None):
+    """Run a command line command, 'run' if none is given"""
+    from pipeline_scripts.campaign_rollup import CampaignRollup
+    from pipeline_scripts.parallel import available_cpus
+    from pipeline_scripts.snapshot_archive import SnapshotArchive
+    from pipeline_scripts.stage_cache import StageCache
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # 'python main.py [options]' keeps meaning fetch, then rank
+    if not argv or argv[0] not in ('fetch', 'rank', 'run', 'backfill', 'serve', 'lookup', '-h', '--help'):
+        argv = ['run', *argv]
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'live', False) and getattr(args, 'workers', None) is not None:
+        parser.error("--workers cannot be used with --live")
+    if getattr(args, 'live', False) and getattr(args, 'locations', None):
+        parser.error("--location cannot be used with --live")
+    metrics.configure(args.trace_memory, args.profile, args.profile_dir)
+
+    if args.command in ('fetch', 'run'):
+        fetch(incremental=not args.full, zcrm_only=getattr(args, 'live', False), locations=args.locations)
+        if not args.no_archive:
+            archive_snapshot(SnapshotArchive(args.archive_dir),
+                             snapshot_sources(args.locations, zcrm_only=getattr(args, 'live', False)))
+    if args.command in ('rank', 'run'):
+        cache = None if args.no_cache else StageCache(args.cache_dir, args.cache_size * 1024 ** 2)
+        if args.locations:
+            rank_locations(args.locations, args, cache)
+        else:
+            rollup = None if args.no_rollup else CampaignRollup(args.rollup_dir)
+            run_pipeline(GHL_CONTACTS_FILE, ZCRM_LEADS_FILE, ZCRM_DEALS_FILE,
+                         'detailed_results.csv', 'condensed_results.csv', args.chunk_size,
+                         live=getattr(args, 'live', False), fuzzy_threshold=args.fuzzy,
+                         workers=available_cpus() if args.workers == 0 else args.workers, cache=cache, rollup=rollup)
+        if args.store:
+            rank_store(args.db)
+    if args.command == 'backfill':
+        archive = SnapshotArchive(args.archive_dir)
+        for location_id in args.locations or [None]:
+            backfill(archive, args.since, args.until, args.batch_size, location_id,
+                     CAMPAIGN_TRENDS_FILE if location_id is None else location_file(CAMPAIGN_TRENDS_FILE, location_id))
+    if args.command == 'serve':
+        serve(args.host, args.port, cache=None if args.no_cache else StageCache(args.cache_dir))
+    if args.command == 'lookup':
+        lookup(args.db, args.contact_id, args.email, args.phone, args.name)
+
+    metrics.write_report(args.report)
+    print(f"Run report written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DEFAULT_ROLLUP_DIR = './campaign-rollup'
+CONTACTS_FILE = 'contacts.parquet'
+CAMPAIGNS_FILE = 'campaigns.parquet'
+# The Parquet metadata key of the stamp shared by the files of one save.
+GENERATION_KEY = b'campaign_rollup.generation'
+
+# The columns a campaign is identified by. The campaign and content come from a contact's
+# '{medium}_utmCampaign' and '{medium}_utmContent' attribution columns.
+CAMPAIGN_COLUMNS = ['utmCampaign', 'utmContent', 'Ad_Name', 'source']
+# The columns of a contact that identify it from run to run.
+IDENTITY_COLUMNS = ['email_ghlc', 'phone_ghlc', 'contactName_ghlc']
+# The additive totals kept per campaign and ranking.
+TOTAL_COLUMNS = ['contacts', 'deals', 'amount_cents']
+
+# The ranking of a sold contact, and the ranking recorded for contacts that match no rule.
+SOLD_RANKING = 12
+UNRANKED = -1
+# The chance that a contact of each ranking turns into a sale of the average sold amount,
+# for the expected Amount. Sold contacts count their actual amount instead, and rankings
+# not listed count nothing.
+SALE_LIKELIHOOD = {
+    11: 0.30, 10: 0.25, 9: 0.20, 8: 0.15, 7: 0.10,
+    6: 0.05, 5: 0.04, 4: 0.03, 3: 0.02, 2: 0.01,
+}
+
+
+def _first_attribution(data: pd.DataFrame, key: str, media: list) -> tuple:
+    # Each contact's key from the first medium, in name order, that has a campaign
+    campaign = np.full(len(data), '', dtype=object)
+    value = np.full(len(data), '', dtype=object)
+    unset = np.ones(len(data), dtype=bool)
+    for medium in media:
+        campaigns = data[f"{medium}_utmCampaign"].to_numpy(dtype=object, na_value='')
+        take = unset & (campaigns != '')
+        campaign[take] = campaigns[take]
+        if f"{medium}_{key}" in data:
+            value[take] = data[f"{medium}_{key}"].to_numpy(dtype=object, na_value='')[take]
+        unset &= ~take
+    return campaign, value
+
+
+def campaign_contributions(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reduce ranked contacts to what each adds to its campaign's totals.
+
+    A contact's campaign and content come from the first medium, in name order, with a
+    utmCampaign, so the result does not depend on the order the attribution columns were
+    found in. Missing campaign values are empty strings.
+
+    Args:
+        data (pd.DataFrame): The ranked contacts, as written to the detailed results.
+
+    Returns:
+        pd.DataFrame: One row per contact, in order: an 'identity' hash of its
+        IDENTITY_COLUMNS, the CAMPAIGN_COLUMNS as categories, its 'ranking' (UNRANKED
+        if it has none), whether it has a 'deal' amount and the 'amount_cents'.
+    """
+    media = sorted(column[:-len('_utmCampaign')] for column in data.columns if column.endswith('_utmCampaign'))
+    campaign, content = _first_attribution(data, 'utmContent', media)
+
+    contributions = pd.DataFrame({
+        'identity': pd.util.hash_pandas_object(data[IDENTITY_COLUMNS], index=False).to_numpy(),
+        'utmCampaign': campaign,
+        'utmContent': content,
+    })
+    for column in CAMPAIGN_COLUMNS[2:]:
+        values = data[column] if column in data else pd.Series(None, index=data.index, dtype=object)
+        contributions[column] = values.to_numpy(dtype=object, na_value='')
+    for column in CAMPAIGN_COLUMNS:
+        contributions[column] = contributions[column].astype(str).astype('category')
+
+    amount = pd.to_numeric(data['Amount'], errors='coerce').to_numpy(dtype=float)
+    contributions['ranking'] = pd.to_numeric(data['ranking']).fillna(UNRANKED).to_numpy(dtype=np.int64)
+    contributions['deal'] = ~np.isnan(amount)
+    contributions['amount_cents'] = np.where(contributions['deal'], np.round(np.nan_to_num(amount) * 100), 0).astype(np.int64)
+    return contributions
+
+
+class CampaignRollup:
+    """
+    Totals of ranked contacts per campaign, kept up to date from the contacts that changed.
+
+    The totals are additive counts and sums per campaign and ranking: contacts, contacts
+    with a deal amount and the amount in cents. Integer cents keep the sums exact however
+    often contacts are added and taken away, so an updated rollup always equals one built
+    from scratch.
+
+    The rollup remembers each contact's contribution under a key made from its identity
+    columns and its occurrence among contacts with the same identity, along with a hash of
+    the contribution. An update compares the hashes and adds or takes away only the
+    contributions of new, changed and removed contacts. The rates and scores in the report
+    are derived from the totals when it is built.
+
+    The rollup is loaded from, and saved to, a directory of Parquet files, or kept in
+    memory only. Both files of a save carry the same generation stamp; if a save was
+    interrupted between them, the totals are rebuilt from the contributions on load.
+    """
+
+    def __init__(self, directory: str = DEFAULT_ROLLUP_DIR, likelihoods: dict = None):
+        """
+        Load the rollup saved in a directory, or start an empty one.
+
+        Args:
+            directory (str): The directory the rollup is saved in, None to keep it in memory only; it is created when saved.
+            likelihoods (dict): Ranking -> chance of a sale, defaults to SALE_LIKELIHOOD.
+        """
+        self.directory = directory
+        self.likelihoods = SALE_LIKELIHOOD if likelihoods is None else likelihoods
+        contacts_path = os.path.join(directory or '', CONTACTS_FILE)
+        campaigns_path = os.path.join(directory or '', CAMPAIGNS_FILE)
+        if directory is not None and os.path.exists(contacts_path) and os.path.exists(campaigns_path):
+            self.contacts, contacts_generation = self._read(contacts_path)
+            self.campaigns, campaigns_generation = self._read(campaigns_path)
+            if contacts_generation != campaigns_generation:
+                # The contributions are saved first, so they are the newer of the two
+                print(f"The campaign rollup in {directory} was not fully saved, rebuilding its totals")
+                self.campaigns = self._totals(self.contacts).astype(np.int64)
+        else:
+            self.contacts = pd.DataFrame(
+                {'fingerprint': pd.Series(dtype=np.uint64)}, index=pd.Index([], dtype=np.uint64, name='key'))
+            self.campaigns = pd.DataFrame(
+                {column: pd.Series(dtype=np.int64) for column in TOTAL_COLUMNS},
+                index=pd.MultiIndex.from_arrays([[]] * (len(CAMPAIGN_COLUMNS) + 1), names=[*CAMPAIGN_COLUMNS, 'ranking']))
+
+    @staticmethod
+    def _read(path: str) -> tuple:
+        table = pq.read_table(path)
+        return table.to_pandas(), (table.schema.metadata or {}).get(GENERATION_KEY)
+
+    @staticmethod
+    def _totals(contributions: pd.DataFrame) -> pd.DataFrame:
+        totals = (contributions.assign(contacts=1, deals=contributions['deal'].astype(np.int64))
+                  .groupby([*CAMPAIGN_COLUMNS, 'ranking'], observed=True)[TOTAL_COLUMNS].sum())
+        # Plain labels, so totals from frames with different categories line up
+        totals.index = pd.MultiIndex.from_arrays(
+            [totals.index.get_level_values(level).astype(object) for level in range(totals.index.nlevels)],
+            names=totals.index.names)
+        return totals
+
+    def apply(self, removed: pd.DataFrame, added: pd.DataFrame) -> None:
+        """
+        Take contributions away from the totals and add others.
+
+        For callers that track which contributions changed themselves; the contributions
+        remembered for update are left as they are.
+
+        Args:
+            removed (pd.DataFrame): Contributions, from campaign_contributions, to take away.
+            added (pd.DataFrame): Contributions to add.
+        """
+        campaigns = self.campaigns
+        if len(removed):
+            campaigns = campaigns.sub(self._totals(removed), fill_value=0)
+        if len(added):
+            campaigns = campaigns.add(self._totals(added), fill_value=0)
+        self.campaigns = campaigns[campaigns['contacts'] != 0].astype(np.int64)
+
+    def update(self, contributions: pd.DataFrame) -> int:
+        """
+        Bring the totals up to date with the current contributions of every contact.
+
+        Args:
+            contributions (pd.DataFrame): The contributions of all contacts, from campaign_contributions.
+
+        Returns:
+            int: The number of contributions added or taken away.
+        """
+        # Contacts sharing an identity are told apart by their order
+        occurrence = contributions.groupby('identity', sort=False).cumcount().to_numpy(dtype=np.uint64)
+        keys = pd.util.hash_pandas_object(
+            pd.DataFrame({'identity': contributions['identity'].to_numpy(), 'occurrence': occurrence}), index=False)
+        current = contributions.drop(columns='identity').set_axis(pd.Index(keys.to_numpy(), name='key'))
+        current.insert(0, 'fingerprint', pd.util.hash_pandas_object(current, index=False).to_numpy())
+
+        previous = self.contacts['fingerprint']
+        unchanged_now = current['fingerprint'].eq(previous.reindex(current.index)).to_numpy()
+        unchanged_before = previous.eq(current['fingerprint'].reindex(previous.index)).to_numpy()
+        removed = self.contacts[~unchanged_before]
+        added = current[~unchanged_now]
+
+        self.apply(removed, added)
+        self.contacts = current
+        return len(removed) + len(added)
+
+    def report(self, filters: dict = None) -> pd.DataFrame:
+        """
+        Build the campaign report from the totals.
+
+        The report has the campaign columns, the number of contacts, the count of each
+        ranking ('unranked' for contacts that match no rule), the conversions (sold
+        contacts), the conversion rate, the total Amount of every matched deal, the expected
+        Amount and the value score. The expected Amount is the sold contacts' amount plus,
+        for every other contact, its ranking's chance of a sale times the average sold
+        amount over all campaigns. The value score is the expected Amount per contact.
+
+        Args:
+            filters (dict): Campaign column -> value, to report only the campaigns with those values.
+
+        Returns:
+            pd.DataFrame: One row per campaign, highest value score first.
+        """
+        campaigns = self.campaigns
+        rankings = campaigns.index.get_level_values('ranking').to_numpy(dtype=np.int64)
+        sold = rankings == SOLD_RANKING
+        sold_contacts = campaigns['contacts'][sold].sum()
+        average_sale = campaigns['amount_cents'][sold].sum() / 100 / sold_contacts if sold_contacts else 0.0
+        likelihood = np.array([self.likelihoods.get(ranking, 0.0) for ranking in rankings], dtype=float)
+        expected = pd.Series(np.where(sold, campaigns['amount_cents'] / 100, campaigns['contacts'] * likelihood * average_sale),
+                             index=campaigns.index)
+        for column, value in (filters or {}).items():
+            selected = (campaigns.index.get_level_values(column) == value)
+            campaigns, expected = campaigns[selected], expected[selected]
+
+        by_ranking = campaigns['contacts'].unstack('ranking', fill_value=0)
+        by_ranking = by_ranking.reindex(columns=sorted(by_ranking.columns))
+        counts = by_ranking.set_axis(
+            ['unranked' if ranking == UNRANKED else f'ranking_{ranking}' for ranking in by_ranking.columns], axis=1)
+
+        group = campaigns.index.droplevel('ranking')
+        report = pd.DataFrame({'contacts': by_ranking.sum(axis=1)})
+        report = report.join(counts)
+        report['conversions'] = by_ranking[SOLD_RANKING] if SOLD_RANKING in by_ranking else 0
+        report['conversion_rate'] = report['conversions'] / report['contacts']
+        report['total_amount'] = campaigns['amount_cents'].groupby(group).sum() / 100
+        report['expected_amount'] = expected.groupby(group).sum()
+        report['value_score'] = report['expected_amount'] / report['contacts']
+        return report.sort_values(['value_score', 'contacts'], ascending=False, kind='stable').reset_index()
+
+    def save(self) -> None:
+        """
+        Save the rollup to its directory, replacing each file atomically.
+
+        The contributions are replaced before the totals, and both are stamped with a new
+        generation, so a save interrupted between the two is detected and repaired on load.
+
+        Raises:
+            Exception: The rollup is kept in memory only.
+        """
+        if self.directory is None:
+            raise Exception("A campaign rollup without a directory cannot be saved")
+        os.makedirs(self.directory, exist_ok=True)
+        generation = uuid.uuid4().hex.encode()
+        for frame, file_name in ((self.contacts, CONTACTS_FILE), (self.campaigns, CAMPAIGNS_FILE)):
+            path = os.path.join(self.directory, file_name)
+            temporary = f"{path}.{os.getpid()}.tmp"
+            table = pa.Table.from_pandas(frame)
+            pq.write_table(table.replace_schema_metadata({**table.schema.metadata, GENERATION_KEY: generation}),
+                           temporary)
+            os.replace(temporary, path)
@@ -0,0 +1,246 @@
+import json
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from .field_extraction import extract_contact_fields
+
+# Cleaned GHL contact fields, in clean_contact_data order. Flattened attribution and
+# custom field columns are appended as strings at write time.
+GHL_CONTACT_SCHEMA = pa.schema([
+    ('id', pa.string()),
+    ('contactName', pa.string()),
+    ('firstName', pa.string()),
+    ('lastName', pa.string()),
+    ('companyName', pa.string()),
+    ('email', pa.string()),
+    ('phone', pa.string()),
+    ('source', pa.string()),
+    ('city', pa.string()),
+    ('state', pa.string()),
+    ('postalCode', pa.string()),
+    ('address1', pa.string()),
+    ('dateAdded', pa.string()),
+    ('dateUpdated', pa.string()),
+    ('tags', pa.list_(pa.string())),
+    ('country', pa.string()),
+])
+
+# The column contacts fetched by location are tagged with their GHL location in.
+LOCATION_COLUMN = 'locationId'
+
+# Zoho CRM field types that are not plain strings.
+ZCRM_FIELD_TYPES = {
+    'Amount': pa.float64(),
+    'Grand_Total': pa.float64(),
+    'Monthly_Sub_Total': pa.float64(),
+    'Contact_Name': pa.struct([('id', pa.string()), ('name', pa.string())]),
+}
+
+COMPRESSION = 'zstd'
+
+# Arrow types read into compact pandas dtypes rather than Python objects.
+_ARROW_DTYPES = {pa.string(): pd.StringDtype('pyarrow')}
+# Separators keying a list column's lists by their items; tags never contain them.
+_ITEM_SEPARATOR = '\x1f'
+_LENGTH_SEPARATOR = '\x1e'
+
+
+def zcrm_schema(fields: list) -> pa.Schema:
+    """
+    Build the schema for cleaned Zoho CRM records.
+
+    Args:
+        fields (list): The cleaned fields, in order.
+
+    Returns:
+        pa.Schema: The schema, with plain strings for every field not in ZCRM_FIELD_TYPES.
+    """
+    return pa.schema([(field, ZCRM_FIELD_TYPES.get(field, pa.string())) for field in fields])
+
+
+def _as_text(value):
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def _conform(frame: pd.DataFrame, schema: pa.Schema) -> pd.DataFrame:
+    """Coerce the frame's columns to the schema so that Arrow conversion cannot fail."""
+    columns = {}
+    for field in schema:
+        values = frame[field.name] if field.name in frame else pd.Series(None, index=frame.index, dtype=object)
+        if pa.types.is_string(field.type):
+            # Columns of nothing but text, the usual case, are left as they are
+            if pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+                values = values.map(_as_text, na_action='ignore')
+        elif pa.types.is_floating(field.type):
+            values = pd.to_numeric(values, errors='coerce')
+        columns[field.name] = values
+    return pd.DataFrame(columns, index=frame.index)
+
+
+def frame_table(frame: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """
+    Convert a frame to an Arrow table with an explicit schema, as it would be written to Parquet.
+
+    Args:
+        frame (pd.DataFrame): The data to convert.
+        schema (pa.Schema): The schema to convert to; missing columns are nulls.
+
+    Returns:
+        pa.Table: The data.
+    """
+    return pa.Table.from_pandas(_conform(frame, schema), schema=schema, preserve_index=False)
+
+
+def write_frame(frame: pd.DataFrame, file_path: str, schema: pa.Schema) -> None:
+    """
+    Write a frame to a Parquet file with an explicit schema.
+
+    Args:
+        frame (pd.DataFrame): The data to write.
+        file_path (str): The Parquet file to write.
+        schema (pa.Schema): The schema to write with; missing columns are written as nulls.
+    """
+    pq.write_table(frame_table(frame, schema), file_path, compression=COMPRESSION)
+
+
+def _list_categories(values: pa.ChunkedArray) -> pd.Categorical:
+    """
+    Encode a list column as a categorical of each distinct list's text, as written to CSV.
+
+    Each list is keyed by its length and its items joined with a separator, and only
+    the distinct keys are turned back into lists, so there is no Python object per row.
+
+    Returns:
+        pd.Categorical: The list texts, or None if some list has missing items.
+    """
+    values = values.combine_chunks()
+    lengths = pc.list_value_length(values)
+    keys = pc.binary_join_element_wise(pc.cast(lengths, pa.string()), pc.binary_join(values, _ITEM_SEPARATOR),
+                                       _LENGTH_SEPARATOR)
+    # A missing item makes the whole key missing
+    if pc.any(pc.and_(pc.is_null(keys), pc.is_valid(values))).as_py():
+        return None
+
+    encoded = pc.dictionary_encode(keys)
+    categories = []
+    for key in encoded.dictionary.to_pylist():
+        length, items = key.split(_LENGTH_SEPARATOR, 1)
+        categories.append(str(items.split(_ITEM_SEPARATOR) if int(length) else []))
+    codes = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+    return pd.Categorical.from_codes(codes, categories)
+
+
+def table_to_frame(table: pa.Table) -> pd.DataFrame:
+    """Convert a table to a frame as read_frame reads it, with Arrow string columns and list columns as categoricals of their text."""
+    list_columns = [field.name for field in table.schema if pa.types.is_list(field.type)]
+    frame = table.drop_columns(list_columns).to_pandas(types_mapper=_ARROW_DTYPES.get)
+    for name in list_columns:
+        categories = _list_categories(table.column(name))
+        frame[name] = categories if categories is not None else table.column(name).to_pylist()
+    return frame[table.column_names]
+
+
+def read_frame(file_path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Read a Parquet file into a frame through a memory map.
+
+    Only the requested columns are read from disk. String columns come back as Arrow
+    strings rather than a Python object per cell, and list columns as categoricals of
+    the lists' text, e.g. "['b4b', 'phone verified']", so repeated lists are held
+    once. Struct columns come back as dictionaries, as they would from JSON.
+
+    Args:
+        file_path (str): The Parquet file to read.
+        columns (list): The columns to read, all columns if not given.
+
+    Returns:
+        pd.DataFrame: The data.
+    """
+    return table_to_frame(pq.read_table(file_path, columns=columns, memory_map=True))
+
+
+def iter_frames(file_path: str, batch_size: int, columns: list = None):
+    """
+    Read a Parquet file as a sequence of frames of at most batch_size rows.
+
+    Only one batch is held in memory at a time.
+
+    Args:
+        file_path (str): The Parquet file to read.
+        batch_size (int): The maximum number of rows per frame.
+        columns (list): The columns to read, all columns if not given.
+
+    Yields:
+        pd.DataFrame: The next batch of rows.
+    """
+    parquet_file = pq.ParquetFile(file_path, memory_map=True)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield table_to_frame(pa.Table.from_batches([batch]))
+
+
+def ghl_contacts_table(contacts: list, custom_field_columns: dict = None, location_id: str = None) -> pa.Table:
+    """
+    Convert cleaned GHL contacts to a table with their attributions and custom fields flattened.
+
+    Args:
+        contacts (list): Contacts as returned by clean_contact_data, or a dict of their columns.
+        custom_field_columns (dict): Custom field ID -> column name.
+        location_id (str): The GHL location of the contacts, added as a LOCATION_COLUMN after the flattened columns.
+
+    Returns:
+        pa.Table: The contacts, as write_ghl_contacts writes them.
+    """
+    frame = pd.DataFrame(contacts, columns=GHL_CONTACT_SCHEMA.names + ['attributions', 'customFields'])
+    flat = extract_contact_fields(frame, custom_field_columns)
+    frame = frame.drop(columns=['attributions', 'customFields']).join(flat)
+    schema = pa.schema(list(GHL_CONTACT_SCHEMA) + [(column, pa.string()) for column in flat.columns])
+    if location_id is not None:
+        frame[LOCATION_COLUMN] = location_id
+        schema = schema.append(pa.field(LOCATION_COLUMN, pa.string()))
+    return frame_table(frame, schema)
+
+
+def write_ghl_contacts(contacts: list, file_path: str, custom_field_columns: dict = None, location_id: str = None) -> None:
+    """
+    Write cleaned GHL contacts to Parquet with their attributions and custom fields flattened.
+
+    Args:
+        contacts (list): Contacts as returned by clean_contact_data, or a dict of their columns.
+        file_path (str): The Parquet file to write.
+        custom_field_columns (dict): Custom field ID -> column name.
+        location_id (str): The GHL location of the contacts, written to a LOCATION_COLUMN after the flattened columns.
+    """
+    pq.write_table(ghl_contacts_table(contacts, custom_field_columns, location_id), file_path, compression=COMPRESSION)
+
+
+def zcrm_records_table(records: list, fields: list) -> pa.Table:
+    """
+    Convert cleaned Zoho CRM records to a table.
+
+    Args:
+        records (list): The records to convert.
+        fields (list): The fields to keep.
+
+    Returns:
+        pa.Table: The records, as write_zcrm_records writes them.
+    """
+    return frame_table(pd.DataFrame(records, columns=fields), zcrm_schema(fields))
+
+
+def write_zcrm_records(records: list, file_path: str, fields: list) -> None:
+    """
+    Write cleaned Zoho CRM records to Parquet.
+
+    Args:
+        records (list): The records to write.
+        file_path (str): The Parquet file to write.
+        fields (list): The fields to keep.
+    """
+    pq.write_table(zcrm_records_table(records, fields), file_path, compression=COMPRESSION)
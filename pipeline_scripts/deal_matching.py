@@ -0,0 +1,260 @@
+import bisect
+
+import numpy as np
+import pandas as pd
+
+# Contact key -> deal key pairs, in match priority order.
+MATCH_KEYS = [
+    ('contactName_ghlc', 'contactName_zd'),
+    ('email_ghlc', 'email_zd'),
+    ('phone_ghlc', 'phone_zd'),
+]
+
+# Deal columns copied onto matched contacts by default.
+DEFAULT_DEAL_COLUMNS = ['Amount', 'Stage']
+
+
+class DealIndex:
+    """
+    Hash indexes over the Zoho CRM deal match keys.
+
+    The indexes are built once per deals frame. Each index maps a key value to the
+    position of the first deal carrying it, so lookups keep the first-match
+    semantics of a top-to-bottom scan of the deals frame.
+    """
+
+    def __init__(self, deals: pd.DataFrame, match_keys: list = None):
+        """
+        Build the lookup indexes.
+
+        Args:
+            deals (pd.DataFrame): The cleaned Zoho CRM deals data.
+            match_keys (list): (contact key, deal key) pairs in priority order.
+        """
+        self.deals = deals.reset_index(drop=True)
+        self.match_keys = match_keys or MATCH_KEYS
+        self.lookups = {
+            deal_key: self._build_lookup(self.deals[deal_key])
+            for _, deal_key in self.match_keys
+        }
+
+    @staticmethod
+    def _build_lookup(keys: pd.Series) -> tuple:
+        """
+        Build a unique key index and the deal position of each key's first occurrence.
+
+        Args:
+            keys (pd.Series): The deal key column.
+
+        Returns:
+            tuple: The unique key index and an array of deal positions.
+        """
+        first = keys.notna().to_numpy() & ~keys.duplicated(keep='first').to_numpy()
+        index = pd.Index(keys.to_numpy(dtype=object)[first])
+        # Build the hash table now rather than on the first lookup, so that worker
+        # processes sharing the index do not each build their own
+        index.get_indexer(np.empty(0, dtype=object))
+        return index, np.flatnonzero(first)
+
+    def resolve(self, contacts: pd.DataFrame) -> np.ndarray:
+        """
+        Resolve the matching deal for every contact.
+
+        Keys are tried in priority order and a contact keeps the first key that matches.
+
+        Args:
+            contacts (pd.DataFrame): Contacts carrying the contact match keys.
+
+        Returns:
+            np.ndarray: The deal position for each contact, or -1 where nothing matched.
+        """
+        positions = np.full(len(contacts), -1, dtype=np.int64)
+        for contact_key, deal_key in self.match_keys:
+            unresolved = np.flatnonzero(positions < 0)
+            if len(unresolved) == 0:
+                break
+            index, deal_positions = self.lookups[deal_key]
+            values = contacts[contact_key].to_numpy(dtype=object)[unresolved]
+            hits = index.get_indexer(values)
+            found = hits >= 0
+            positions[unresolved[found]] = deal_positions[hits[found]]
+        return positions
+
+    def lookup(self, contacts: pd.DataFrame, columns: list = None) -> pd.DataFrame:
+        """
+        Pull deal columns for every contact.
+
+        Args:
+            contacts (pd.DataFrame): Contacts carrying the contact match keys.
+            columns (list): The deal columns to pull.
+
+        Returns:
+            pd.DataFrame: The deal columns aligned to the contacts index, NaN where unmatched.
+        """
+        return self.take(self.resolve(contacts), columns, contacts.index)
+
+    def take(self, positions: np.ndarray, columns: list = None, index: pd.Index = None) -> pd.DataFrame:
+        """
+        Pull deal columns for resolved deal positions.
+
+        Args:
+            positions (np.ndarray): A deal position per contact, -1 where unmatched.
+            columns (list): The deal columns to pull.
+            index (pd.Index): The contacts index to align the result to.
+
+        Returns:
+            pd.DataFrame: The deal columns, NaN where unmatched.
+        """
+        columns = list(columns or DEFAULT_DEAL_COLUMNS)
+        matched = self.deals[columns].reindex(positions)
+        matched.index = index if index is not None else pd.RangeIndex(len(positions))
+        return matched
+
+
+def match_deals(contacts: pd.DataFrame, deals: pd.DataFrame, columns: list = None) -> pd.DataFrame:
+    """
+    Match contacts to deals on name, then email, then phone.
+
+    Args:
+        contacts (pd.DataFrame): Contacts carrying the contact match keys.
+        deals (pd.DataFrame): The cleaned Zoho CRM deals data.
+        columns (list): The deal columns to pull.
+
+    Returns:
+        pd.DataFrame: The deal columns aligned to the contacts index, NaN where unmatched.
+    """
+    return DealIndex(deals).lookup(contacts, columns)
+
+
+class LiveDealIndex:
+    """
+    Deal match key lookups that deals can be added to, changed in and removed from.
+
+    Resolves contacts like DealIndex, a contact taking the first deal in order that
+    carries its key, but keeps each key's deal positions in Python dicts so that one
+    deal can be changed without rebuilding the indexes. A changed deal keeps its
+    position and new deals go after the existing ones, so matches stay those of a
+    DealIndex over the same deals. Meant for looking up a handful of contacts at a time.
+    """
+
+    def __init__(self, deals: pd.DataFrame, deal_ids: list = None, match_keys: list = None):
+        """
+        Build the lookups.
+
+        Args:
+            deals (pd.DataFrame): The cleaned Zoho CRM deals data.
+            deal_ids (list): The Zoho CRM ID of each deal, in order; deals without one can only be matched.
+            match_keys (list): (contact key, deal key) pairs in priority order.
+        """
+        self.match_keys = match_keys or MATCH_KEYS
+        self.columns = list(deals.columns)
+        self.rows = deals.astype(object).where(deals.notna(), None).to_dict('records')
+        self.positions = {deal_id: position for position, deal_id in enumerate(deal_ids or []) if deal_id is not None}
+        self.lookups = {deal_key: {} for _, deal_key in self.match_keys}
+        for position, row in enumerate(self.rows):
+            self._add_keys(position, row)
+
+    def _add_keys(self, position: int, row: dict) -> None:
+        for _, deal_key in self.match_keys:
+            if row.get(deal_key) is not None:
+                positions = self.lookups[deal_key].setdefault(row[deal_key], [])
+                bisect.insort(positions, position)
+
+    def _remove_keys(self, position: int, row: dict) -> None:
+        for _, deal_key in self.match_keys:
+            positions = self.lookups[deal_key].get(row.get(deal_key))
+            if positions and position in positions:
+                positions.remove(position)
+                if not positions:
+                    del self.lookups[deal_key][row[deal_key]]
+
+    def keys(self, row: dict) -> dict:
+        """
+        List the contact key values a deal matches on.
+
+        Args:
+            row (dict): A deal.
+
+        Returns:
+            dict: Contact key -> the deal's value of the matching deal key, for the keys it has.
+        """
+        return {contact_key: row[deal_key] for contact_key, deal_key in self.match_keys
+                if row.get(deal_key) is not None}
+
+    def upsert(self, deal_id: str, row: dict) -> dict:
+        """
+        Add a deal, or replace the deal with the same ID in its position.
+
+        Args:
+            deal_id (str): The deal's Zoho CRM ID.
+            row (dict): The cleaned deal.
+
+        Returns:
+            dict: The replaced deal, None if the deal is new.
+        """
+        row = {column: row.get(column) for column in self.columns}
+        position = self.positions.get(deal_id)
+        if position is None:
+            self.positions[deal_id] = len(self.rows)
+            self.rows.append(row)
+            self._add_keys(len(self.rows) - 1, row)
+            return None
+        previous = self.rows[position]
+        if previous is not None:
+            self._remove_keys(position, previous)
+        self.rows[position] = row
+        self._add_keys(position, row)
+        return previous
+
+    def remove(self, deal_id: str) -> dict:
+        """
+        Remove a deal.
+
+        Args:
+            deal_id (str): The deal's Zoho CRM ID.
+
+        Returns:
+            dict: The removed deal, None if there was no deal with the ID.
+        """
+        position = self.positions.pop(deal_id, None)
+        if position is None or self.rows[position] is None:
+            return None
+        previous = self.rows[position]
+        self._remove_keys(position, previous)
+        self.rows[position] = None
+        return previous
+
+    def resolve(self, contacts: pd.DataFrame) -> np.ndarray:
+        """
+        Resolve the matching deal for every contact, like DealIndex.resolve.
+
+        Args:
+            contacts (pd.DataFrame): Contacts carrying the contact match keys.
+
+        Returns:
+            np.ndarray: The deal position for each contact, or -1 where nothing matched.
+        """
+        positions = np.full(len(contacts), -1, dtype=np.int64)
+        for contact_key, deal_key in self.match_keys:
+            lookup = self.lookups[deal_key]
+            for row, value in enumerate(contacts[contact_key].to_numpy(dtype=object, na_value=None)):
+                if positions[row] < 0 and value is not None and value in lookup:
+                    positions[row] = lookup[value][0]
+        return positions
+
+    def take(self, positions: np.ndarray, columns: list = None, index: pd.Index = None) -> pd.DataFrame:
+        """
+        Pull deal columns for resolved deal positions, like DealIndex.take.
+
+        Args:
+            positions (np.ndarray): A deal position per contact, -1 where unmatched.
+            columns (list): The deal columns to pull.
+            index (pd.Index): The contacts index to align the result to.
+
+        Returns:
+            pd.DataFrame: The deal columns, NaN where unmatched.
+        """
+        columns = list(columns or DEFAULT_DEAL_COLUMNS)
+        matched = pd.DataFrame([self.rows[position] if position >= 0 else {} for position in positions],
+                               columns=columns, index=index if index is not None else pd.RangeIndex(len(positions)))
+        return matched.infer_objects().fillna(np.nan)
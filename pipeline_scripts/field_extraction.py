@@ -0,0 +1,109 @@
+import pandas as pd
+
+# GHL custom field ID -> output column name.
+CUSTOM_FIELD_COLUMNS = {
+    "rXRaOb44Zgb853REc5Wo": "Business_in_AU",
+    "vq0Esn3nuJ2jknUuvjhU": "Handset_Count",
+    "WY19sqzAA5ApOI573VVl": "Ad_Name",
+    "zAKDOxzWoIGAX7Nadsqk": "Ph_verified",
+    "uV1tzJy3WNtlIw8UIdYP": "Qualified",
+}
+
+
+def flatten_contact(attributions, custom_fields, custom_field_columns: dict) -> dict:
+    """
+    Flatten one contact's attributions and custom fields into a single record.
+
+    Attributions become '{medium}_{key}' entries. Custom fields listed in
+    custom_field_columns become entries named by the map; the first field with a
+    given ID wins and list values are reduced to their first item.
+
+    Args:
+        attributions (dict): The contact's attributions, keyed by medium.
+        custom_fields (list): The contact's custom fields.
+        custom_field_columns (dict): Custom field ID -> column name.
+
+    Returns:
+        dict: The flattened record.
+    """
+    record = {}
+    if isinstance(attributions, dict):
+        for medium, values in attributions.items():
+            if isinstance(values, dict):
+                for key, value in values.items():
+                    record[f"{medium}_{key}"] = value
+
+    if isinstance(custom_fields, list):
+        for field in custom_fields:
+            column = custom_field_columns.get(field['id'])
+            if column is None or column in record:
+                continue
+            value = field['value']
+            if isinstance(value, list):
+                value = value[0] if value else None
+            record[column] = value
+
+    return record
+
+
+def extract_contact_fields(data: pd.DataFrame, custom_field_columns: dict = None, attribution_columns: list = None) -> pd.DataFrame:
+    """
+    Flatten the 'attributions' and 'customFields' columns of every contact in one pass.
+
+    Attribution columns are collected from every row, in order of first appearance,
+    unless a fixed list is given.
+
+    Args:
+        data (pd.DataFrame): GHL contacts with 'attributions' and 'customFields' columns.
+        custom_field_columns (dict): Custom field ID -> column name, defaults to CUSTOM_FIELD_COLUMNS.
+        attribution_columns (list): A fixed list of '{medium}_{key}' columns to extract.
+
+    Returns:
+        pd.DataFrame: The attribution columns followed by the custom field columns,
+        aligned to the data index.
+    """
+    custom_field_columns = custom_field_columns or CUSTOM_FIELD_COLUMNS
+
+    records = [
+        flatten_contact(attributions, custom_fields, custom_field_columns)
+        for attributions, custom_fields in zip(data['attributions'], data['customFields'])
+    ]
+
+    if attribution_columns is None:
+        custom_columns = set(custom_field_columns.values())
+        seen = {}
+        for record in records:
+            for column in record:
+                if column not in custom_columns:
+                    seen[column] = None
+        attribution_columns = list(seen)
+
+    columns = list(attribution_columns) + list(dict.fromkeys(custom_field_columns.values()))
+    return pd.DataFrame.from_records(records, index=data.index, columns=columns)
+
+
+def collect_attribution_columns(data: pd.DataFrame, custom_field_columns: dict = None) -> list:
+    """
+    Collect the '{medium}_{key}' attribution columns of every contact, in order of first appearance.
+
+    Passing the result to extract_contact_fields gives every part of a frame the
+    columns the whole frame would get.
+
+    Args:
+        data (pd.DataFrame): GHL contacts with an 'attributions' column.
+        custom_field_columns (dict): Custom field ID -> column name, defaults to CUSTOM_FIELD_COLUMNS.
+
+    Returns:
+        list: The attribution columns.
+    """
+    custom_columns = set((custom_field_columns or CUSTOM_FIELD_COLUMNS).values())
+    seen = {}
+    for attributions in data['attributions']:
+        if isinstance(attributions, dict):
+            for medium, values in attributions.items():
+                if isinstance(values, dict):
+                    for key in values:
+                        column = f"{medium}_{key}"
+                        if column not in custom_columns:
+                            seen[column] = None
+    return list(seen)
@@ -0,0 +1,179 @@
+import ast
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Compact dtype kinds:
+#   text:     free text, as Arrow strings rather than one Python object per cell. Numbers are
+#             left as they are, and a mix of text and numbers becomes a category.
+#   category: an enumeration, stored once per distinct value with a small integer code per row.
+#   auto:     a category if values repeat enough, text otherwise.
+#   flag:     'True'/'False' values, as a nullable boolean. Left as a category if it has other values.
+#   tags:     tag lists, as a category of their text, so each distinct list is held once.
+#             tag_bits encodes them as a bitset per row for vectorized tag checks.
+#   float:    a number.
+TEXT = 'text'
+CATEGORY = 'category'
+AUTO = 'auto'
+FLAG = 'flag'
+TAGS = 'tags'
+FLOAT = 'float'
+
+# Columns of the cleaned frames and their kinds. Columns not listed keep their dtype,
+# apart from the other object and string columns of a frame compacted with other=AUTO.
+GHL_CONTACT_DTYPES = {
+    'contactName': TEXT,
+    'companyName': TEXT,
+    'email': TEXT,
+    'phone': TEXT,
+    'source': CATEGORY,
+    'tags': TAGS,
+    'Business_in_AU': CATEGORY,
+    'Handset_Count': CATEGORY,
+    'Ad_Name': CATEGORY,
+    'Ph_verified': FLAG,
+    'Qualified': FLAG,
+}
+ZCRM_LEAD_DTYPES = {
+    'Company': TEXT,
+    'Lead_Number': TEXT,
+    'Lead_Source': CATEGORY,
+    'Lead_Status': CATEGORY,
+}
+ZCRM_DEAL_DTYPES = {
+    'Deal_Name': TEXT,
+    'Stage': CATEGORY,
+    'Amount': FLOAT,
+    'Grand_Total': FLOAT,
+    'Monthly_Sub_Total': FLOAT,
+    'Octane_ID': TEXT,
+    'Deal_Type': CATEGORY,
+    'Handsets_Required': CATEGORY,
+    'Lines_Required': CATEGORY,
+}
+
+# An 'auto' column becomes a category when it has at most this many distinct values per row.
+CATEGORY_MAX_RATIO = 0.5
+
+_TRUE_VALUES = ['True', True]
+_FALSE_VALUES = ['False', False]
+
+
+def _tags_text(tags) -> str:
+    # The text a tag list is written to CSV as
+    return str(list(tags)) if isinstance(tags, (list, tuple)) else tags
+
+
+def parse_tags(text) -> list:
+    """
+    Read a tag list back from its text in a compacted tags column.
+
+    Args:
+        text: The tag list text, e.g. "['b4b', 'phone verified']".
+
+    Returns:
+        list: The tags, empty if the text is missing or not a list.
+    """
+    try:
+        tags = ast.literal_eval(text) if isinstance(text, str) else text
+    except (ValueError, SyntaxError):
+        return []
+    return list(tags) if isinstance(tags, (list, tuple, set)) else []
+
+
+def tag_bits(tags: pd.Series, vocabulary: list) -> np.ndarray:
+    """
+    Encode a tags column as a bitset per row over a vocabulary of up to 64 tags.
+
+    Bit i of a row is set when the row's tags include vocabulary[i], so tag checks
+    become vectorized bit tests. A compacted column is encoded once per distinct
+    tag list and the rows take their list's bits by category code; a column of
+    lists is exploded through Arrow.
+
+    Args:
+        tags (pd.Series): The tags column, compacted or of lists.
+        vocabulary (list): The tags to encode.
+
+    Returns:
+        np.ndarray: A uint64 bitset per row, 0 for missing tags.
+    """
+    if len(vocabulary) > 64:
+        raise ValueError(f"At most 64 tags can be encoded, got {len(vocabulary)}")
+    if isinstance(tags.dtype, pd.CategoricalDtype):
+        lists = pd.Series([parse_tags(text) for text in tags.cat.categories], dtype=object)
+        # The extra 0 is for the missing values' code of -1
+        return np.append(tag_bits(lists, vocabulary), np.uint64(0))[tags.cat.codes.to_numpy()]
+
+    lists = pa.array([list(value) if isinstance(value, (list, tuple, set)) else None for value in tags],
+                     type=pa.list_(pa.string()))
+    flat = pc.list_flatten(lists)
+    rows = pc.list_parent_indices(lists).to_numpy()
+    positions = pc.index_in(flat, value_set=pa.array(vocabulary, type=pa.string()))
+    found = positions.is_valid().to_numpy(zero_copy_only=False)
+    bits = np.zeros(len(tags), dtype=np.uint64)
+    np.bitwise_or.at(bits, rows[found],
+                     np.left_shift(np.uint64(1), positions.drop_null().to_numpy().astype(np.uint64)))
+    return bits
+
+
+def compact_column(values: pd.Series, kind: str) -> pd.Series:
+    """
+    Convert a column to the compact dtype of its kind.
+
+    The values written to CSV stay the same: categories and Arrow strings print as
+    their values, booleans as 'True' and 'False', and tag lists as the list text.
+
+    Args:
+        values (pd.Series): The column.
+        kind (str): The compact dtype kind.
+
+    Returns:
+        pd.Series: The converted column.
+    """
+    if kind == TEXT:
+        # Numbers would be written differently as text, e.g. 100396.0 as '100396'
+        if pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+            return values if values.dtype != object else values.astype('category')
+        return values.astype(pd.StringDtype('pyarrow'))
+    if kind == CATEGORY:
+        return values.astype('category')
+    if kind == AUTO:
+        distinct = values.nunique()
+        return compact_column(values, CATEGORY if distinct <= CATEGORY_MAX_RATIO * len(values) else TEXT)
+    if kind == FLAG:
+        true = values.isin(_TRUE_VALUES).to_numpy(dtype=bool)
+        false = values.isin(_FALSE_VALUES).to_numpy(dtype=bool)
+        # Numbers are not flags, even when they equal True and False
+        numeric = pd.api.types.infer_dtype(values, skipna=True) in ('integer', 'floating', 'decimal')
+        if numeric or not (true | false | values.isna().to_numpy()).all():
+            return values.astype('category')
+        return pd.Series(pd.arrays.BooleanArray(true, ~(true | false)), index=values.index, name=values.name)
+    if kind == TAGS:
+        return values.map(_tags_text, na_action='ignore').astype('category')
+    if kind == FLOAT:
+        return pd.to_numeric(values, errors='coerce').astype('float64')
+    raise ValueError(f"Unknown compact dtype kind: {kind}")
+
+
+def compact_frame(frame: pd.DataFrame, dtypes: dict, other: str = None) -> pd.DataFrame:
+    """
+    Convert a frame's columns to compact dtypes in place.
+
+    Args:
+        frame (pd.DataFrame): The frame.
+        dtypes (dict): Column -> compact dtype kind; columns the frame does not have are skipped.
+        other (str): The kind for the frame's other object and string columns, which keep their dtype if not given.
+
+    Returns:
+        pd.DataFrame: The frame.
+    """
+    kinds = {column: kind for column, kind in dtypes.items() if column in frame}
+    if other:
+        for column in frame.columns:
+            if column not in kinds and (frame[column].dtype == object or isinstance(frame[column].dtype, pd.StringDtype)):
+                kinds[column] = other
+    for column, kind in kinds.items():
+        frame[column] = compact_column(frame[column], kind)
+    return frame
@@ -0,0 +1,255 @@
+import numpy as np
+import pandas as pd
+
+from .deal_matching import MATCH_KEYS
+
+# Candidate pairs scoring at least this are matched.
+FUZZY_THRESHOLD = 0.85
+# Deals either side of a contact's place in the sorted names that it is compared with.
+NEIGHBOURHOOD = 3
+# Phone and email domain blocks shared by more deals than this are skipped: a
+# free-mail domain or a placeholder number says nothing about who the contact is.
+MAX_BLOCK_SIZE = 50
+# Trailing digits of the E.164 phone keys compared in the phone block.
+PHONE_SUFFIX_DIGITS = 8
+# Size of the hashed trigram sets that keys are compared by, and the multiplier hashing
+# trigrams into them. Unrelated keys share few bits at this size.
+SIGNATURE_BITS = 512
+TRIGRAM_HASH = np.uint64(0x9E3779B97F4A7C15)
+# Keys are compared on their first MAX_KEY_LENGTH characters.
+MAX_KEY_LENGTH = 64
+# Keys hashed per batch, bounding the size of the code point matrix.
+BATCH_SIZE = 100_000
+
+
+def trigram_signatures(keys: np.ndarray) -> np.ndarray:
+    """
+    Hash each key's character trigrams into a SIGNATURE_BITS-bit set.
+
+    Keys are padded with two spaces in front and one behind, so short keys and word
+    starts count, and cut at MAX_KEY_LENGTH characters. The work is done on a
+    code point matrix, BATCH_SIZE keys at a time, without a Python loop per key.
+
+    Args:
+        keys (np.ndarray): The keys as an object array, None where missing.
+
+    Returns:
+        np.ndarray: An (n, SIGNATURE_BITS // 64) uint64 array, all zero where the key is missing.
+    """
+    signatures = np.zeros((len(keys), SIGNATURE_BITS // 64), dtype=np.uint64)
+    for start in range(0, len(keys), BATCH_SIZE):
+        batch = keys[start:start + BATCH_SIZE]
+        present = np.array([key is not None for key in batch], dtype=bool)
+        if not present.any():
+            continue
+        text = np.asarray([key[:MAX_KEY_LENGTH] for key in batch[present]], dtype=str)
+        width = text.dtype.itemsize // 4
+        codes = text.view(np.uint32).reshape(len(text), width).astype(np.uint64)
+        lengths = (codes != 0).sum(axis=1)
+
+        padded = np.zeros((len(text), width + 3), dtype=np.uint64)
+        padded[:, :2] = ord(' ')
+        padded[:, 2:width + 2] = codes
+        padded[np.arange(len(text)), lengths + 2] = ord(' ')
+
+        grams = (padded[:, :-2] << np.uint64(42)) ^ (padded[:, 1:-1] << np.uint64(21)) ^ padded[:, 2:]
+        buckets = (grams * TRIGRAM_HASH) >> np.uint64(64 - SIGNATURE_BITS.bit_length() + 1)
+        valid = np.arange(width + 1) < (lengths + 1)[:, None]
+        bits = np.left_shift(np.uint64(1), buckets & np.uint64(63))
+        words = (buckets >> np.uint64(6)).astype(np.int64)
+        rows = signatures[start:start + BATCH_SIZE]
+        batch_signatures = np.zeros((len(text), rows.shape[1]), dtype=np.uint64)
+        for word in range(rows.shape[1]):
+            batch_signatures[:, word] = np.bitwise_or.reduce(np.where(valid & (words == word), bits, 0), axis=1)
+        rows[present] = batch_signatures
+    return signatures
+
+
+def signature_similarities(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """
+    Score pairs of trigram signatures by their Dice coefficient, 0 where either is empty.
+
+    Args:
+        left (np.ndarray): The left signatures, from trigram_signatures.
+        right (np.ndarray): The right signatures, one per left signature.
+
+    Returns:
+        np.ndarray: The similarity of each pair, between 0 and 1.
+    """
+    shared = np.bitwise_count(left & right).sum(axis=1, dtype=np.int64)
+    sizes = np.bitwise_count(left).sum(axis=1, dtype=np.int64) + np.bitwise_count(right).sum(axis=1, dtype=np.int64)
+    return np.divide(2 * shared, sizes, out=np.zeros(len(left)), where=sizes > 0)
+
+
+def _key_array(values: pd.Series) -> np.ndarray:
+    return values.to_numpy(dtype=object, na_value=None)
+
+
+def _email_domains(values: pd.Series) -> pd.Series:
+    return values.str.split('@', n=1).str[1]
+
+
+def _phone_suffixes(values: pd.Series) -> pd.Series:
+    suffixes = values.str[-PHONE_SUFFIX_DIGITS:]
+    return suffixes.where(values.str.len() >= PHONE_SUFFIX_DIGITS)
+
+
+class FuzzyDealMatcher:
+    """
+    Matches contacts to deals on similar, rather than equal, names, emails and phones.
+
+    Comparing every contact with every deal would be quadratic, so each contact is
+    only compared with candidate deals from blocking indexes built once per deals
+    frame:
+
+    * the deals sharing its phone number's last PHONE_SUFFIX_DIGITS digits,
+    * the deals sharing its email domain,
+    * the NEIGHBOURHOOD deals either side of its name in the sorted deal names, and
+      in the sorted reversed names, so a typo near the start still finds neighbours.
+
+    A candidate pair scores the mean trigram Dice similarity of the name, email and
+    phone keys present on both sides, so one similar key does not outweigh two that
+    disagree. Keys are compared as hashed trigram bit sets, so scoring is vectorized.
+    A contact takes the best-scoring deal at or above the threshold, the earliest
+    deal on ties, and the score is its match confidence.
+    """
+
+    def __init__(self, deals: pd.DataFrame, match_keys: list = None, threshold: float = FUZZY_THRESHOLD,
+                 neighbourhood: int = NEIGHBOURHOOD, max_block_size: int = MAX_BLOCK_SIZE):
+        """
+        Build the blocking indexes.
+
+        Args:
+            deals (pd.DataFrame): The cleaned Zoho CRM deals data, with the normalized deal keys.
+            match_keys (list): (contact key, deal key) pairs for the name, email and phone keys.
+            threshold (float): The lowest similarity, between 0 and 1, that counts as a match.
+            neighbourhood (int): The deals either side of a contact's name that are compared with it.
+            max_block_size (int): The most deals a phone or email domain block may hold.
+        """
+        deals = deals.reset_index(drop=True)
+        (self.name_key, deal_name), (self.email_key, deal_email), (self.phone_key, deal_phone) = \
+            match_keys or MATCH_KEYS
+        self.threshold = threshold
+        self.neighbourhood = neighbourhood
+        self.deal_signatures = [trigram_signatures(_key_array(deals[key])) for key in (deal_name, deal_email, deal_phone)]
+
+        names = deals[deal_name].dropna()
+        self.name_order = self._sorted(names.to_numpy(dtype=object), names.index.to_numpy())
+        reversed_names = np.array([name[::-1] for name in names], dtype=object)
+        self.reversed_order = self._sorted(reversed_names, names.index.to_numpy())
+
+        self.phone_blocks = self._blocks(_phone_suffixes(deals[deal_phone]), max_block_size)
+        self.email_blocks = self._blocks(_email_domains(deals[deal_email]), max_block_size)
+
+    @staticmethod
+    def _sorted(keys: np.ndarray, positions: np.ndarray) -> tuple:
+        order = np.argsort(keys, kind='stable')
+        return keys[order], positions[order]
+
+    @staticmethod
+    def _blocks(blocks: pd.Series, max_block_size: int) -> pd.DataFrame:
+        table = pd.DataFrame({'block': blocks.astype(object), 'deal': np.arange(len(blocks))}).dropna()
+        sizes = table.groupby('block')['deal'].transform('size')
+        return table[sizes <= max_block_size]
+
+    def _neighbours(self, order: tuple, keys: np.ndarray, rows: np.ndarray) -> tuple:
+        sorted_keys, positions = order
+        if len(sorted_keys) == 0 or len(keys) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        at = np.searchsorted(sorted_keys, keys)
+        # A key's insertion point is the first deal at or after it, so offsets -n to n - 1
+        # take the n deals before it and the n from it on
+        offsets = np.arange(-self.neighbourhood, self.neighbourhood)
+        slots = (at[:, None] + offsets).ravel()
+        pair_rows = np.repeat(rows, len(offsets))
+        valid = (slots >= 0) & (slots < len(sorted_keys))
+        return pair_rows[valid], positions[slots[valid]]
+
+    @staticmethod
+    def _block_pairs(blocks: pd.Series, rows: np.ndarray, table: pd.DataFrame) -> tuple:
+        contacts = pd.DataFrame({'block': blocks.astype(object), 'row': rows}).dropna()
+        pairs = contacts.merge(table, on='block')
+        return pairs['row'].to_numpy(dtype=np.int64), pairs['deal'].to_numpy(dtype=np.int64)
+
+    def candidates(self, contacts: pd.DataFrame, rows: np.ndarray) -> pd.DataFrame:
+        """
+        Collect the candidate deals of the given contacts from the blocking indexes.
+
+        Args:
+            contacts (pd.DataFrame): Contacts carrying the normalized contact keys.
+            rows (np.ndarray): The positions of the contacts to find candidates for.
+
+        Returns:
+            pd.DataFrame: The distinct candidate pairs, as 'row' and 'deal' positions.
+        """
+        subset = contacts.iloc[rows]
+        names = subset[self.name_key].dropna()
+        name_rows = rows[subset[self.name_key].notna().to_numpy()]
+        name_keys = names.to_numpy(dtype=object)
+        reversed_keys = np.array([name[::-1] for name in name_keys], dtype=object)
+
+        pairs = [
+            self._neighbours(self.name_order, name_keys, name_rows),
+            self._neighbours(self.reversed_order, reversed_keys, name_rows),
+            self._block_pairs(_phone_suffixes(subset[self.phone_key]), rows, self.phone_blocks),
+            self._block_pairs(_email_domains(subset[self.email_key]), rows, self.email_blocks),
+        ]
+        candidates = pd.DataFrame({
+            'row': np.concatenate([pair_rows for pair_rows, _ in pairs]),
+            'deal': np.concatenate([deals for _, deals in pairs]),
+        })
+        return candidates.drop_duplicates(ignore_index=True)
+
+    def score(self, contacts: pd.DataFrame, candidates: pd.DataFrame) -> np.ndarray:
+        """
+        Score candidate pairs by the mean trigram similarity of the keys both sides have.
+
+        Args:
+            contacts (pd.DataFrame): Contacts carrying the normalized contact keys.
+            candidates (pd.DataFrame): The candidate pairs, as 'row' and 'deal' positions.
+
+        Returns:
+            np.ndarray: The similarity of each pair, between 0 and 1.
+        """
+        # Each candidate contact is hashed once, however many deals it is paired with
+        rows, pair_rows = np.unique(candidates['row'].to_numpy(), return_inverse=True)
+        deals = candidates['deal'].to_numpy()
+        totals = np.zeros(len(candidates))
+        compared = np.zeros(len(candidates))
+        for key, deal_signatures in zip((self.name_key, self.email_key, self.phone_key), self.deal_signatures):
+            contact_signatures = trigram_signatures(_key_array(contacts[key])[rows])[pair_rows]
+            pair_deal_signatures = deal_signatures[deals]
+            # Keys missing on either side are left out rather than counted as a mismatch
+            present = contact_signatures.any(axis=1) & pair_deal_signatures.any(axis=1)
+            totals += signature_similarities(contact_signatures, pair_deal_signatures)
+            compared += present
+        return np.divide(totals, compared, out=np.zeros(len(candidates)), where=compared > 0)
+
+    def resolve(self, contacts: pd.DataFrame, positions: np.ndarray, confidence: np.ndarray) -> tuple:
+        """
+        Fuzzy match the contacts that the exact keys left unmatched.
+
+        Args:
+            contacts (pd.DataFrame): Contacts carrying the normalized contact keys.
+            positions (np.ndarray): The exact-match deal position per contact, -1 where unmatched.
+            confidence (np.ndarray): The match confidence per contact, NaN where unmatched.
+
+        Returns:
+            tuple: The updated deal positions and match confidences.
+        """
+        unresolved = np.flatnonzero(positions < 0)
+        if len(unresolved) == 0:
+            return positions, confidence
+
+        candidates = self.candidates(contacts, unresolved)
+        candidates['score'] = self.score(contacts, candidates)
+        best = (candidates[candidates['score'] >= self.threshold]
+                .sort_values(['row', 'score', 'deal'], ascending=[True, False, True])
+                .drop_duplicates('row'))
+
+        positions = positions.copy()
+        confidence = confidence.copy()
+        rows = best['row'].to_numpy()
+        positions[rows] = best['deal'].to_numpy()
+        confidence[rows] = best['score'].to_numpy()
+        return positions, confidence
@@ -0,0 +1,267 @@
+import threading
+import time
+
+import pandas as pd
+
+from .campaign_rollup import UNRANKED, CampaignRollup, campaign_contributions
+from .deal_matching import MATCH_KEYS
+
+# The column cleaned contacts carry their GHL contact ID in, through joining and ranking.
+CONTACT_ID = 'contact_id'
+# Columns of a contact's ranked rows kept for the query API, on top of its campaign contribution.
+RANK_COLUMNS = ['ranking_desc', 'Stage', 'Amount', 'match_confidence']
+
+CONTACT_KEYS = [contact_key for contact_key, _ in MATCH_KEYS]
+
+
+def _records(frame: pd.DataFrame) -> list:
+    # JSON-ready rows, None where missing, with the index as a column if it is named
+    frame = frame.reset_index(drop=frame.index.name is None)
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+class LiveRanker:
+    """
+    Ranked contacts kept in memory and re-ranked as contacts and deals change.
+
+    Starts from the cleaned and ranked stored data. A contact update cleans and ranks
+    that contact on its own; a deal update changes the deal in a LiveDealIndex and
+    re-ranks only the contacts whose name, email or phone key the deal had or has.
+    Each re-ranked contact's campaign contribution is swapped in a CampaignRollup, so
+    campaign totals follow the contacts without being rebuilt.
+
+    Contacts from the stored data stay in the frames they were ranked in; contacts
+    changed since are kept apart, one small frame each. Leads are not updated.
+
+    The cleaning and ranking steps are passed in, so the rows match a batch run's. All
+    methods are thread safe.
+    """
+
+    def __init__(self, cleaned: pd.DataFrame, ranked: pd.DataFrame, deal_index, clean_contacts, clean_deals, rank):
+        """
+        Args:
+            cleaned (pd.DataFrame): The cleaned stored contacts, with their IDs in the CONTACT_ID column.
+            ranked (pd.DataFrame): The cleaned contacts joined and ranked.
+            deal_index (LiveDealIndex): The deals the contacts were matched with.
+            clean_contacts: Function cleaning a list of GHL contacts, as the API returns them, into a frame like cleaned.
+            clean_deals: Function cleaning a list of Zoho CRM deals, as the API returns them, into a frame.
+            rank: Function joining and ranking cleaned contacts with a deal index, into a frame like ranked.
+        """
+        self.cleaned = cleaned.reset_index(drop=True)
+        self.positions = {contact_id: position for position, contact_id in enumerate(self.cleaned[CONTACT_ID])}
+        self.ranks = self._ranks(ranked)
+        self.deal_index = deal_index
+        self.clean_contacts = clean_contacts
+        self.clean_deals = clean_deals
+        self.rank = rank
+        # Contacts changed since start up: ID -> (cleaned rows, rank rows), empty once deleted
+        self.changed = {}
+        self.lock = threading.Lock()
+        self.stats = {'contact_events': 0, 'deal_events': 0, 'reranked': 0, 'last_update_ms': None}
+
+        # Key value -> the IDs of the contacts carrying it, to find the contacts a deal can match
+        self.key_contacts = {key: {} for key in CONTACT_KEYS}
+        for key in CONTACT_KEYS:
+            lookup = self.key_contacts[key]
+            for value, contact_id in zip(self.cleaned[key].to_numpy(dtype=object, na_value=None), self.cleaned[CONTACT_ID]):
+                if value is not None:
+                    lookup.setdefault(value, []).append(contact_id)
+
+        self.rollup = CampaignRollup(directory=None)
+        self.rollup.apply(self.ranks.iloc[:0], self.ranks)
+
+    @staticmethod
+    def _ranks(ranked: pd.DataFrame) -> pd.DataFrame:
+        ranks = campaign_contributions(ranked).drop(columns='identity')
+        for column in RANK_COLUMNS:
+            ranks[column] = ranked[column].to_numpy() if column in ranked else None
+        ranks.index = pd.Index(ranked[CONTACT_ID].to_numpy(dtype=object), name=CONTACT_ID)
+        return ranks
+
+    def _current(self, contact_id: str) -> tuple:
+        # The contact's cleaned rows and rank rows
+        if contact_id in self.changed:
+            return self.changed[contact_id]
+        position = self.positions.get(contact_id)
+        if position is None:
+            return self.cleaned.iloc[:0], self.ranks.iloc[:0]
+        return self.cleaned.iloc[[position]], self.ranks.loc[[contact_id]]
+
+    def _index_keys(self, cleaned: pd.DataFrame, contact_id: str, add: bool) -> None:
+        for key in CONTACT_KEYS:
+            lookup = self.key_contacts[key]
+            for value in cleaned[key].to_numpy(dtype=object, na_value=None):
+                if value is None:
+                    continue
+                if add:
+                    lookup.setdefault(value, []).append(contact_id)
+                elif contact_id in lookup.get(value, ()):
+                    lookup[value].remove(contact_id)
+
+    def _replace(self, contact_id: str, cleaned: pd.DataFrame, ranks: pd.DataFrame) -> None:
+        previous_cleaned, previous_ranks = self._current(contact_id)
+        self.rollup.apply(previous_ranks, ranks)
+        if cleaned is not previous_cleaned:
+            self._index_keys(previous_cleaned, contact_id, add=False)
+            self._index_keys(cleaned, contact_id, add=True)
+        self.changed[contact_id] = (cleaned, ranks)
+
+    def _rank_into(self, cleaned: pd.DataFrame, contact_ids: list) -> dict:
+        # Rank cleaned contacts together and file each one's rank rows under its ID
+        ranked = self.rank(cleaned, self.deal_index) if len(cleaned) else None
+        ranks = self._ranks(ranked) if ranked is not None else self.ranks.iloc[:0]
+        rows = dict(iter(ranks.groupby(level=CONTACT_ID, sort=False)))
+        cleaned_rows = dict(iter(cleaned.groupby(CONTACT_ID, sort=False, observed=True))) if len(cleaned) else {}
+        for contact_id in contact_ids:
+            self._replace(contact_id, cleaned_rows.get(contact_id, cleaned.iloc[:0]),
+                          rows.get(contact_id, self.ranks.iloc[:0]))
+        return {contact_id: self._best(contact_id) for contact_id in contact_ids}
+
+    def _rerank(self, contact_ids: set) -> dict:
+        # Stored contacts are ranked together, changed ones each in their own frame
+        changed = [contact_id for contact_id in contact_ids if contact_id in self.changed]
+        stored = [contact_id for contact_id in contact_ids if contact_id not in self.changed and contact_id in self.positions]
+        rankings = {}
+        if stored:
+            rows = self.cleaned.iloc[[self.positions[contact_id] for contact_id in stored]]
+            rankings.update(self._rank_into(rows, stored))
+        for contact_id in changed:
+            rankings.update(self._rank_into(self.changed[contact_id][0], [contact_id]))
+        self.stats['reranked'] += len(rankings)
+        return rankings
+
+    def _best(self, contact_id: str):
+        ranking = self._current(contact_id)[1]['ranking']
+        ranking = ranking[ranking != UNRANKED]
+        return int(ranking.max()) if len(ranking) else None
+
+    def _timed(self, started: float, rankings: dict) -> dict:
+        self.stats['last_update_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return rankings
+
+    def update_contacts(self, contacts: list) -> dict:
+        """
+        Clean and rank created or updated GHL contacts in place of their previous versions.
+
+        Contacts from excluded sources are removed.
+
+        Args:
+            contacts (list): The contacts, as the GHL API returns them.
+
+        Returns:
+            dict: Contact ID -> its new best ranking, None if unranked or removed.
+        """
+        started = time.perf_counter()
+        with self.lock:
+            self.stats['contact_events'] += 1
+            cleaned = self.clean_contacts(contacts)
+            return self._timed(started, self._rank_into(cleaned, [contact['id'] for contact in contacts]))
+
+    def remove_contacts(self, contact_ids: list) -> dict:
+        """
+        Remove deleted GHL contacts.
+
+        Args:
+            contact_ids (list): The contacts' IDs.
+
+        Returns:
+            dict: Contact ID -> None.
+        """
+        started = time.perf_counter()
+        with self.lock:
+            self.stats['contact_events'] += 1
+            for contact_id in contact_ids:
+                self._replace(contact_id, self.cleaned.iloc[:0], self.ranks.iloc[:0])
+            return self._timed(started, {contact_id: None for contact_id in contact_ids})
+
+    def _deal_contacts(self, *deals) -> set:
+        # The contacts carrying any key of the deals
+        contact_ids = set()
+        for deal in deals:
+            if deal is not None:
+                for key, value in self.deal_index.keys(deal).items():
+                    contact_ids.update(self.key_contacts[key].get(value, ()))
+        return contact_ids
+
+    def update_deals(self, deals: list) -> dict:
+        """
+        Add or change Zoho CRM deals and re-rank the contacts they matched before or match now.
+
+        Args:
+            deals (list): The deals, as the Zoho CRM API returns them, with their 'id'.
+
+        Returns:
+            dict: Re-ranked contact ID -> its new best ranking.
+        """
+        started = time.perf_counter()
+        with self.lock:
+            self.stats['deal_events'] += 1
+            cleaned = self.clean_deals(deals)
+            rows = cleaned.astype(object).where(cleaned.notna(), None).to_dict('records')
+            affected = set()
+            for deal, row in zip(deals, rows):
+                previous = self.deal_index.upsert(deal['id'], row)
+                affected |= self._deal_contacts(previous, row)
+            return self._timed(started, self._rerank(affected))
+
+    def remove_deals(self, deal_ids: list) -> dict:
+        """
+        Remove deleted Zoho CRM deals and re-rank the contacts they matched.
+
+        Args:
+            deal_ids (list): The deals' IDs.
+
+        Returns:
+            dict: Re-ranked contact ID -> its new best ranking.
+        """
+        started = time.perf_counter()
+        with self.lock:
+            self.stats['deal_events'] += 1
+            affected = self._deal_contacts(*(self.deal_index.remove(deal_id) for deal_id in deal_ids))
+            return self._timed(started, self._rerank(affected))
+
+    def contact(self, contact_id: str):
+        """
+        Look up a contact's current ranking.
+
+        Args:
+            contact_id (str): The GHL contact ID.
+
+        Returns:
+            dict: The best 'ranking' (None if unranked) and its 'ranking_desc', and the contact's
+            ranked 'rows', one per matched lead; None if the contact is unknown or removed.
+        """
+        with self.lock:
+            ranks = self._current(contact_id)[1]
+            if not len(ranks):
+                return None
+            rows = _records(ranks)
+        for row in rows:
+            row['ranking'] = None if row['ranking'] == UNRANKED else row['ranking']
+        best = max(rows, key=lambda row: -1 if row['ranking'] is None else row['ranking'])
+        return {'id': contact_id, 'ranking': best['ranking'], 'ranking_desc': best['ranking_desc'], 'rows': rows}
+
+    def campaigns(self, filters: dict = None) -> list:
+        """
+        Look up the current campaign rollup.
+
+        Args:
+            filters (dict): Campaign column -> value the campaigns must have.
+
+        Returns:
+            list: The campaigns' report rows, highest value score first.
+        """
+        with self.lock:
+            return _records(self.rollup.report(filters))
+
+    def status(self) -> dict:
+        """Return the number of contacts and deals held and the event counts."""
+        with self.lock:
+            removed = sum(1 for cleaned, _ in self.changed.values() if not len(cleaned))
+            added = sum(1 for contact_id in self.changed if contact_id not in self.positions)
+            return {
+                'contacts': len(self.positions) + added - removed,
+                'deals': sum(1 for row in self.deal_index.rows if row is not None),
+                'changed_contacts': len(self.changed),
+                **self.stats,
+            }
@@ -0,0 +1,173 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Numbers without a country code are taken to be Australian.
+DEFAULT_COUNTRY_CODE = '61'
+# Digits in a national number after the trunk prefix '0', e.g. 4xx xxx xxx.
+NATIONAL_NUMBER_DIGITS = 9
+
+_NON_DIGITS = re.compile(r'\D')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _is_missing(value) -> bool:
+    return value is None or value is pd.NA or (isinstance(value, float) and np.isnan(value))
+
+
+def phone_key(value, country_code: str = DEFAULT_COUNTRY_CODE):
+    """
+    Convert a phone number to E.164 form, e.g. '0412 345 678' -> '+61412345678'.
+
+    Spaces, punctuation and a '.0' left by numbers read as floats are dropped.
+    National numbers with a trunk '0', or with it lost to a numeric column, get the
+    country code; numbers with '+', '00' or the country code already carry one.
+
+    Args:
+        value: The phone number as text or a number.
+        country_code (str): The country code of national numbers.
+
+    Returns:
+        str: The E.164 number, or None if the value has no digits or none after the prefix.
+    """
+    if _is_missing(value):
+        return None
+    text = str(value).strip()
+    if text.endswith('.0'):
+        text = text[:-2]
+    digits = _NON_DIGITS.sub('', text)
+    if not digits:
+        return None
+
+    if text.startswith('+'):
+        key = '+' + digits
+    elif digits.startswith('00'):
+        key = '+' + digits[2:]
+    elif digits.startswith(country_code) and len(digits) == len(country_code) + NATIONAL_NUMBER_DIGITS:
+        key = '+' + digits
+    elif digits.startswith('0'):
+        key = '+' + country_code + digits[1:]
+    elif len(digits) == NATIONAL_NUMBER_DIGITS:
+        key = '+' + country_code + digits
+    else:
+        key = '+' + digits
+    # Nothing left after the prefix, e.g. from '0' or '00', is no number
+    return None if key in ('+', '+' + country_code) else key
+
+
+def email_key(value):
+    """
+    Trim and lowercase an email address.
+
+    Args:
+        value: The email address.
+
+    Returns:
+        str: The normalized address, or None if it is missing or blank.
+    """
+    if _is_missing(value):
+        return None
+    return str(value).strip().lower() or None
+
+
+def name_key(value):
+    """
+    Lowercase a name and collapse its whitespace, e.g. ' Jane  SMITH ' -> 'jane smith'.
+
+    Args:
+        value: The name.
+
+    Returns:
+        str: The normalized name, or None if it is missing or blank.
+    """
+    if _is_missing(value):
+        return None
+    return _WHITESPACE.sub(' ', str(value)).strip().lower() or None
+
+
+def _arrow_strings(values: pd.Series) -> pa.Array:
+    # Numbers, e.g. phones read as floats, are taken as their text
+    return pa.array(values.astype('string'), type=pa.string(), from_pandas=True)
+
+
+def _key_series(keys: pa.Array, values: pd.Series) -> pd.Series:
+    # Blank keys are missing, so they never match each other
+    keys = pc.if_else(pc.equal(keys, ''), pa.scalar(None, pa.string()), keys)
+    return pd.Series(pd.arrays.ArrowStringArray(keys), index=values.index, name=values.name)
+
+
+def _prefixed(prefix: str, digits):
+    return pc.binary_join_element_wise(prefix, digits, '')
+
+
+def normalize_phones(values: pd.Series, country_code: str = DEFAULT_COUNTRY_CODE) -> pd.Series:
+    """
+    Normalize a phone column to E.164 keys, as phone_key does for one value.
+
+    Args:
+        values (pd.Series): The phone numbers.
+        country_code (str): The country code of national numbers.
+
+    Returns:
+        pd.Series: The keys as an Arrow string column, missing where there are no digits.
+    """
+    text = pc.utf8_trim_whitespace(_arrow_strings(values))
+    text = pc.if_else(pc.ends_with(text, '.0'), pc.utf8_slice_codeunits(text, 0, -2), text)
+    digits = pc.replace_substring_regex(text, r'\D', '')
+    length = pc.utf8_length(digits)
+
+    conditions = pc.make_struct(
+        pc.starts_with(text, '+'),
+        pc.starts_with(digits, '00'),
+        pc.and_(pc.starts_with(digits, country_code),
+                pc.equal(length, len(country_code) + NATIONAL_NUMBER_DIGITS)),
+        pc.starts_with(digits, '0'),
+        pc.equal(length, NATIONAL_NUMBER_DIGITS),
+        field_names=['international', 'exit_code', 'country_code', 'trunk', 'national'],
+    )
+    keys = pc.case_when(
+        conditions,
+        _prefixed('+', digits),
+        _prefixed('+', pc.utf8_slice_codeunits(digits, 2)),
+        _prefixed('+', digits),
+        _prefixed('+' + country_code, pc.utf8_slice_codeunits(digits, 1)),
+        _prefixed('+' + country_code, digits),
+        _prefixed('+', digits),
+    )
+    # Without digits, or with nothing left after the prefix, e.g. from '0' or '00', there is no number
+    keys = pc.if_else(pc.or_(pc.equal(length, 0), pc.is_in(keys, pa.array(['+', '+' + country_code]))),
+                      pa.scalar(None, pa.string()), keys)
+    return _key_series(keys, values)
+
+
+def normalize_emails(values: pd.Series) -> pd.Series:
+    """
+    Normalize an email column, as email_key does for one value.
+
+    Args:
+        values (pd.Series): The email addresses.
+
+    Returns:
+        pd.Series: The keys as an Arrow string column, missing where blank.
+    """
+    keys = pc.utf8_lower(pc.utf8_trim_whitespace(_arrow_strings(values)))
+    return _key_series(keys, values)
+
+
+def normalize_names(values: pd.Series) -> pd.Series:
+    """
+    Normalize a name column, as name_key does for one value.
+
+    Args:
+        values (pd.Series): The names.
+
+    Returns:
+        pd.Series: The keys as an Arrow string column, missing where blank.
+    """
+    keys = pc.utf8_trim_whitespace(_arrow_strings(values))
+    keys = pc.binary_join(pc.utf8_split_whitespace(keys), ' ')
+    keys = pc.utf8_lower(keys)
+    return _key_series(keys, values)
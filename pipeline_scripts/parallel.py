@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+# Partitions per worker, so that workers finishing early pick up the remaining work.
+PARTITIONS_PER_WORKER = 4
+# Read and write size when joining part files.
+COPY_BUFFER_BYTES = 1 << 20
+
+
+def available_cpus() -> int:
+    """Return the number of CPUs this process may run on."""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def partition_bounds(rows: int, workers: int, partition_size: int = None) -> list:
+    """
+    Split a frame's rows into contiguous partitions, in order.
+
+    Args:
+        rows (int): The number of rows.
+        workers (int): The number of worker processes.
+        partition_size (int): The rows per partition, PARTITIONS_PER_WORKER partitions per worker if not given.
+
+    Returns:
+        list: (start, stop) row positions of each partition; one empty partition if there are no rows.
+    """
+    partition_size = partition_size or max(1, -(-rows // (workers * PARTITIONS_PER_WORKER)))
+    return [(start, min(start + partition_size, rows)) for start in range(0, rows, partition_size)] or [(0, 0)]
+
+
+def shares_memory() -> bool:
+    """Return whether worker processes can inherit the parent's memory instead of receiving copies."""
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def process_pool(workers: int, initializer, initargs: tuple) -> ProcessPoolExecutor:
+    """
+    Start a pool of worker processes set up with read-only state from the parent.
+
+    Where the platform can fork, the workers inherit the initializer arguments
+    copy-on-write, so large state such as the deal index is built once and shared
+    rather than pickled. Elsewhere each worker receives a pickled copy at start up.
+
+    Args:
+        workers (int): The number of worker processes.
+        initializer: The function each worker runs first, with initargs.
+        initargs (tuple): The state for the initializer.
+
+    Returns:
+        ProcessPoolExecutor: The pool.
+    """
+    context = multiprocessing.get_context('fork' if shares_memory() else 'spawn')
+    return ProcessPoolExecutor(workers, mp_context=context, initializer=initializer, initargs=initargs)
+
+
+def concatenate_files(part_paths: list, file_path: str) -> None:
+    """
+    Join part files into one file, in the order given.
+
+    Args:
+        part_paths (list): The part files.
+        file_path (str): The file to write; it is replaced.
+    """
+    with open(file_path, 'wb') as output:
+        for part_path in part_paths:
+            with open(part_path, 'rb') as part:
+                shutil.copyfileobj(part, output, COPY_BUFFER_BYTES)
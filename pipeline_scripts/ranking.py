@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+from .frame_schema import tag_bits
+
+# Contacts from these sources are not ranked.
+EXCLUDED_SOURCES = ['b4b - no txt conf form', 'B4B Website Survey', 'bestforbusiness']
+
+RANKING_RULE_COLUMNS = ['band', 'tagged', 'response', 'sale', 'stage', 'ranking', 'ranking_desc']
+
+# Ranking rules, evaluated top to bottom; the first matching rule wins.
+#   band:     Handset_Count value, 'other' for any value not named by a rule, None for any.
+#   tagged:   whether the contact carries the 'phone verified' tag, None for either.
+#   response: 'responded' (phone verified or qualified), 'none' (neither field set), None for any.
+#   sale:     'sold' (has a deal amount), 'unsold' (no deal amount), None for either.
+#   stage:    the deal Stage the contact must have, None for any.
+# Contacts that match no rule get no ranking.
+RANKING_RULES = [
+    (None,    False, 'none',      'unsold', None,                   1,  'Spammer'),
+    (None,    None,  None,        None,     'Deal Timed Out',       0,  'Unknown'),
+    ('1-2',   None,  None,        'sold',   None,                   12, 'Sold and delivered'),
+    ('1-2',   None,  'responded', 'unsold', None,                   7,  '1-2 line | responded | no sale'),
+    ('1-2',   None,  'none',      None,     None,                   2,  '1-2 line | no response'),
+    ('3-4',   None,  None,        'sold',   'Checked & Signed Off', 12, 'Sold and delivered'),
+    ('3-4',   None,  'responded', 'unsold', None,                   8,  '3-4 line | responded | no sale'),
+    ('3-4',   None,  'none',      None,     None,                   3,  '3-4 line | no response'),
+    ('5-9',   None,  None,        'sold',   None,                   12, 'Sold and delivered'),
+    ('5-9',   None,  'responded', 'unsold', None,                   9,  '5-9 line | responded | no sale'),
+    ('5-9',   None,  'none',      None,     None,                   4,  '5-9 line | no response'),
+    ('10-24', None,  None,        'sold',   None,                   12, 'Sold and delivered'),
+    ('10-24', None,  'responded', 'unsold', None,                   10, '10-24 line | responded | no sale'),
+    ('10-24', None,  'none',      None,     None,                   5,  '10-24 line | no response'),
+    ('25+',   None,  None,        'sold',   None,                   12, 'Sold and delivered'),
+    ('25+',   None,  'responded', 'unsold', None,                   11, '25+ line | responded | no sale'),
+    ('25+',   None,  'none',      None,     None,                   6,  '25+ line | no response'),
+    ('other', None,  None,        None,     None,                   0,  'Unknown'),
+]
+
+
+def load_ranking_rules(file_path: str) -> pd.DataFrame:
+    """
+    Load a ranking rule table from a CSV file with the RANKING_RULE_COLUMNS headings.
+
+    Empty cells are treated as wildcards.
+
+    Args:
+        file_path (str): The CSV file to load.
+
+    Returns:
+        pd.DataFrame: The rule table.
+    """
+    return pd.read_csv(file_path, dtype={'band': str, 'stage': str})
+
+
+def _wildcard(value) -> bool:
+    return value is None or (not isinstance(value, str) and pd.isna(value))
+
+
+def _has_tag(tags: pd.Series, tag: str) -> np.ndarray:
+    return tag_bits(tags, [tag]) != 0
+
+
+def _is_true(values: pd.Series) -> np.ndarray:
+    if pd.api.types.is_bool_dtype(values.dtype):
+        return values.fillna(False).to_numpy(dtype=bool)
+    return (values == "True").to_numpy(dtype=bool)
+
+
+def rule_conditions(data: pd.DataFrame, rules) -> tuple:
+    """
+    Evaluate every rule as a column-wise boolean mask over the data.
+
+    Args:
+        data (pd.DataFrame): The joined contacts data.
+        rules: The rule table, as a DataFrame or a list of RANKING_RULE_COLUMNS tuples.
+
+    Returns:
+        tuple: The list of masks, the list of rankings and the list of descriptions.
+    """
+    rules = pd.DataFrame(rules, columns=RANKING_RULE_COLUMNS)
+
+    handset_count = data['Handset_Count']
+    stage = data['Stage']
+    ph_verified = data['Ph_verified']
+    qualified = data['Qualified']
+
+    sold = (data['Amount'].astype(str) != 'nan').to_numpy()
+    states = {
+        'tagged': {
+            True: _has_tag(data['tags'], 'phone verified'),
+        },
+        'response': {
+            'responded': _is_true(ph_verified) | _is_true(qualified),
+            'none': (ph_verified.isna() & qualified.isna()).to_numpy(),
+        },
+        'sale': {
+            'sold': sold,
+            'unsold': ~sold,
+        },
+    }
+    states['tagged'][False] = ~states['tagged'][True]
+
+    named_bands = [band for band in rules['band'] if not _wildcard(band) and band != 'other']
+    other_band = ~handset_count.isin(named_bands).to_numpy()
+
+    conditions = []
+    for rule in rules.itertuples(index=False):
+        mask = np.ones(len(data), dtype=bool)
+        if not _wildcard(rule.band):
+            mask &= other_band if rule.band == 'other' else (handset_count == rule.band).to_numpy()
+        if not _wildcard(rule.tagged):
+            mask &= states['tagged'][bool(rule.tagged)]
+        if not _wildcard(rule.response):
+            mask &= states['response'][rule.response]
+        if not _wildcard(rule.sale):
+            mask &= states['sale'][rule.sale]
+        if not _wildcard(rule.stage):
+            mask &= (stage == rule.stage).to_numpy()
+        conditions.append(mask)
+
+    return conditions, list(rules['ranking']), list(rules['ranking_desc'])
+
+
+def rank_contacts(data: pd.DataFrame, rules=None) -> tuple:
+    """
+    Rank every contact against the rule table.
+
+    Args:
+        data (pd.DataFrame): The joined contacts data.
+        rules: The rule table, defaults to RANKING_RULES.
+
+    Returns:
+        tuple: The ranking and ranking description series. Rankings are integers, or
+        floats with NaN when some contacts match no rule; their descriptions are None.
+    """
+    conditions, rankings, descriptions = rule_conditions(data, RANKING_RULES if rules is None else rules)
+
+    ranking = np.select(conditions, rankings, default=np.nan)
+    ranking_desc = np.select(conditions, descriptions, default=None)
+
+    ranking = pd.Series(ranking, index=data.index, name='ranking')
+    if not ranking.isna().any():
+        ranking = ranking.astype(np.int64)
+    return ranking, pd.Series(ranking_desc, index=data.index, name='ranking_desc', dtype=object)
@@ -0,0 +1,136 @@
+"""
+An HTTP service re-ranking contacts from GHL and Zoho CRM webhooks, and answering rank queries.
+
+Webhooks:
+    POST /webhooks/ghl   a GHL contact webhook: 'type' ContactCreate, ContactUpdate,
+                         ContactTagUpdate, ContactDndUpdate or ContactDelete, with the
+                         contact at the top level or under 'contact'
+    POST /webhooks/zcrm  a Zoho CRM notification: 'module' Deals, 'operation' insert,
+                         update or delete, the records under 'data' and, for deletes,
+                         their 'ids'
+Both answer with the re-ranked contacts' new best rankings under 'rankings' and the
+time taken under 'elapsed_ms', once the rankings are updated.
+
+Queries:
+    GET /contacts/ID     a contact's current ranking and ranked rows
+    GET /campaigns       the campaign rollup; utmCampaign, utmContent, Ad_Name and
+                         source query parameters select campaigns
+    GET /status          contact and deal counts and event totals
+
+Start it with 'python main.py serve'.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from .campaign_rollup import CAMPAIGN_COLUMNS
+
+CONTACT_UPDATE_EVENTS = {'ContactCreate', 'ContactUpdate', 'ContactTagUpdate', 'ContactDndUpdate'}
+CONTACT_DELETE_EVENTS = {'ContactDelete'}
+DEAL_UPDATE_OPERATIONS = {'insert', 'update'}
+DEAL_DELETE_OPERATIONS = {'delete'}
+
+
+class RankingServer(ThreadingHTTPServer):
+    """An HTTP server in front of a LiveRanker."""
+
+    daemon_threads = True
+
+    def __init__(self, ranker, address: tuple = ('127.0.0.1', 0)):
+        """
+        Args:
+            ranker (LiveRanker): The ranked contacts to update and query.
+            address (tuple): The host and port to listen on, port 0 picks a free one.
+        """
+        super().__init__(address, RankingHandler)
+        self.ranker = ranker
+
+    @property
+    def root_url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self) -> 'RankingServer':
+        """Serve requests on a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class RankingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this the body can wait on a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status: int = 200) -> None:
+        body = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip('/').split('/')
+        ranker = self.server.ranker
+
+        if len(parts) == 2 and parts[0] == 'contacts':
+            contact = ranker.contact(unquote(parts[1]))
+            if contact is None:
+                return self.send_json({'message': 'Unknown contact'}, 404)
+            return self.send_json(contact)
+        if parts == ['campaigns']:
+            query = parse_qs(url.query, keep_blank_values=True)
+            filters = {column: query[column][0] for column in CAMPAIGN_COLUMNS if column in query}
+            return self.send_json({'campaigns': ranker.campaigns(filters)})
+        if parts == ['status']:
+            return self.send_json(ranker.status())
+        self.send_json({'message': 'Not found'}, 404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip('/')
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            event = json.loads(body)
+        except ValueError:
+            return self.send_json({'message': 'The body is not JSON'}, 400)
+
+        started = time.perf_counter()
+        if path == '/webhooks/ghl':
+            rankings = self.contact_event(event)
+        elif path == '/webhooks/zcrm':
+            rankings = self.deal_event(event)
+        else:
+            return self.send_json({'message': 'Not found'}, 404)
+        if rankings is None:
+            return self.send_json({'message': 'Unsupported event'}, 422)
+        self.send_json({'rankings': rankings, 'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)})
+
+    def contact_event(self, event: dict):
+        contact = event.get('contact', event)
+        if not isinstance(contact, dict) or not contact.get('id'):
+            return None
+        if event.get('type') in CONTACT_DELETE_EVENTS:
+            return self.server.ranker.remove_contacts([contact['id']])
+        if event.get('type') in CONTACT_UPDATE_EVENTS:
+            return self.server.ranker.update_contacts([contact])
+        return None
+
+    def deal_event(self, event: dict):
+        if event.get('module') != 'Deals':
+            return {}
+        operation = event.get('operation')
+        if operation in DEAL_DELETE_OPERATIONS:
+            return self.server.ranker.remove_deals(event.get('ids') or [record['id'] for record in event.get('data', [])])
+        if operation in DEAL_UPDATE_OPERATIONS:
+            records = [record for record in event.get('data', []) if record.get('id')]
+            return self.server.ranker.update_deals(records) if records else None
+        return None
@@ -0,0 +1,235 @@
+import gzip
+import json
+import os
+from datetime import datetime, time, timezone
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_ARCHIVE_DIR = './snapshot-archive'
+MANIFEST_FILE = 'manifest.ndjson'
+SEGMENT_SUFFIX = '.ndjson.gz'
+FINGERPRINTS_PREFIX = 'fingerprints-'
+# Records fingerprinted at a time when a snapshot is appended.
+FINGERPRINT_BATCH_SIZE = 10000
+
+
+def _canonical(record: dict) -> str:
+    # The same record always encodes to the same text, whatever its key order
+    return json.dumps(record, sort_keys=True, separators=(',', ':'))
+
+
+def _moment(when) -> datetime:
+    # A datetime, or an ISO 8601 string; a date alone means the end of that day, and times without a zone are UTC
+    if isinstance(when, str):
+        moment = datetime.fromisoformat(when)
+        if len(when) == 10:
+            moment = datetime.combine(moment.date(), time.max)
+    else:
+        moment = when
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+class SnapshotArchive:
+    """
+    An append-only archive of the raw records of every fetch, for rebuilding past states.
+
+    Each snapshot stores, per source (e.g. the raw GHL contacts), only the records that
+    were added, changed or removed since the previous snapshot, in a gzipped NDJSON
+    segment: {"id": ID, "record": {...}} per added or changed record and
+    {"id": ID, "removed": true} per removed one. A record is changed when its canonical
+    JSON, with sorted keys, hashes differently. The manifest gets one line per snapshot,
+    with its number, the time it was taken and, per source, the segment and the
+    record, change and removal counts.
+
+    A source's state as of a snapshot is rebuilt by replaying the segments up to it:
+    records in the order they were first archived, updated in place. Several states
+    can be rebuilt in one replay, and records unchanged between them are the same
+    objects, so each distinct version of a record is held and processed once.
+
+    A snapshot's segments are written before its manifest line, and the fingerprints
+    its successor is compared with after it, so an interrupted append leaves the
+    archive as it was.
+    """
+
+    def __init__(self, directory: str = DEFAULT_ARCHIVE_DIR):
+        """
+        Args:
+            directory (str): The archive directory; it is created when the first snapshot is appended.
+        """
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_FILE)
+
+    def snapshots(self, since=None, until=None) -> list:
+        """
+        List the archived snapshots, oldest first.
+
+        Args:
+            since: Only snapshots taken at or after this datetime or ISO 8601 string.
+            until: Only snapshots taken at or before this datetime or ISO 8601 string; a date alone includes that day.
+
+        Returns:
+            list: The manifest entries: 'snapshot' number, 'taken_at' and 'sources'.
+        """
+        if not os.path.exists(self.manifest_path):
+            return []
+        with open(self.manifest_path) as file:
+            entries = [json.loads(line) for line in file if line.strip()]
+        if since is not None:
+            since = _moment(since)
+            entries = [entry for entry in entries if _moment(entry['taken_at']) >= since]
+        if until is not None:
+            until = _moment(until)
+            entries = [entry for entry in entries if _moment(entry['taken_at']) <= until]
+        return entries
+
+    def _path(self, relative_path: str) -> str:
+        return os.path.join(self.directory, relative_path)
+
+    def _fingerprints(self, source: str, entries: list) -> dict:
+        # The fingerprint of each record of the source as of the last snapshot, ID -> fingerprint
+        archived = [entry for entry in entries if source in entry['sources']]
+        if not archived:
+            return {}
+        path = self._path(f"{source}/{FINGERPRINTS_PREFIX}{archived[-1]['snapshot']:06d}.parquet")
+        if os.path.exists(path):
+            fingerprints = pd.read_parquet(path)
+            return dict(zip(fingerprints['id'], fingerprints['fingerprint']))
+        # Interrupted after the manifest line was written; rebuild them from the records
+        _, state = next(self.iter_states([archived[-1]['snapshot']], [source]))
+        records = state[source]
+        hashes = pd.util.hash_array(np.array([_canonical(record) for record in records], dtype=object))
+        return dict(zip((record['id'] for record in records), hashes))
+
+    def _write_fingerprints(self, source: str, snapshot: int, ids: list, fingerprints: list) -> None:
+        path = self._path(f"{source}/{FINGERPRINTS_PREFIX}{snapshot:06d}.parquet")
+        temporary = f"{path}.{os.getpid()}.tmp"
+        pd.DataFrame({'id': ids, 'fingerprint': np.array(fingerprints, dtype=np.uint64)}).to_parquet(temporary)
+        os.replace(temporary, path)
+        for name in os.listdir(self._path(source)):
+            if name.startswith(FINGERPRINTS_PREFIX) and name.endswith('.parquet') and name != os.path.basename(path):
+                os.remove(self._path(f"{source}/{name}"))
+
+    def _append_source(self, source: str, records, previous: dict, snapshot: int) -> tuple:
+        # Write the segment of a source's changed records, returning its manifest entry and fingerprints
+        os.makedirs(self._path(source), exist_ok=True)
+        segment = f"{source}/{snapshot:06d}{SEGMENT_SUFFIX}"
+        temporary = f"{self._path(segment)}.{os.getpid()}.tmp"
+        ids, fingerprints = [], []
+        changed = 0
+
+        with gzip.open(temporary, 'wt', encoding='utf-8') as file:
+            def flush(batch):
+                nonlocal changed
+                texts = [_canonical(record) for record in batch]
+                hashes = pd.util.hash_array(np.array(texts, dtype=object))
+                lines = []
+                for record, text, fingerprint in zip(batch, texts, hashes):
+                    ids.append(record['id'])
+                    fingerprints.append(fingerprint)
+                    if previous.get(record['id']) != fingerprint:
+                        lines.append(f'{{"id":{json.dumps(record["id"])},"record":{text}}}\n')
+                changed += len(lines)
+                file.writelines(lines)
+
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) == FINGERPRINT_BATCH_SIZE:
+                    flush(batch)
+                    batch = []
+            flush(batch)
+
+            current = set(ids)
+            removed = [record_id for record_id in previous if record_id not in current]
+            file.writelines(f'{{"id":{json.dumps(record_id)},"removed":true}}\n' for record_id in removed)
+
+        if changed or removed:
+            os.replace(temporary, self._path(segment))
+        else:
+            os.remove(temporary)
+            segment = None
+        entry = {'segment': segment, 'records': len(ids), 'changed': changed, 'removed': len(removed)}
+        return entry, ids, fingerprints
+
+    def append(self, sources: dict, taken_at: str = None) -> dict:
+        """
+        Archive the current records of each source as a new snapshot.
+
+        Only the records that changed since the source's last snapshot are written.
+
+        Args:
+            sources (dict): Source name -> its records, any iterable of JSON-compatible dicts with an 'id'.
+            taken_at (str): The ISO 8601 time of the snapshot, now if not given.
+
+        Returns:
+            dict: The snapshot's manifest entry.
+        """
+        entries = self.snapshots()
+        snapshot = entries[-1]['snapshot'] + 1 if entries else 1
+        taken_at = taken_at or datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+        archived, fingerprints = {}, {}
+        for source, records in sources.items():
+            archived[source], ids, hashes = self._append_source(source, records, self._fingerprints(source, entries), snapshot)
+            fingerprints[source] = (ids, hashes)
+
+        entry = {'snapshot': snapshot, 'taken_at': taken_at, 'sources': archived}
+        with open(self.manifest_path, 'a') as file:
+            file.write(json.dumps(entry) + '\n')
+        for source, (ids, hashes) in fingerprints.items():
+            self._write_fingerprints(source, snapshot, ids, hashes)
+        return entry
+
+    def iter_states(self, snapshots: list, sources: list = None):
+        """
+        Rebuild the state of the sources as of each of several snapshots, in one replay.
+
+        Args:
+            snapshots (list): The snapshot numbers.
+            sources (list): The sources to rebuild, every archived source if not given.
+
+        Yields:
+            tuple: Each snapshot's manifest entry and its state, source -> list of records,
+            oldest snapshot first. Records unchanged from an earlier state are the same objects.
+        """
+        wanted = set(snapshots)
+        current = {}
+        for entry in self.snapshots():
+            if not wanted:
+                return
+            for source, archived in entry['sources'].items():
+                if sources is not None and source not in sources:
+                    continue
+                records = current.setdefault(source, {})
+                if archived['segment'] is None:
+                    continue
+                with gzip.open(self._path(archived['segment']), 'rt', encoding='utf-8') as file:
+                    for line in file:
+                        change = json.loads(line)
+                        if change.get('removed'):
+                            records.pop(change['id'], None)
+                        else:
+                            records[change['id']] = change['record']
+            if entry['snapshot'] in wanted:
+                wanted.discard(entry['snapshot'])
+                yield entry, {source: list(records.values()) for source, records in current.items()}
+
+    def state_as_of(self, when, sources: list = None) -> tuple:
+        """
+        Rebuild the state of the sources as of a point in time.
+
+        Args:
+            when: A datetime or ISO 8601 string; a date alone means the end of that day.
+            sources (list): The sources to rebuild, every archived source if not given.
+
+        Returns:
+            tuple: The manifest entry of the last snapshot taken by then, and its state, source -> list of records.
+
+        Raises:
+            Exception: No snapshot was taken by then.
+        """
+        entries = self.snapshots(until=when)
+        if not entries:
+            raise Exception(f"No snapshot was taken by {when}")
+        return next(self.iter_states([entries[-1]['snapshot']], sources))
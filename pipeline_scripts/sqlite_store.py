@@ -0,0 +1,441 @@
+"""
+A persistent SQLite store of GHL contacts, Zoho CRM leads and deals, and ranking runs.
+
+Records are upserted by the retrievers. The normalized name, email and phone keys
+that join_data matches on are indexed, so ranking and point lookups run as indexed
+SQL queries without loading the full data into pandas.
+
+Usage:
+    python -m pipeline_scripts.sqlite_store rank
+    python -m pipeline_scripts.sqlite_store lookup --email someone@example.com
+    python -m pipeline_scripts.sqlite_store history CONTACT_ID
+
+main.py reaches the store with 'rank --store' and 'lookup'.
+"""
+import argparse
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+import pandas as pd
+
+from .field_extraction import CUSTOM_FIELD_COLUMNS, flatten_contact
+from .normalization import email_key, name_key, phone_key
+from .ranking import EXCLUDED_SOURCES, RANKING_RULE_COLUMNS, RANKING_RULES
+
+DEFAULT_DB_PATH = './data/lead-value-ranking.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ghl_contacts (
+    id TEXT PRIMARY KEY,
+    contact_name TEXT,
+    email TEXT,
+    phone TEXT,
+    source TEXT,
+    handset_count TEXT,
+    ph_verified TEXT,
+    qualified TEXT,
+    phone_verified_tag INTEGER NOT NULL,
+    name_key TEXT,
+    email_key TEXT,
+    phone_key TEXT,
+    date_updated TEXT,
+    location_id TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ghl_contacts_name_key ON ghl_contacts (name_key);
+CREATE INDEX IF NOT EXISTS ghl_contacts_email_key ON ghl_contacts (email_key);
+CREATE INDEX IF NOT EXISTS ghl_contacts_phone_key ON ghl_contacts (phone_key);
+
+CREATE TABLE IF NOT EXISTS zcrm_leads (
+    id TEXT PRIMARY KEY,
+    lead_status TEXT,
+    name_key TEXT,
+    email_key TEXT,
+    phone_key TEXT,
+    modified_time TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS zcrm_leads_email_key ON zcrm_leads (email_key);
+CREATE INDEX IF NOT EXISTS zcrm_leads_phone_key ON zcrm_leads (phone_key);
+
+CREATE TABLE IF NOT EXISTS zcrm_deals (
+    id TEXT PRIMARY KEY,
+    stage TEXT,
+    amount REAL,
+    name_key TEXT,
+    email_key TEXT,
+    phone_key TEXT,
+    modified_time TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS zcrm_deals_name_key ON zcrm_deals (name_key);
+CREATE INDEX IF NOT EXISTS zcrm_deals_email_key ON zcrm_deals (email_key);
+CREATE INDEX IF NOT EXISTS zcrm_deals_phone_key ON zcrm_deals (phone_key);
+
+CREATE TABLE IF NOT EXISTS rankings (
+    run_id TEXT NOT NULL,
+    contact_id TEXT NOT NULL,
+    ranking INTEGER,
+    ranking_desc TEXT,
+    PRIMARY KEY (run_id, contact_id)
+);
+CREATE INDEX IF NOT EXISTS rankings_contact_id ON rankings (contact_id);
+"""
+
+# Columns added after a table was first created, with their definitions.
+ADDED_COLUMNS = {
+    'ghl_contacts': {'location_id': 'TEXT'},
+}
+
+
+def connect(db_path: str = DEFAULT_DB_PATH) -> sqlite3.Connection:
+    """
+    Open the store, creating the file and tables if needed.
+
+    Stores created before a column of ADDED_COLUMNS existed have it added.
+
+    Args:
+        db_path (str): The SQLite database file.
+
+    Returns:
+        sqlite3.Connection: The connection, returning rows as sqlite3.Row.
+    """
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(db_path, timeout=30)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(SCHEMA)
+    for table, columns in ADDED_COLUMNS.items():
+        existing = {row['name'] for row in connection.execute(f"PRAGMA table_info({table})")}
+        for column, definition in columns.items():
+            if column not in existing:
+                connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return connection
+
+
+def _text(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    return str(value)
+
+
+def _upsert(connection: sqlite3.Connection, table: str, rows: list, replace_all: bool,
+            scope: tuple = None) -> None:
+    # replace_all replaces only the rows whose scope column IS the scope value, if given
+    delete, delete_params = f"DELETE FROM {table}", ()
+    if scope is not None:
+        delete, delete_params = f"{delete} WHERE {scope[0]} IS ?", (scope[1],)
+
+    if not rows:
+        if replace_all:
+            with connection:
+                connection.execute(delete, delete_params)
+        return
+
+    columns = list(rows[0])
+    updates = ', '.join(f"{column} = excluded.{column}" for column in columns if column != 'id')
+    statement = (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+        f"ON CONFLICT (id) DO UPDATE SET {updates}"
+    )
+    with connection:
+        if replace_all:
+            connection.execute(delete, delete_params)
+        connection.executemany(statement, [tuple(row[column] for column in columns) for row in rows])
+
+
+def upsert_ghl_contacts(contacts: list, db_path: str = DEFAULT_DB_PATH, replace_all: bool = False,
+                        location_id: str = None) -> None:
+    """
+    Insert or update cleaned GHL contacts.
+
+    Args:
+        contacts (list): Contacts as returned by clean_contact_data, or an iterator over them.
+        db_path (str): The SQLite database file.
+        replace_all (bool): Replace every stored contact of the location, dropping those not given.
+        location_id (str): The GHL location partition the contacts were fetched for, None for
+            the GHL_B4B_LOCATION contacts.
+    """
+    rows = []
+    for contact in contacts:
+        fields = flatten_contact(contact.get('attributions'), contact.get('customFields'), CUSTOM_FIELD_COLUMNS)
+        rows.append({
+            'id': contact['id'],
+            'contact_name': contact.get('contactName'),
+            'email': contact.get('email'),
+            'phone': _text(contact.get('phone')),
+            'source': contact.get('source'),
+            'handset_count': _text(fields.get('Handset_Count')),
+            'ph_verified': _text(fields.get('Ph_verified')),
+            'qualified': _text(fields.get('Qualified')),
+            'phone_verified_tag': int('phone verified' in (contact.get('tags') or [])),
+            'name_key': name_key(contact.get('contactName')),
+            'email_key': email_key(contact.get('email')),
+            'phone_key': phone_key(contact.get('phone')),
+            'date_updated': contact.get('dateUpdated'),
+            'location_id': location_id,
+            'record': json.dumps(contact),
+        })
+
+    connection = connect(db_path)
+    try:
+        _upsert(connection, 'ghl_contacts', rows, replace_all, ('location_id', location_id))
+    finally:
+        connection.close()
+
+
+def upsert_zcrm_leads(leads: list, db_path: str = DEFAULT_DB_PATH, replace_all: bool = False) -> None:
+    """
+    Insert or update raw Zoho CRM leads.
+
+    Args:
+        leads (list): The lead records.
+        db_path (str): The SQLite database file.
+        replace_all (bool): Replace every stored lead, dropping those not given.
+    """
+    rows = [{
+        'id': lead['id'],
+        'lead_status': lead.get('Lead_Status'),
+        'name_key': name_key(lead.get('Full_Name')),
+        'email_key': email_key(lead.get('Email')),
+        'phone_key': phone_key(lead.get('Phone')),
+        'modified_time': lead.get('Modified_Time'),
+        'record': json.dumps(lead),
+    } for lead in leads]
+
+    connection = connect(db_path)
+    try:
+        _upsert(connection, 'zcrm_leads', rows, replace_all)
+    finally:
+        connection.close()
+
+
+def upsert_zcrm_deals(deals: list, db_path: str = DEFAULT_DB_PATH, replace_all: bool = False) -> None:
+    """
+    Insert or update raw Zoho CRM deals.
+
+    Args:
+        deals (list): The deal records.
+        db_path (str): The SQLite database file.
+        replace_all (bool): Replace every stored deal, dropping those not given.
+    """
+    rows = [{
+        'id': deal['id'],
+        'stage': deal.get('Stage'),
+        'amount': deal.get('Amount'),
+        'name_key': name_key((deal.get('Contact_Name') or {}).get('name')),
+        'email_key': email_key(deal.get('Generic_Email')),
+        'phone_key': phone_key(deal.get('Emergency_Forward_No')),
+        'modified_time': deal.get('Modified_Time'),
+        'record': json.dumps(deal),
+    } for deal in deals]
+
+    connection = connect(db_path)
+    try:
+        _upsert(connection, 'zcrm_deals', rows, replace_all)
+    finally:
+        connection.close()
+
+
+def _wildcard(value) -> bool:
+    return value is None or (not isinstance(value, str) and pd.isna(value))
+
+
+def ranking_case(rules=None) -> tuple:
+    """
+    Compile the ranking rule table into SQL CASE expressions.
+
+    The expressions run over a contact aliased 'c' and its matched deal aliased 'd',
+    with the same first-match rule semantics as pipeline_scripts.ranking.
+
+    Args:
+        rules: The rule table, defaults to RANKING_RULES.
+
+    Returns:
+        tuple: The ranking expression, the description expression and their parameters.
+    """
+    rules = pd.DataFrame(RANKING_RULES if rules is None else rules, columns=RANKING_RULE_COLUMNS)
+    named_bands = [band for band in rules['band'] if not _wildcard(band) and band != 'other']
+
+    conditions = []
+    for rule in rules.itertuples(index=False):
+        clauses, params = [], []
+        if not _wildcard(rule.band):
+            if rule.band == 'other':
+                clauses.append(f"(c.handset_count IS NULL OR c.handset_count NOT IN ({', '.join('?' * len(named_bands))}))")
+                params.extend(named_bands)
+            else:
+                clauses.append("c.handset_count = ?")
+                params.append(rule.band)
+        if not _wildcard(rule.tagged):
+            clauses.append("c.phone_verified_tag = ?")
+            params.append(int(bool(rule.tagged)))
+        if rule.response == 'responded':
+            clauses.append("(c.ph_verified = 'True' OR c.qualified = 'True')")
+        elif rule.response == 'none':
+            clauses.append("(c.ph_verified IS NULL AND c.qualified IS NULL)")
+        if rule.sale == 'sold':
+            clauses.append("d.amount IS NOT NULL")
+        elif rule.sale == 'unsold':
+            clauses.append("d.amount IS NULL")
+        if not _wildcard(rule.stage):
+            clauses.append("d.stage = ?")
+            params.append(rule.stage)
+        conditions.append((' AND '.join(clauses) or '1', params))
+
+    ranking = 'CASE ' + ' '.join(f"WHEN {sql} THEN {int(rule.ranking)}" for (sql, _), rule in zip(conditions, rules.itertuples())) + ' END'
+    description = 'CASE ' + ' '.join(f"WHEN {sql} THEN ?" for sql, _ in conditions) + ' END'
+
+    params = [param for _, rule_params in conditions for param in rule_params]
+    description_params = []
+    for (_, rule_params), text in zip(conditions, rules['ranking_desc']):
+        description_params.extend(rule_params + [text])
+
+    return ranking, description, params + description_params
+
+
+RANKED_CONTACTS = """
+WITH matched AS (
+    SELECT c.*, COALESCE(
+        (SELECT rowid FROM zcrm_deals WHERE name_key = c.name_key ORDER BY rowid LIMIT 1),
+        (SELECT rowid FROM zcrm_deals WHERE email_key = c.email_key ORDER BY rowid LIMIT 1),
+        (SELECT rowid FROM zcrm_deals WHERE phone_key = c.phone_key ORDER BY rowid LIMIT 1)
+    ) AS deal_rowid
+    FROM ghl_contacts c
+    WHERE (c.source IS NULL OR c.source NOT IN ({excluded})) {contact_filter}
+)
+SELECT c.id AS contact_id, d.id AS deal_id, d.stage, d.amount,
+       {ranking} AS ranking, {description} AS ranking_desc
+FROM matched c LEFT JOIN zcrm_deals d ON d.rowid = c.deal_rowid
+"""
+
+
+def rank_contacts_sql(connection: sqlite3.Connection, contact_ids: list = None, rules=None) -> list:
+    """
+    Rank contacts with an indexed SQL query.
+
+    Args:
+        connection (sqlite3.Connection): The store.
+        contact_ids (list): The contacts to rank, all contacts if not given.
+        rules: The rule table, defaults to RANKING_RULES.
+
+    Returns:
+        list: sqlite3.Row results with contact_id, deal_id, stage, amount, ranking and ranking_desc.
+    """
+    ranking, description, rule_params = ranking_case(rules)
+    contact_filter = ''
+    filter_params = []
+    if contact_ids is not None:
+        contact_filter = f"AND c.id IN ({', '.join('?' * len(contact_ids))})"
+        filter_params = list(contact_ids)
+
+    query = RANKED_CONTACTS.format(
+        excluded=', '.join('?' * len(EXCLUDED_SOURCES)),
+        contact_filter=contact_filter,
+        ranking=ranking,
+        description=description,
+    )
+    return connection.execute(query, list(EXCLUDED_SOURCES) + filter_params + rule_params).fetchall()
+
+
+def record_rankings(connection: sqlite3.Connection, run_id: str = None, rules=None) -> str:
+    """
+    Rank every contact and store the results as a ranking run.
+
+    Args:
+        connection (sqlite3.Connection): The store.
+        run_id (str): The run identifier, the current UTC time if not given.
+        rules: The rule table, defaults to RANKING_RULES.
+
+    Returns:
+        str: The run identifier.
+    """
+    run_id = run_id or datetime.now(timezone.utc).isoformat(timespec='seconds')
+    rows = rank_contacts_sql(connection, rules=rules)
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO rankings (run_id, contact_id, ranking, ranking_desc) VALUES (?, ?, ?, ?)",
+            [(run_id, row['contact_id'], row['ranking'], row['ranking_desc']) for row in rows],
+        )
+    return run_id
+
+
+def lookup_contacts(connection: sqlite3.Connection, contact_id: str = None, email: str = None,
+                    phone: str = None, name: str = None) -> list:
+    """
+    Look up contacts by ID or by a normalized match key, with their current ranking.
+
+    Args:
+        connection (sqlite3.Connection): The store.
+        contact_id (str): The GHL contact ID.
+        email (str): The email address.
+        phone (str): The phone number.
+        name (str): The contact name.
+
+    Returns:
+        list: sqlite3.Row results with contact_id, deal_id, stage, amount, ranking and ranking_desc.
+
+    Raises:
+        Exception: No contact ID, email, phone or name was given.
+    """
+    if contact_id is not None:
+        ids = [contact_id]
+    else:
+        if email is None and phone is None and name is None:
+            raise Exception("A contact ID, email, phone or name is needed to look up contacts")
+        # Keys that normalize to nothing, e.g. a blank email or a phone without digits, match no contact
+        keys = [(column, value) for column, value in [
+            ('email_key', email_key(email)), ('phone_key', phone_key(phone)), ('name_key', name_key(name)),
+        ] if value is not None]
+        if not keys:
+            return []
+        column, value = keys[0]
+        ids = [row['id'] for row in connection.execute(f"SELECT id FROM ghl_contacts WHERE {column} = ?", (value,))]
+    return rank_contacts_sql(connection, ids) if ids else []
+
+
+def ranking_history(connection: sqlite3.Connection, contact_id: str) -> list:
+    """
+    List the stored rankings of a contact, oldest run first.
+
+    Args:
+        connection (sqlite3.Connection): The store.
+        contact_id (str): The GHL contact ID.
+
+    Returns:
+        list: sqlite3.Row results with run_id, ranking and ranking_desc.
+    """
+    return connection.execute(
+        "SELECT run_id, ranking, ranking_desc FROM rankings WHERE contact_id = ? ORDER BY run_id",
+        (contact_id,),
+    ).fetchall()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Query the SQLite record store.")
+    parser.add_argument('--db', default=DEFAULT_DB_PATH, help="the SQLite database file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('rank', help="rank every contact and store the run")
+    lookup = commands.add_parser('lookup', help="show the current ranking of matching contacts")
+    keys = lookup.add_mutually_exclusive_group(required=True)
+    keys.add_argument('--id')
+    keys.add_argument('--email')
+    keys.add_argument('--phone')
+    keys.add_argument('--name')
+    history = commands.add_parser('history', help="show the stored rankings of a contact")
+    history.add_argument('contact_id')
+    args = parser.parse_args()
+
+    store = connect(args.db)
+    if args.command == 'rank':
+        print(f"Stored ranking run {record_rankings(store)}")
+    elif args.command == 'lookup':
+        for row in lookup_contacts(store, args.id, args.email, args.phone, args.name):
+            print(dict(row))
+    else:
+        for row in ranking_history(store, args.contact_id):
+            print(dict(row))
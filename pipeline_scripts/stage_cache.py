@@ -0,0 +1,172 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+DEFAULT_CACHE_DIR = './.stage-cache'
+# Least recently used entries are evicted once the cache holds more than this.
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# Bump to invalidate every cached entry, e.g. when the entry format changes.
+CACHE_FORMAT_VERSION = 1
+
+ENTRY_SUFFIX = '.pkl'
+FINGERPRINTS_FILE = 'fingerprints.json'
+HASH_BLOCK_BYTES = 1 << 20
+
+
+def code_version(*objects) -> str:
+    """
+    Hash the source code of functions, classes or modules.
+
+    Args:
+        *objects: The code a stage's output depends on.
+
+    Returns:
+        str: The hex digest, which changes whenever any of the code does.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for code in objects:
+        digest.update(inspect.getsource(code).encode())
+    return digest.hexdigest()
+
+
+class StageCache:
+    """
+    A content-addressed cache of pipeline stage outputs on disk.
+
+    Each entry is keyed by a hash of the stage name, the contents of the stage's
+    input files, the version of its code and its settings, so a changed input,
+    code change or setting is a miss rather than a stale hit. Entries are pickled,
+    which round-trips frames with their exact dtypes, and written atomically.
+
+    File content hashes are remembered by path, size and modification time, so
+    unchanged input files are not read again to be hashed. Reading an entry marks
+    it as recently used; when the cache grows past max_bytes, the least recently
+    used entries are deleted.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        Args:
+            directory (str): The cache directory; it is created if missing.
+            max_bytes (int): The most bytes of entries to keep.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.fingerprints_path = os.path.join(directory, FINGERPRINTS_FILE)
+        self.fingerprints = {}
+        if os.path.exists(self.fingerprints_path):
+            with open(self.fingerprints_path) as file:
+                self.fingerprints = json.load(file)
+        # A smaller max_bytes than the last run's applies straight away
+        self.evict()
+
+    def file_digest(self, file_path: str) -> str:
+        """
+        Hash a file's contents, reusing the hash while its size and modification time are unchanged.
+
+        Args:
+            file_path (str): The file.
+
+        Returns:
+            str: The hex digest.
+        """
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        known = self.fingerprints.get(path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['digest']
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(HASH_BLOCK_BYTES), b''):
+                digest.update(block)
+        self.fingerprints[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest.hexdigest()}
+        temporary = f"{self.fingerprints_path}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as file:
+            json.dump(self.fingerprints, file, indent=4)
+        os.replace(temporary, self.fingerprints_path)
+        return digest.hexdigest()
+
+    def key(self, stage: str, input_files: list, code: str, settings=None) -> str:
+        """
+        Build the cache key of a stage's output.
+
+        Args:
+            stage (str): The stage name.
+            input_files (list): The files the stage's output is derived from.
+            code (str): The stage's code version, from code_version.
+            settings: Any other inputs of the stage, with a stable repr.
+
+        Returns:
+            str: The hex key.
+        """
+        # Pickled frames hold numpy and Arrow data, which another version may read back wrongly
+        parts = [
+            str(CACHE_FORMAT_VERSION), pd.__version__, np.__version__, pa.__version__, stage, code, repr(settings),
+            *(self.file_digest(file_path) for file_path in input_files),
+        ]
+        return hashlib.blake2b('\0'.join(parts).encode(), digest_size=16).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key: str):
+        """
+        Read a cached output.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            The cached output, or None on a miss.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, 'rb') as file:
+                value = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError) as error:
+            print(f"Ignoring unreadable cache entry {os.path.basename(path)}: {error}")
+            return None
+        # The modification time orders the entries for eviction
+        os.utime(path)
+        return value
+
+    def put(self, key: str, value) -> None:
+        """
+        Cache an output, then evict least recently used entries until the cache fits in max_bytes.
+
+        Outputs larger than max_bytes on their own are not kept.
+
+        Args:
+            key (str): The cache key.
+            value: The output to cache; it must be picklable.
+        """
+        path = self._entry_path(key)
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete the least recently used entries until the cache fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(ENTRY_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
@@ -0,0 +1,75 @@
+import csv
+import itertools
+import os
+
+import pandas as pd
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def iter_chunks(items, chunk_size: int):
+    """
+    Group an iterable into lists of at most chunk_size items.
+
+    Args:
+        items: The items to group, consumed lazily.
+        chunk_size (int): The maximum number of items per chunk.
+
+    Yields:
+        list: The next chunk.
+    """
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class CsvAppender:
+    """
+    Append frames to a CSV file chunk by chunk under one header.
+
+    The first chunk fixes the columns. Later chunks are aligned to them: missing
+    columns are left empty. Columns an earlier chunk did not have are added after
+    the others, and the rows already written are rewritten with them left empty,
+    so no values are lost; passing every column up front avoids the rewrite.
+    """
+
+    def __init__(self, file_path: str):
+        """
+        Args:
+            file_path (str): The CSV file to write; it is replaced on the first append.
+        """
+        self.file_path = file_path
+        self.columns = None
+
+    def append(self, frame: pd.DataFrame) -> None:
+        if self.columns is None:
+            self.columns = list(frame.columns)
+            frame.to_csv(self.file_path, index=False)
+            return
+
+        extra = [column for column in frame.columns if column not in self.columns]
+        if extra:
+            self.widen(extra)
+        frame.reindex(columns=self.columns).to_csv(self.file_path, mode='a', header=False, index=False)
+
+    def widen(self, columns: list) -> None:
+        """
+        Add columns after the existing ones, rewriting the rows written so far with them left empty.
+
+        Args:
+            columns (list): The new columns.
+        """
+        print(f"Adding columns not in the earlier chunks of {os.path.basename(self.file_path)}: {columns}")
+        temporary = f"{self.file_path}.{os.getpid()}.tmp"
+        padding = [''] * len(columns)
+        with open(self.file_path, newline='', encoding='utf-8') as source, \
+                open(temporary, 'w', newline='', encoding='utf-8') as target:
+            reader = csv.reader(source)
+            writer = csv.writer(target)
+            writer.writerow(next(reader) + columns)
+            writer.writerows(row + padding for row in reader)
+        os.replace(temporary, self.file_path)
+        self.columns += columns
@@ -0,0 +1,118 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from ghl_scripts.ghl_contacts_retriever import retrieve_contacts
+from zcrm_scripts.zcrm_records_retriever import (
+    clean_zcrm_deals,
+    clean_zcrm_leads,
+    sync_zcrm_module,
+)
+
+from .http_session import create_session
+from .request_scheduler import get_scheduler
+
+# Maximum number of requests in flight per provider.
+PROVIDER_CONCURRENCY = {
+    "zcrm": 4,
+    "ghl": 4,
+}
+
+
+class ProviderPool:
+    """
+    A pooled session and a concurrency limit for one API provider.
+
+    Blocking retriever calls are run in worker threads, so calls for different
+    providers overlap. The limit applies to the provider's requests, through its
+    shared scheduler, so calls that prefetch pages in threads of their own still
+    have no more requests in flight than the session has pooled connections. It
+    also caps the retriever calls running at once.
+    """
+
+    def __init__(self, provider: str, concurrency: int):
+        """
+        Args:
+            provider (str): The provider name, used to record its HTTP requests in the run metrics.
+            concurrency (int): The maximum number of requests, and of calls, in flight.
+        """
+        self.session = create_session(concurrency, provider)
+        get_scheduler(provider).limit_in_flight(concurrency)
+        self.limit = asyncio.Semaphore(concurrency)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run a blocking retriever function on the provider's session.
+
+        The session is passed as the 'session' keyword argument.
+
+        Args:
+            func: The retriever function.
+            *args: The arguments for the function.
+            **kwargs: The keyword arguments for the function.
+
+        Returns:
+            The function's return value.
+        """
+        async with self.limit:
+            return await asyncio.to_thread(functools.partial(func, *args, session=self.session, **kwargs))
+
+    def close(self) -> None:
+        self.session.close()
+
+
+async def fetch_latest(concurrency: dict = None, incremental: bool = False, locations: list = None) -> None:
+    """
+    Retrieve Zoho CRM leads, Zoho CRM deals and GHL contacts concurrently and save them to files.
+
+    Wall-clock time is roughly that of the slowest source instead of the sum of all three.
+    If a source fails, the others are still saved and the first error is raised afterwards.
+
+    Given GHL location IDs, each location is fetched into its own partition instead of
+    the GHL_B4B_LOCATION contacts, each paging with its own cursor. The locations share
+    the GHL pool, so no more than its concurrency are fetched at once, and the fetch
+    takes about as long as the largest location while there are no more locations
+    than that.
+
+    Args:
+        concurrency (dict): Provider name -> maximum requests in flight, defaults to PROVIDER_CONCURRENCY.
+        incremental (bool): Fetch only the records changed since the last sync.
+        locations (list): The GHL location IDs to fetch.
+    """
+    concurrency = {**PROVIDER_CONCURRENCY, **(concurrency or {})}
+    # Enough threads for every call the pools let through, which the default executor may not have
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(sum(concurrency.values())))
+    zcrm = ProviderPool("zcrm", concurrency["zcrm"])
+    ghl = ProviderPool("ghl", concurrency["ghl"])
+
+    if locations:
+        contact_fetches = [ghl.run(retrieve_contacts, incremental=incremental, location_id=location_id)
+                           for location_id in locations]
+    else:
+        contact_fetches = [ghl.run(retrieve_contacts, incremental=incremental)]
+
+    try:
+        # A failing source does not cancel the others, so their data is still saved
+        leads, deals, *contacts = await asyncio.gather(
+            zcrm.run(sync_zcrm_module, 'Leads', incremental=incremental),
+            zcrm.run(sync_zcrm_module, 'Deals', incremental=incremental),
+            *contact_fetches,
+            return_exceptions=True,
+        )
+    finally:
+        zcrm.close()
+        ghl.close()
+
+    if not isinstance(leads, BaseException):
+        clean_zcrm_leads(leads)
+    if not isinstance(deals, BaseException):
+        clean_zcrm_deals(deals)
+
+    errors = [result for result in (leads, deals, *contacts) if isinstance(result, BaseException)]
+    if errors:
+        raise errors[0]
+
+
+def fetch_latest_blocking(concurrency: dict = None, incremental: bool = False, locations: list = None) -> None:
+    """Run fetch_latest from synchronous code."""
+    asyncio.run(fetch_latest(concurrency, incremental, locations))
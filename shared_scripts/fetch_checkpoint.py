@@ -0,0 +1,83 @@
+import json
+import os
+import time
+
+# Checkpoints older than this are discarded rather than resumed, as the data will have moved on.
+RESUME_WITHIN_SECONDS = 24 * 60 * 60
+
+
+class PageCheckpoint:
+    """
+    Records the progress of a paginated fetch so that an interrupted fetch can resume.
+
+    The records fetched so far are appended to '<path>.ndjson' page by page, and the
+    cursor of the next page and the record count are written to the JSON file at path
+    after each page. A checkpoint is only resumed by a fetch with the same query.
+    """
+
+    def __init__(self, path: str, query: dict, max_age: float = RESUME_WITHIN_SECONDS):
+        """
+        Args:
+            path (str): The checkpoint state file.
+            query (dict): What is being fetched, e.g. the endpoint and filters, as JSON-compatible values.
+            max_age (float): The age in seconds beyond which a checkpoint is not resumed.
+        """
+        self.path = path
+        self.records_path = f"{path}.ndjson"
+        self.query = query
+        self.max_age = max_age
+        self.count = 0
+
+    def resume(self) -> tuple:
+        """
+        Load the checkpoint if it belongs to this query and is recent enough.
+
+        Returns:
+            tuple: The saved cursor and the records fetched so far, or None and an empty list.
+        """
+        state = None
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                state = json.load(file)
+        resumable = (state and os.path.exists(self.records_path) and state.get('query') == self.query
+                     and time.time() - state.get('updated_at', 0) <= self.max_age)
+        if not resumable:
+            self.clear()
+            return None, []
+
+        # Records appended after the last saved cursor are dropped; their page is fetched again
+        records = []
+        with open(self.records_path, 'rb+') as file:
+            while len(records) < state['count']:
+                records.append(json.loads(file.readline()))
+            file.truncate(file.tell())
+        self.count = len(records)
+        return state['cursor'], records
+
+    def save(self, cursor, records: list) -> None:
+        """
+        Append a page of records and move the cursor past it.
+
+        Args:
+            cursor: The cursor of the next page, as JSON-compatible values.
+            records (list): The records of the page just fetched.
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.records_path, 'a') as file:
+            file.writelines(json.dumps(record) + '\n' for record in records)
+        self.count += len(records)
+
+        state = {'query': self.query, 'cursor': cursor, 'count': self.count, 'updated_at': time.time()}
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as file:
+            json.dump(state, file)
+        os.replace(temporary, self.path)
+
+    def clear(self) -> None:
+        """Remove the checkpoint, once the fetch has completed."""
+        for path in (self.path, self.records_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.count = 0
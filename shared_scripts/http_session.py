@@ -0,0 +1,27 @@
+import requests
+from requests.adapters import HTTPAdapter
+
+from .run_metrics import instrument_session
+
+
+def create_session(pool_size: int = 4, provider: str = None) -> requests.Session:
+    """
+    Create a requests session with a keep-alive connection pool.
+
+    Requests sent on the session reuse pooled TCP/TLS connections instead of opening
+    a new one per call.
+
+    Args:
+        pool_size (int): The maximum number of pooled connections per host.
+        provider (str): The API provider name to record the session's responses under in the run metrics.
+
+    Returns:
+        requests.Session: The session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if provider:
+        instrument_session(session, provider)
+    return session
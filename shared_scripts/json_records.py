@@ -0,0 +1,117 @@
+import json
+import os
+
+# Characters read from a JSON file at a time by iter_json_array.
+DECODE_CHUNK_SIZE = 1024 * 1024
+# Records encoded per write by write_json_array.
+ENCODE_BATCH_SIZE = 1000
+
+_WHITESPACE = ' \t\n\r'
+# Characters that can continue a number
+_NUMBER_CHARACTERS = '0123456789.eE+-'
+
+
+def iter_json_array(file_path: str, chunk_size: int = DECODE_CHUNK_SIZE):
+    """
+    Parse a file holding a JSON array one item at a time.
+
+    The file is read in chunks and each item is decoded from the chunk with
+    raw_decode, so only the current chunk and the item being decoded are held,
+    never the whole document. Object keys are shared between items, as json.load
+    shares them within a document.
+
+    Args:
+        file_path (str): The JSON file, as written by json.dump or write_json_array.
+        chunk_size (int): The number of characters to read at a time.
+
+    Yields:
+        The array's items, as json.load would return them.
+
+    Raises:
+        json.JSONDecodeError: The file is not a JSON array.
+    """
+    keys = {}
+    decoder = json.JSONDecoder(object_pairs_hook=lambda pairs: {keys.setdefault(key, key): value for key, value in pairs})
+    with open(file_path, 'r', encoding='utf-8') as file:
+        buffer, position, eof = '', 0, False
+
+        def fill():
+            # Drop what has been consumed and append the next chunk
+            nonlocal buffer, position, eof
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+
+        def skip(separators: str = _WHITESPACE) -> str:
+            # Move past separators and return the next character, '' at the end of the file
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position] in separators:
+                    position += 1
+                if position < len(buffer) or eof:
+                    return buffer[position:position + 1]
+                fill()
+
+        if skip() != '[':
+            raise json.JSONDecodeError("Expecting '['", buffer, position)
+        position += 1
+        if skip() == ']':
+            return
+
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # A number that reaches the end of the chunk may continue in the next one
+                complete = eof or (end < len(buffer) and buffer[end] not in _NUMBER_CHARACTERS)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            if not complete:
+                fill()
+                continue
+            position = end
+            yield item
+
+            separator = skip()
+            if separator == ']':
+                return
+            if separator != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buffer, position)
+            position += 1
+            skip()
+
+
+def write_json_array(file_path: str, records) -> int:
+    """
+    Write records to a file as a JSON array, replacing the file atomically.
+
+    The output is the same as json.dump's, but records are encoded a batch at a
+    time with the C encoder; json.dump streams through the much slower pure
+    Python one.
+
+    Args:
+        file_path (str): The JSON file to write.
+        records: The records, any iterable of JSON-compatible values.
+
+    Returns:
+        int: The number of records written.
+    """
+    encode = json.JSONEncoder().encode
+    temporary = f"{file_path}.{os.getpid()}.tmp"
+    count = 0
+    with open(temporary, 'w', encoding='utf-8') as file:
+        file.write('[')
+        batch = []
+        for record in records:
+            batch.append(encode(record))
+            if len(batch) == ENCODE_BATCH_SIZE:
+                file.write((', ' if count else '') + ', '.join(batch))
+                count += len(batch)
+                batch = []
+        if batch:
+            file.write((', ' if count else '') + ', '.join(batch))
+            count += len(batch)
+        file.write(']')
+    os.replace(temporary, file_path)
+    return count
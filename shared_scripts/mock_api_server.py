@@ -0,0 +1,332 @@
+"""
+A local stand-in for the GHL and Zoho CRM APIs, for offline load testing of the retrievers.
+
+Serves, on one port:
+    GHL:  GET /contacts/ (startAfter/startAfterId paging), POST /contacts/search,
+          POST /oauth/token
+    Zoho: the search, record count and Bulk Read endpoints of ZcrmStubServer under
+          /crm/, POST /oauth/v2/token
+
+Latency, an error rate, per-provider rate limits with the providers' rate-limit
+headers, page sizes and token lifetimes are configurable, so pagination throughput,
+token refresh cost and 429 handling can be measured without network access.
+
+Usage:
+    python -m shared_scripts.mock_api_server [--contacts N] [--latency S] [--error-rate R]
+        [--rate-limit N --rate-window S] [--page-size N] [--port P]
+
+Then point the retrievers at it through the environment:
+    GHL_BASE_URL=http://127.0.0.1:P/
+    ZCRM_BASE_URL=http://127.0.0.1:P/crm/v6/
+    ZCRM_BULK_URL=http://127.0.0.1:P/crm/bulk/v6/
+    ZCRM_ACCOUNTS_URL=http://127.0.0.1:P/
+"""
+import argparse
+import bisect
+import json
+import random
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlparse
+
+from zcrm_scripts.zcrm_stub_server import ZcrmStubHandler, ZcrmStubServer, sample_records
+
+
+class ProviderLimits:
+    """A fixed-window request budget for one provider."""
+
+    def __init__(self, limit: int = None, window: float = 10.0):
+        """
+        Args:
+            limit (int): The requests allowed per window, unlimited if not given.
+            window (float): The window length in seconds.
+        """
+        self.limit = limit
+        self.window = window
+        self.window_start = time.monotonic()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def take(self) -> tuple:
+        """
+        Count one request against the budget.
+
+        Returns:
+            tuple: Whether the request is allowed, the requests remaining and the seconds until the window resets.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= self.window:
+                self.window_start, self.used = now, 0
+            reset = self.window - (now - self.window_start)
+            if self.limit is None:
+                return True, None, reset
+            if self.used >= self.limit:
+                return False, 0, reset
+            self.used += 1
+            return True, self.limit - self.used, reset
+
+
+class MockApiServer(ZcrmStubServer):
+    """An in-process HTTP server emulating the GHL and Zoho CRM APIs with injectable faults."""
+
+    def __init__(self, contacts: list, records: dict, address: tuple = ('127.0.0.1', 0),
+                 latency: float = 0.0, error_rate: float = 0.0, rate_limit: int = None,
+                 rate_window: float = 10.0, page_size: int = 100, zcrm_page_size: int = 200,
+                 token_ttl: int = 3600, require_auth: bool = False, seed: int = None, **zcrm_options):
+        """
+        Args:
+            contacts (list): Raw GHL contacts.
+            records (dict): Zoho CRM module name -> list of records.
+            address (tuple): The host and port to listen on, port 0 picks a free one.
+            latency (float): Seconds added to every response.
+            error_rate (float): The share of API requests answered with a 503.
+            rate_limit (int): Requests allowed per provider per rate window, unlimited if not given.
+            rate_window (float): The rate limit window in seconds.
+            page_size (int): The most GHL contacts per page, whatever the request asks for.
+            zcrm_page_size (int): The most Zoho CRM search results per page.
+            token_ttl (int): The lifetime of issued access tokens in seconds.
+            require_auth (bool): Answer requests without a live issued access token with a 401.
+            seed (int): The seed of the error injection.
+            **zcrm_options: Further ZcrmStubServer options.
+        """
+        super().__init__(records, address, page_size=zcrm_page_size, handler=MockApiHandler, **zcrm_options)
+        self.contacts = sorted(contacts, key=lambda contact: (_epoch_ms(contact['dateAdded']), contact['id']))
+        self.contact_keys = [(_epoch_ms(contact['dateAdded']), contact['id']) for contact in self.contacts]
+        self.latency = latency
+        self.error_rate = error_rate
+        self.contact_page_size = page_size
+        self.token_ttl = token_ttl
+        self.require_auth = require_auth
+        self.limits = {'ghl': ProviderLimits(rate_limit, rate_window), 'zcrm': ProviderLimits(rate_limit, rate_window)}
+        self.random = random.Random(seed)
+        self.tokens = {}
+        self.stats = {'requests': 0, 'throttled': 0, 'injected_errors': 0, 'unauthorized': 0, 'token_grants': 0}
+
+    def count(self, stat: str) -> None:
+        with self.lock:
+            self.stats[stat] += 1
+
+    def issue_token(self) -> tuple:
+        """Issue an access token and a refresh token."""
+        access_token = secrets.token_hex(16)
+        with self.lock:
+            self.tokens[access_token] = time.time() + self.token_ttl
+            self.stats['token_grants'] += 1
+        return access_token, secrets.token_hex(16)
+
+    def token_valid(self, token: str) -> bool:
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+
+def _epoch_ms(timestamp: str) -> int:
+    return int(datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp() * 1000)
+
+
+class MockApiHandler(ZcrmStubHandler):
+    # Set per request: the rate-limit headers to add to the response
+    rate_limit_headers = {}
+
+    def end_headers(self):
+        for header, value in self.rate_limit_headers.items():
+            self.send_header(header, value)
+        super().end_headers()
+
+    def provider(self, path: str) -> str:
+        return 'zcrm' if path.startswith(('/crm/', '/oauth/v2/')) else 'ghl'
+
+    def admit(self, provider: str) -> bool:
+        """Apply latency, the rate limit, error injection and auth; answer the request and return False if it fails."""
+        server = self.server
+        server.count('requests')
+        if server.latency:
+            time.sleep(server.latency)
+
+        allowed, remaining, reset = server.limits[provider].take()
+        limits = server.limits[provider]
+        if limits.limit is not None:
+            if provider == 'ghl':
+                self.rate_limit_headers = {
+                    'X-RateLimit-Max': str(limits.limit),
+                    'X-RateLimit-Remaining': str(remaining),
+                    'X-RateLimit-Interval-Milliseconds': str(int(limits.window * 1000)),
+                }
+            else:
+                self.rate_limit_headers = {
+                    'X-RATELIMIT-LIMIT': str(limits.limit),
+                    'X-RATELIMIT-REMAINING': str(remaining),
+                    'X-RATELIMIT-RESET': str(int((time.time() + reset) * 1000)),
+                }
+        if not allowed:
+            server.count('throttled')
+            self.rate_limit_headers = {**self.rate_limit_headers, 'Retry-After': str(max(1, round(reset)))}
+            self.send_json({'statusCode': 429, 'message': 'Too Many Requests'} if provider == 'ghl'
+                           else {'code': 'TOO_MANY_REQUESTS', 'status': 'error'}, 429)
+            return False
+
+        with server.lock:
+            failed = server.random.random() < server.error_rate
+        if failed:
+            server.count('injected_errors')
+            self.send_json({'message': 'Service Unavailable'}, 503)
+            return False
+
+        if server.require_auth and '/oauth/' not in self.path:
+            token = self.headers.get('Authorization', '').rpartition(' ')[2]
+            if not server.token_valid(token):
+                server.count('unauthorized')
+                self.send_json({'statusCode': 401, 'message': 'Invalid JWT'} if provider == 'ghl'
+                               else {'code': 'INVALID_TOKEN', 'status': 'error'}, 401)
+                return False
+        return True
+
+    def do_GET(self):
+        self.rate_limit_headers = {}
+        url = urlparse(self.path)
+        if not self.admit(self.provider(url.path)):
+            return
+        if url.path.rstrip('/') == '/contacts':
+            return self.list_contacts(parse_qs(url.query))
+        super().do_GET()
+
+    def do_POST(self):
+        self.rate_limit_headers = {}
+        path = urlparse(self.path).path
+        if not self.admit(self.provider(path)):
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if path == '/oauth/token' or path == '/oauth/v2/token':
+            return self.grant_token(path, parse_qs(body.decode()))
+        if path == '/contacts/search':
+            return self.search_contacts(json.loads(body))
+        if path == '/crm/bulk/v6/read':
+            return self.create_job(json.loads(body)['query'])
+        self.send_json({'code': 'INVALID_URL_PATTERN'}, 404)
+
+    def location_contacts(self, location_id) -> list:
+        if not location_id:
+            return self.server.contacts
+        return [contact for contact in self.server.contacts if contact.get('locationId', location_id) == location_id]
+
+    def list_contacts(self, query: dict) -> None:
+        location_id = query.get('locationId', [None])[0]
+        limit = min(int(query.get('limit', ['20'])[0]), self.server.contact_page_size)
+        start_after = query.get('startAfter', [None])[0]
+        start_after_id = query.get('startAfterId', [''])[0]
+
+        contacts = self.location_contacts(location_id)
+        keys = self.server.contact_keys if contacts is self.server.contacts else \
+            [(_epoch_ms(contact['dateAdded']), contact['id']) for contact in contacts]
+        start = bisect.bisect_right(keys, (int(start_after), start_after_id)) if start_after else 0
+        page = contacts[start:start + limit]
+
+        last_key = keys[start + len(page) - 1] if page else (None, None)
+        self.send_json({
+            'contacts': page,
+            'meta': {
+                'total': len(contacts),
+                'startAfter': last_key[0],
+                'startAfterId': last_key[1],
+                'currentPage': start // limit + 1 if limit else 1,
+                'nextPage': start // limit + 2 if start + limit < len(contacts) else None,
+            },
+        })
+
+    def search_contacts(self, body: dict) -> None:
+        contacts = self.location_contacts(body.get('locationId'))
+        for condition in body.get('filters', []):
+            if condition.get('field') == 'dateUpdated' and 'gt' in condition.get('value', {}):
+                since = _epoch_ms(condition['value']['gt'])
+                contacts = [contact for contact in contacts if _epoch_ms(contact['dateUpdated']) > since]
+        contacts = sorted(contacts, key=lambda contact: contact['dateUpdated'])
+
+        page, limit = int(body.get('page', 1)), min(int(body.get('pageLimit', 20)), self.server.contact_page_size)
+        self.send_json({'contacts': contacts[(page - 1) * limit:page * limit], 'total': len(contacts)})
+
+    def grant_token(self, path: str, form: dict) -> None:
+        grant_type = form.get('grant_type', [None])[0]
+        if grant_type not in ('refresh_token', 'authorization_code'):
+            return self.send_json({'error': 'invalid_grant'}, 400)
+
+        access_token, refresh_token = self.server.issue_token()
+        payload = {'access_token': access_token, 'token_type': 'Bearer', 'expires_in': self.server.token_ttl}
+        if path == '/oauth/token' or grant_type == 'authorization_code':
+            payload['refresh_token'] = form.get('refresh_token', [refresh_token])[0]
+        if path == '/oauth/v2/token':
+            payload['api_domain'] = self.server.root_url
+        self.send_json(payload)
+
+
+def sample_contacts(count: int, location_ids: list = None, seed: int = 0) -> list:
+    """
+    Build raw GHL contacts.
+
+    Args:
+        count (int): The number of contacts.
+        location_ids (list): The locations to spread the contacts over, one unnamed location if not given.
+        seed (int): The random seed.
+
+    Returns:
+        list: The contacts, in the shape the GHL contacts API returns.
+    """
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    contacts = []
+    for i in range(count):
+        added = start + timedelta(minutes=rng.randrange(60 * 24 * 365))
+        contact = {
+            'id': f"contact{i:07d}",
+            'contactName': f"contact {i}",
+            'firstName': 'contact',
+            'lastName': str(i),
+            'companyName': None,
+            'email': f"contact{i}@example.com",
+            'phone': f"+614{i:08d}",
+            'source': rng.choice(['facebook form', 'website']),
+            'dateAdded': added.isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+            'dateUpdated': (added + timedelta(days=rng.randrange(30))).isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+            'tags': rng.sample(['phone verified', 'callback'], rng.randint(0, 2)),
+            'attributions': [{'medium': 'facebook', 'utmCampaign': f"campaign {i % 10}", 'utmMedium': 'paid',
+                              'utmContent': f"content {i % 5}", 'isFirst': True}],
+            'customFields': [{'id': 'vq0Esn3nuJ2jknUuvjhU', 'value': rng.choice(['1-2', '3-4', '5-9', '10-24', '25+'])}],
+        }
+        if location_ids:
+            contact['locationId'] = location_ids[i % len(location_ids)]
+        contacts.append(contact)
+    return contacts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve mock GHL and Zoho CRM APIs.")
+    parser.add_argument('--contacts', type=int, default=10000, help="the number of GHL contacts")
+    parser.add_argument('--records', type=int, default=2000, help="the number of Zoho CRM records per module")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="the share of requests answered with a 503")
+    parser.add_argument('--rate-limit', type=int, help="requests allowed per provider per window")
+    parser.add_argument('--rate-window', type=float, default=10.0, help="the rate limit window in seconds")
+    parser.add_argument('--page-size', type=int, default=100, help="the most GHL contacts per page")
+    parser.add_argument('--zcrm-page-size', type=int, default=200, help="the most Zoho CRM search results per page")
+    parser.add_argument('--token-ttl', type=int, default=3600, help="the access token lifetime in seconds")
+    parser.add_argument('--require-auth', action='store_true', help="reject requests without a live issued token")
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    server = MockApiServer(
+        sample_contacts(args.contacts),
+        {module: sample_records(module, args.records) for module in ['Leads', 'Deals']},
+        address=('127.0.0.1', args.port), latency=args.latency, error_rate=args.error_rate,
+        rate_limit=args.rate_limit, rate_window=args.rate_window, page_size=args.page_size,
+        zcrm_page_size=args.zcrm_page_size, token_ttl=args.token_ttl, require_auth=args.require_auth,
+    )
+    print(f"Serving mock GHL and Zoho CRM APIs at {server.root_url}/")
+    print(f"  GHL_BASE_URL={server.root_url}/")
+    print(f"  ZCRM_BASE_URL={server.base_url}")
+    print(f"  ZCRM_BULK_URL={server.bulk_url}")
+    print(f"  ZCRM_ACCOUNTS_URL={server.root_url}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(server.stats))
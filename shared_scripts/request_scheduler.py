@@ -0,0 +1,221 @@
+import random
+import threading
+import time
+
+import requests
+
+from .http_session import create_session
+
+# Responses worth retrying: rate limited, or a transient server-side failure.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Per-provider defaults. Once the remaining quota falls below the headroom share of
+# the limit, the remaining requests are spread evenly until the quota resets. No more
+# than max_in_flight requests are sent at once, however many threads are fetching.
+SCHEDULER_SETTINGS = {
+    "ghl": {"max_retries": 5, "base_delay": 1.0, "max_delay": 60.0, "headroom": 0.2, "max_in_flight": 4},
+    "zcrm": {"max_retries": 5, "base_delay": 1.0, "max_delay": 60.0, "headroom": 0.2, "max_in_flight": 4},
+}
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def _header_number(headers, *names):
+    for name in names:
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+    return None
+
+
+class RequestScheduler:
+    """
+    Paces, retries and rate-limits the requests to one API provider.
+
+    The scheduler reads the provider's rate-limit headers after every response and
+    delays later requests so the quota is not exhausted before it resets. 429 and
+    5xx responses and connection errors are retried with jittered exponential
+    backoff, honouring Retry-After, and a 401 is retried once with a new token when
+    the request's auth is a TokenManager. It is shared by every thread fetching from
+    the provider, and caps how many of their requests are in flight at once.
+    Requests given no session are sent on a session of the scheduler's own, so
+    they are still recorded in the run metrics under the provider name.
+    """
+
+    def __init__(self, provider: str, max_retries: int = 5, base_delay: float = 1.0,
+                 max_delay: float = 60.0, headroom: float = 0.2, max_in_flight: int = None):
+        """
+        Args:
+            provider (str): The provider name, used in log messages.
+            max_retries (int): The retries per request before giving up.
+            base_delay (float): The backoff delay of the first retry, in seconds.
+            max_delay (float): The longest backoff delay, in seconds.
+            headroom (float): The share of the quota below which requests are spread out.
+            max_in_flight (int): The most requests sent at once, unlimited if None.
+        """
+        self.provider = provider
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.headroom = headroom
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+        self.interval = 0.0
+        self.session = None
+        self.limit_in_flight(max_in_flight)
+
+    def limit_in_flight(self, max_in_flight: int) -> None:
+        """
+        Set the most requests sent at once, unlimited if None.
+
+        Requests already waiting for a slot keep the old limit, so set it before fetching.
+        """
+        self.max_in_flight = max_in_flight
+        self.in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+
+    def backoff(self, attempt: int) -> float:
+        """Return the jittered delay before retry number attempt, counting from 0."""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def wait_turn(self) -> None:
+        """Block until the pacing allows the next request."""
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_slot)
+            self.next_slot = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every request to the provider for the given seconds."""
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+    def observe(self, response: requests.Response) -> None:
+        """
+        Update the pacing from a response's rate-limit headers.
+
+        Understands the GHL (X-RateLimit-Max/-Remaining/-Interval-Milliseconds) and
+        Zoho (X-RateLimit-Limit/-Remaining/-Reset) headers.
+        """
+        headers = response.headers
+        remaining = _header_number(headers, 'X-RateLimit-Remaining')
+        limit = _header_number(headers, 'X-RateLimit-Limit', 'X-RateLimit-Max')
+        if remaining is None or not limit:
+            return
+
+        reset = _header_number(headers, 'X-RateLimit-Reset')
+        if reset is not None:
+            # An epoch time in milliseconds or seconds, or seconds from now
+            if reset > 1e12:
+                reset = reset / 1000 - time.time()
+            elif reset > 1e9:
+                reset = reset - time.time()
+        else:
+            interval = _header_number(headers, 'X-RateLimit-Interval-Milliseconds')
+            reset = interval / 1000 if interval is not None else None
+        if reset is None:
+            return
+        reset = max(reset, 0.0)
+
+        with self.lock:
+            if remaining <= 0:
+                self.interval = 0.0
+                self.next_slot = max(self.next_slot, time.monotonic() + reset)
+            elif remaining <= limit * self.headroom:
+                self.interval = reset / remaining
+            else:
+                self.interval = 0.0
+
+    def default_session(self) -> requests.Session:
+        """Return the scheduler's own session, creating it on first use."""
+        with self.lock:
+            if self.session is None:
+                self.session = (create_session(self.max_in_flight, self.provider) if self.max_in_flight
+                                else create_session(provider=self.provider))
+            return self.session
+
+    def send(self, http, method: str, url: str, **kwargs) -> requests.Response:
+        """Send one attempt of a request once a slot under the in-flight limit is free."""
+        in_flight = self.in_flight
+        if in_flight is None:
+            return http.request(method, url, **kwargs)
+        with in_flight:
+            return http.request(method, url, **kwargs)
+
+    def request(self, method: str, url: str, session: requests.Session = None, **kwargs) -> requests.Response:
+        """
+        Send a request, pacing it and retrying transient failures.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The URL.
+            session (requests.Session): The session to send the request on, the scheduler's own if not given.
+            **kwargs: Further arguments for requests, including a TokenManager as 'auth'.
+
+        Returns:
+            requests.Response: The successful response.
+
+        Raises:
+            requests.exceptions.RequestException: The request failed with a non-retryable
+            status or a connection error, or it still failed after max_retries retries.
+        """
+        http = session or self.default_session()
+        auth = kwargs.get('auth')
+        reauthorized = False
+        for attempt in range(self.max_retries + 1):
+            self.wait_turn()
+            try:
+                response = self.send(http, method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff(attempt)
+                print(f"{self.provider}: {error.__class__.__name__} on {url}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self.observe(response)
+            # A token revoked or expired early is replaced once, then the request is retried
+            if (response.status_code == 401 and hasattr(auth, 'invalidate') and not reauthorized
+                    and attempt < self.max_retries):
+                print(f"{self.provider}: 401 from {url}, retrying with a new access token")
+                response.close()
+                auth.invalidate(response.request.headers.get('Authorization', '').rpartition(' ')[2])
+                reauthorized = True
+                continue
+            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                retry_after = _header_number(response.headers, 'Retry-After')
+                delay = retry_after if retry_after is not None else self.backoff(attempt)
+                print(f"{self.provider}: {response.status_code} from {url}, retrying in {delay:.1f}s")
+                response.close()
+                # Rate limiting holds back every thread, not just this one
+                if response.status_code == 429:
+                    self.pause(delay)
+                else:
+                    time.sleep(delay)
+                continue
+
+            response.raise_for_status()
+            return response
+
+
+def get_scheduler(provider: str) -> RequestScheduler:
+    """
+    Return the shared scheduler for a provider, creating it with SCHEDULER_SETTINGS.
+
+    Args:
+        provider (str): The provider name, 'ghl' or 'zcrm'.
+
+    Returns:
+        RequestScheduler: The scheduler.
+    """
+    with _schedulers_lock:
+        if provider not in _schedulers:
+            _schedulers[provider] = RequestScheduler(provider, **SCHEDULER_SETTINGS.get(provider, {}))
+        return _schedulers[provider]
@@ -0,0 +1,323 @@
+import cProfile
+import json
+import os
+import platform
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Response headers recorded as rate-limit state, matched case-insensitively by substring.
+RATE_LIMIT_HEADER_MARKERS = ('ratelimit', 'rate-limit', 'retry-after')
+
+_current_run = None
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(max_rss / (1024 * 1024 if platform.system() == 'Darwin' else 1024), 1)
+
+
+def _percentile(values: list, fraction: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class StageRecord:
+    """Totals for one named pipeline stage, accumulated over every time it runs."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rows_in = None
+        self.rows_out = None
+        self.peak_traced_mb = None
+        self.max_rss_mb = None
+
+    def add_rows(self, attribute: str, rows) -> None:
+        if rows is not None:
+            setattr(self, attribute, (getattr(self, attribute) or 0) + rows)
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'wall_seconds': round(self.wall_seconds, 4),
+            'cpu_seconds': round(self.cpu_seconds, 4),
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'peak_traced_mb': self.peak_traced_mb,
+            'max_rss_mb': self.max_rss_mb,
+        }
+
+
+class StageRun:
+    """The handle of a running stage, for reporting its row counts."""
+
+    def __init__(self):
+        self.rows_in = None
+        self.rows_out = None
+
+
+class ProviderHttpRecord:
+    """HTTP request totals for one API provider."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latencies = []
+        self.status_counts = {}
+        self.rate_limit = {}
+
+    def as_dict(self) -> dict:
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'latency_seconds': {
+                'total': round(sum(self.latencies), 4),
+                'mean': round(sum(self.latencies) / len(self.latencies), 4) if self.latencies else None,
+                'p50': _percentile(self.latencies, 0.5),
+                'p95': _percentile(self.latencies, 0.95),
+                'max': max(self.latencies, default=None),
+            },
+            'status_counts': dict(sorted(self.status_counts.items())),
+            'rate_limit': self.rate_limit,
+        }
+
+
+class RunMetrics:
+    """
+    Per-stage timings, memory and row counts, and per-provider HTTP totals for one pipeline run.
+
+    Stages that run more than once, such as the per-chunk stages of a streaming run,
+    accumulate into one record. Recording is thread-safe, so HTTP responses can be
+    recorded from fetch worker threads.
+    """
+
+    def __init__(self, trace_memory: bool = False, profile_stages: list = None, profile_dir: str = '.'):
+        """
+        Args:
+            trace_memory (bool): Measure each stage's peak Python memory with tracemalloc.
+            profile_stages (list): The names of the stages to run under cProfile.
+            profile_dir (str): The directory the '<stage>.prof' profiles are written to.
+        """
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.http = {}
+        self.profiles = {}
+        self.lock = threading.Lock()
+        self.configure(trace_memory, profile_stages, profile_dir)
+
+    def configure(self, trace_memory: bool = False, profile_stages: list = None, profile_dir: str = '.') -> None:
+        """Change the memory tracing and profiling options for the stages still to run."""
+        self.trace_memory = trace_memory
+        self.profile_stages = set(profile_stages or [])
+        self.profile_dir = profile_dir
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int = None):
+        """
+        Measure a block of code as a named stage.
+
+        Args:
+            name (str): The stage name.
+            rows_in (int): The number of rows going into the stage.
+
+        Yields:
+            StageRun: Set its rows_out (or rows_in) inside the block to record row counts.
+        """
+        run = StageRun()
+        run.rows_in = rows_in
+        profiler = cProfile.Profile() if name in self.profile_stages else None
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield run
+        finally:
+            if profiler:
+                profiler.disable()
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            peak = round(tracemalloc.get_traced_memory()[1] / 1e6, 1) if self.trace_memory else None
+
+            with self.lock:
+                record = self.stages.setdefault(name, StageRecord(name))
+                record.calls += 1
+                record.wall_seconds += wall
+                record.cpu_seconds += cpu
+                record.add_rows('rows_in', run.rows_in)
+                record.add_rows('rows_out', run.rows_out)
+                if peak is not None:
+                    record.peak_traced_mb = max(record.peak_traced_mb or 0, peak)
+                record.max_rss_mb = _max_rss_mb()
+
+            if profiler:
+                self._dump_profile(name, profiler)
+
+    def add_stages(self, stages: dict) -> None:
+        """
+        Add stage totals recorded by another process, such as a pool worker.
+
+        Args:
+            stages (dict): Stage name -> stage record, as in the 'stages' of a run report.
+        """
+        with self.lock:
+            for name, totals in stages.items():
+                record = self.stages.setdefault(name, StageRecord(name))
+                record.calls += totals['calls']
+                record.wall_seconds += totals['wall_seconds']
+                record.cpu_seconds += totals['cpu_seconds']
+                record.add_rows('rows_in', totals['rows_in'])
+                record.add_rows('rows_out', totals['rows_out'])
+                for attribute in ('peak_traced_mb', 'max_rss_mb'):
+                    if totals[attribute] is not None:
+                        setattr(record, attribute, max(getattr(record, attribute) or 0, totals[attribute]))
+
+    def call(self, name: str, func, *args, **kwargs):
+        """
+        Run a function as a named stage.
+
+        Rows in are taken from the length of the first argument and rows out from
+        the length of the result, when they have one; string arguments such as file
+        paths are not counted.
+
+        Args:
+            name (str): The stage name.
+            func: The function to run.
+            *args: The arguments for the function.
+            **kwargs: The keyword arguments for the function.
+
+        Returns:
+            The function's return value.
+        """
+        rows_in = len(args[0]) if args and hasattr(args[0], '__len__') and not isinstance(args[0], str) else None
+        with self.stage(name, rows_in) as run:
+            result = func(*args, **kwargs)
+            if hasattr(result, '__len__'):
+                run.rows_out = len(result)
+        return result
+
+    def _dump_profile(self, name: str, profiler: cProfile.Profile) -> None:
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"{name}.prof")
+        # Repeated stages merge into one profile
+        if name in self.profiles:
+            stats = pstats.Stats(path)
+            stats.add(profiler)
+            stats.dump_stats(path)
+        else:
+            profiler.dump_stats(path)
+        self.profiles[name] = path
+
+    def record_response(self, provider: str, response, stream: bool = False) -> None:
+        """
+        Record one HTTP response for a provider.
+
+        Args:
+            provider (str): The API provider name.
+            response (requests.Response): The response.
+            stream (bool): Whether the body is streamed, in which case it is not read to size it.
+        """
+        size = response.headers.get('Content-Length')
+        if size is not None:
+            size = int(size)
+        elif not stream:
+            size = len(response.content)
+
+        rate_limit = {header: value for header, value in response.headers.items()
+                      if any(marker in header.lower() for marker in RATE_LIMIT_HEADER_MARKERS)}
+
+        with self.lock:
+            record = self.http.setdefault(provider, ProviderHttpRecord())
+            record.requests += 1
+            record.errors += response.status_code >= 400
+            record.bytes += size or 0
+            record.latencies.append(response.elapsed.total_seconds())
+            record.status_counts[response.status_code] = record.status_counts.get(response.status_code, 0) + 1
+            if rate_limit:
+                record.rate_limit = rate_limit
+
+    def report(self) -> dict:
+        """
+        Build the run report.
+
+        Returns:
+            dict: The run times, the stage records in the order the stages first ran and the HTTP totals per provider.
+        """
+        with self.lock:
+            return {
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'wall_seconds': round(time.perf_counter() - self.started, 4),
+                'max_rss_mb': _max_rss_mb(),
+                'python': platform.python_version(),
+                'stages': {name: record.as_dict() for name, record in self.stages.items()},
+                'http': {provider: record.as_dict() for provider, record in sorted(self.http.items())},
+                'profiles': dict(self.profiles),
+            }
+
+    def write_report(self, file_path: str) -> None:
+        """
+        Write the run report as JSON.
+
+        Args:
+            file_path (str): The JSON file to write.
+        """
+        with open(file_path, 'w') as file:
+            json.dump(self.report(), file, indent=4)
+
+
+def start_run(**kwargs) -> RunMetrics:
+    """
+    Start recording a new run; HTTP responses on instrumented sessions are recorded to it.
+
+    Args:
+        **kwargs: The RunMetrics options.
+
+    Returns:
+        RunMetrics: The run.
+    """
+    global _current_run
+    _current_run = RunMetrics(**kwargs)
+    return _current_run
+
+
+def current_run():
+    """Return the run being recorded, or None."""
+    return _current_run
+
+
+def instrument_session(session, provider: str) -> None:
+    """
+    Record every response received on a session to the current run under a provider name.
+
+    Args:
+        session (requests.Session): The session.
+        provider (str): The API provider name.
+    """
+    def record(response, *args, **kwargs):
+        run = current_run()
+        if run is not None:
+            run.record_response(provider, response, kwargs.get('stream', False))
+
+    session.hooks['response'].append(record)
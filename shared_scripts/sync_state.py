@@ -0,0 +1,135 @@
+import json
+import os
+import time
+from datetime import datetime
+
+from .json_records import iter_json_array
+
+# Force a full reconciliation when the last one is older than this.
+RECONCILE_AFTER_SECONDS = 7 * 24 * 60 * 60
+
+
+def load_sync_state(file_path: str) -> dict:
+    """
+    Load the sync state for a source.
+
+    Args:
+        file_path (str): The sync state file.
+
+    Returns:
+        dict: The stored state, empty if the source has never been synced.
+    """
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path, 'r') as f:
+        return json.load(f)
+
+
+def save_sync_state(file_path: str, state: dict) -> None:
+    """
+    Save the sync state for a source.
+
+    Args:
+        file_path (str): The sync state file.
+        state (dict): The state to save.
+    """
+    with open(file_path, 'w') as f:
+        json.dump(state, f, indent=4)
+
+
+def needs_full_sync(state: dict, reconcile_after: float = RECONCILE_AFTER_SECONDS) -> bool:
+    """
+    Decide whether a source needs a full reconciliation instead of a delta fetch.
+
+    Args:
+        state (dict): The stored sync state.
+        reconcile_after (float): Seconds after which a full reconciliation is due.
+
+    Returns:
+        bool: True if there is no watermark yet or the last full sync is too old.
+    """
+    if not state.get('watermark'):
+        return True
+    return time.time() - state.get('last_full_sync', 0) >= reconcile_after
+
+
+def update_sync_state(state: dict, records: list, timestamp_field: str, full: bool) -> dict:
+    """
+    Advance the high-water mark past the given records.
+
+    Args:
+        state (dict): The stored sync state.
+        records (list): The records fetched in this run.
+        timestamp_field (str): The record field holding the last-modified time.
+        full (bool): Whether this run was a full reconciliation.
+
+    Returns:
+        dict: The new state.
+    """
+    state = dict(state)
+    watermark = latest_timestamp(records, timestamp_field)
+    if watermark is not None:
+        state['watermark'] = watermark
+    if full:
+        state['last_full_sync'] = time.time()
+    return state
+
+
+def latest_timestamp(records: list, timestamp_field: str):
+    """
+    Find the latest ISO 8601 timestamp among the records.
+
+    Args:
+        records (list): The records to scan.
+        timestamp_field (str): The record field holding the timestamp.
+
+    Returns:
+        str: The latest timestamp as it appears in the record, or None if no record has one.
+    """
+    latest = None
+    latest_value = None
+    for record in records:
+        value = record.get(timestamp_field)
+        if not value:
+            continue
+        parsed = datetime.fromisoformat(value)
+        if latest is None or parsed > latest:
+            latest, latest_value = parsed, value
+    return latest_value
+
+
+def load_records(file_path: str) -> list:
+    """
+    Load a locally stored list of records.
+
+    The records are decoded one at a time, so the file's text is never held in
+    memory as a whole.
+
+    Args:
+        file_path (str): The JSON file holding the records.
+
+    Returns:
+        list: The records, empty if the file does not exist.
+    """
+    if not os.path.exists(file_path):
+        return []
+    return list(iter_json_array(file_path))
+
+
+def merge_records(existing: list, updates: list, key: str = 'id') -> list:
+    """
+    Merge updated records into the stored records by ID.
+
+    Updated records replace stored ones in place; new records are appended.
+
+    Args:
+        existing (list): The stored records.
+        updates (list): The records fetched since the last sync.
+        key (str): The record ID field.
+
+    Returns:
+        list: The merged records.
+    """
+    merged = {record[key]: record for record in existing}
+    merged.update((record[key], record) for record in updates)
+    return list(merged.values())
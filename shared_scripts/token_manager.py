@@ -0,0 +1,177 @@
+import json
+import os
+import threading
+import time
+
+import requests
+
+from .http_session import create_session
+
+# Tokens are refreshed in the background once they are this close to expiring,
+# so requests never wait on a refresh while the old token is still usable.
+REFRESH_MARGIN_SECONDS = 300
+
+
+class TokenManager(requests.auth.AuthBase):
+    """
+    Keeps one provider's OAuth access token valid for every thread that uses it.
+
+    The token is read from the token file once and cached in memory. Near expiry it
+    is refreshed on a background thread; once expired, callers wait for the refresh.
+    A single lock makes concurrent callers share one refresh instead of each calling
+    the token endpoint, and the token file is replaced atomically after a refresh.
+
+    Passed as the 'auth' of a request, it sets the Authorization header, and the
+    request scheduler asks it for a new token when a request is answered with a 401.
+    Token requests are sent on a session of its own, recorded in the run metrics
+    under the provider name.
+    """
+
+    def __init__(self, provider: str, token_file: str, token_url: str, scheme: str, refresh_params: dict,
+                 grant_params: dict = None, headers: dict = None, refresh_margin: float = REFRESH_MARGIN_SECONDS):
+        """
+        Args:
+            provider (str): The provider name, used in log messages.
+            token_file (str): The JSON file the tokens are kept in between runs.
+            token_url (str): The OAuth token endpoint.
+            scheme (str): The Authorization header scheme, e.g. 'Bearer'.
+            refresh_params (dict): The form fields of a refresh request, besides the grant type and refresh token.
+            grant_params (dict): The form fields of an authorization code grant, used when there is no refresh token yet.
+            headers (dict): Extra headers for the token requests.
+            refresh_margin (float): How many seconds before expiry to refresh the token.
+        """
+        self.provider = provider
+        self.token_file = token_file
+        self.token_url = token_url
+        self.scheme = scheme
+        self.refresh_params = refresh_params
+        self.grant_params = grant_params
+        self.headers = headers or {}
+        self.refresh_margin = refresh_margin
+
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.access_token = None
+        self.refresh_token = None
+        self.access_token_expiry = 0.0
+        self.refresh_after = 0.0
+        self.refresh_thread = None
+        self.session = None
+
+    def load(self) -> None:
+        """Read the tokens from the token file, once."""
+        if self.loaded:
+            return
+        if os.path.exists(self.token_file):
+            with open(self.token_file) as file:
+                tokens = json.load(file)
+            self.access_token = tokens.get("access_token")
+            self.refresh_token = tokens.get("refresh_token")
+            self.access_token_expiry = float(tokens.get("access_token_expiry") or 0)
+            self.refresh_after = self.access_token_expiry - self.refresh_margin
+        self.loaded = True
+
+    def save(self) -> None:
+        """Write the tokens to a temporary file and move it over the token file."""
+        tokens = {
+            "access_token": self.access_token,
+            "refresh_token": self.refresh_token,
+            "access_token_expiry": self.access_token_expiry,
+        }
+        temporary = f"{self.token_file}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(tokens, file)
+        os.replace(temporary, self.token_file)
+
+    def request_token(self) -> None:
+        """
+        Exchange the refresh token, or the authorization code if there is none, for a new access token.
+
+        Raises:
+            requests.exceptions.HTTPError: The token endpoint returned an error status.
+            Exception: The token endpoint did not return an access token.
+        """
+        if self.refresh_token:
+            data = {**self.refresh_params, "grant_type": "refresh_token", "refresh_token": self.refresh_token}
+        elif self.grant_params:
+            data = {**self.grant_params, "grant_type": "authorization_code"}
+        else:
+            raise Exception(f"{self.provider}: no refresh token in {self.token_file}")
+
+        print(f"{self.provider}: requesting an access token...")
+        if self.session is None:
+            self.session = create_session(1, self.provider)
+        response = self.session.post(self.token_url, data=data, headers=self.headers)
+        response.raise_for_status()
+        response_data = response.json()
+        if not response_data.get("access_token") or response_data.get("expires_in") is None:
+            raise Exception(f"{self.provider}: token request failed: {response_data.get('error', response_data)}")
+
+        self.access_token = response_data["access_token"]
+        # Providers that rotate refresh tokens return a new one with each access token
+        self.refresh_token = response_data.get("refresh_token", self.refresh_token)
+        expires_in = response_data["expires_in"]
+        self.access_token_expiry = time.time() + expires_in
+        # Short-lived tokens are refreshed halfway through their lifetime instead
+        self.refresh_after = self.access_token_expiry - min(self.refresh_margin, expires_in / 2)
+        self.save()
+        print(f"{self.provider}: access token obtained.")
+
+    def refresh(self, stale: str = None) -> str:
+        """
+        Refresh the access token, unless another thread already replaced the stale one.
+
+        Args:
+            stale (str): The token the caller found expired or rejected.
+
+        Returns:
+            str: The new access token.
+        """
+        with self.lock:
+            self.load()
+            if self.access_token and self.access_token != stale and time.time() < self.access_token_expiry:
+                return self.access_token
+            self.request_token()
+            return self.access_token
+
+    def refresh_in_background(self) -> None:
+        """Start a background refresh of the current token, unless one is running."""
+        with self.lock:
+            if self.refresh_thread and self.refresh_thread.is_alive():
+                return
+            stale = self.access_token
+            self.refresh_thread = threading.Thread(target=self.refresh, args=(stale,), daemon=True)
+            self.refresh_thread.start()
+
+    def token(self) -> str:
+        """
+        Return a valid access token, refreshing it first if it has expired.
+
+        Returns:
+            str: The access token.
+        """
+        if not self.loaded:
+            with self.lock:
+                self.load()
+        now = time.time()
+        if not self.access_token or now >= self.access_token_expiry:
+            return self.refresh(self.access_token)
+        if now >= self.refresh_after:
+            self.refresh_in_background()
+        return self.access_token
+
+    def invalidate(self, rejected: str) -> str:
+        """
+        Replace a token the API rejected, unless it was already replaced.
+
+        Args:
+            rejected (str): The access token of the rejected request.
+
+        Returns:
+            str: The new access token.
+        """
+        return self.refresh(rejected)
+
+    def __call__(self, request: requests.PreparedRequest) -> requests.PreparedRequest:
+        request.headers["Authorization"] = f"{self.scheme} {self.token()}"
+        return request
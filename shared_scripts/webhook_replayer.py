@@ -0,0 +1,188 @@
+"""
+Replays GHL and Zoho CRM webhooks against the ranking service and measures how long each takes.
+
+Events are read from a JSON lines file, one per line:
+    {"path": "/webhooks/ghl", "body": {...}, "expect": {"CONTACT ID": RANKING}}
+'expect' is optional; when given, the replayer checks the rankings the service answers with.
+
+Or generated from the stored contacts: for each sampled contact, a ContactUpdate that
+adds the 'phone verified' tag and sets Ph_verified, a new signed off deal on the
+contact's name, email and phone, and an update timing the deal out.
+
+Usage:
+    python -m shared_scripts.webhook_replayer URL [--events FILE | --generate N]
+        [--contacts PATH] [--record FILE] [--seed N]
+
+Start the service first with 'python main.py serve'.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+
+import pandas as pd
+
+from pipeline_scripts.columnar_store import GHL_CONTACT_SCHEMA, read_frame
+from pipeline_scripts.field_extraction import CUSTOM_FIELD_COLUMNS
+from pipeline_scripts.frame_schema import parse_tags
+from pipeline_scripts.ranking import EXCLUDED_SOURCES
+
+from .http_session import create_session
+
+DEFAULT_CONTACTS_FILE = './ghl_scripts/data/clean-ghl-contacts.parquet'
+ATTRIBUTION_KEYS = ['utmCampaign', 'utmMedium', 'utmContent', 'medium']
+
+
+def api_contact(row: dict) -> dict:
+    """
+    Rebuild a GHL contact, as the API returns it, from a stored contact.
+
+    Args:
+        row (dict): The stored contact, with its attributions and custom fields flattened.
+
+    Returns:
+        dict: The contact with 'attributions' and 'customFields' lists.
+    """
+    contact = {name: row.get(name) for name in GHL_CONTACT_SCHEMA.names}
+    tags = row.get('tags')
+    contact['tags'] = list(tags) if isinstance(tags, (list, tuple)) else parse_tags(tags)
+
+    media = {}
+    for column, value in row.items():
+        medium, _, key = column.rpartition('_')
+        if medium and key in ATTRIBUTION_KEYS and value is not None:
+            media.setdefault(medium, dict.fromkeys(ATTRIBUTION_KEYS, None))[key] = value
+    contact['attributions'] = [{**values, 'medium': medium} for medium, values in media.items()]
+    contact['customFields'] = [{'id': field_id, 'value': row[column]}
+                               for field_id, column in CUSTOM_FIELD_COLUMNS.items() if row.get(column) is not None]
+    return contact
+
+
+def generate_events(contacts_path: str, count: int, seed: int = 0) -> list:
+    """
+    Build webhook events for a sample of the stored contacts.
+
+    Args:
+        contacts_path (str): The stored contacts' Parquet file.
+        count (int): The number of contacts to sample; each gets three events.
+        seed (int): The random seed.
+
+    Returns:
+        list: The events, as {'path', 'body'} dicts.
+    """
+    rng = random.Random(seed)
+    contacts = read_frame(contacts_path)
+    contacts = contacts[~contacts['source'].isin(EXCLUDED_SOURCES)]
+    rows = contacts.iloc[sorted(rng.sample(range(len(contacts)), min(count, len(contacts))))]
+    rows = rows.astype(object).where(rows.notna(), None).to_dict('records')
+
+    events = []
+    for number, row in enumerate(rows):
+        contact = api_contact(row)
+        contact['tags'] = sorted(set(contact['tags']) | {'phone verified'})
+        contact['customFields'] = [field for field in contact['customFields']
+                                   if CUSTOM_FIELD_COLUMNS.get(field['id']) != 'Ph_verified']
+        contact['customFields'].append({'id': next(field_id for field_id, column in CUSTOM_FIELD_COLUMNS.items()
+                                                   if column == 'Ph_verified'), 'value': ['True']})
+        events.append({'path': '/webhooks/ghl', 'body': {'type': 'ContactUpdate', **contact}})
+
+        deal = {
+            'id': f"replayed-deal-{seed}-{number}",
+            'Deal_Name': f"{contact['contactName']} deal",
+            'Stage': 'Checked & Signed Off',
+            'Amount': round(rng.uniform(500, 50000), 2),
+            'Generic_Email': contact['email'],
+            'Emergency_Forward_No': contact['phone'],
+            'Contact_Name': {'id': f"replayed-contact-{seed}-{number}", 'name': contact['contactName']},
+        }
+        events.append({'path': '/webhooks/zcrm', 'body': {'module': 'Deals', 'operation': 'insert', 'data': [deal]}})
+        events.append({'path': '/webhooks/zcrm',
+                       'body': {'module': 'Deals', 'operation': 'update', 'data': [{**deal, 'Stage': 'Deal Timed Out'}]}})
+    return events
+
+
+def replay(url: str, events: list, session=None) -> list:
+    """
+    Send the events to the service one after another.
+
+    Args:
+        url (str): The service's root URL.
+        events (list): The events, as {'path', 'body'} dicts with an optional 'expect'.
+        session (requests.Session): The session to send the events on.
+
+    Returns:
+        list: Per event, a dict with its 'status', round trip 'latency_ms', the service's
+        'elapsed_ms', its 'rankings' and whether it met its expectation under 'expected'.
+    """
+    session = session or create_session(pool_size=1)
+    results = []
+    for event in events:
+        started = time.perf_counter()
+        response = session.post(url.rstrip('/') + event['path'], json=event['body'])
+        latency_ms = (time.perf_counter() - started) * 1000
+        payload = response.json() if response.headers.get('Content-Type') == 'application/json' else {}
+        rankings = payload.get('rankings', {})
+        expect = event.get('expect') or {}
+        results.append({
+            'status': response.status_code,
+            'latency_ms': latency_ms,
+            'elapsed_ms': payload.get('elapsed_ms'),
+            'rankings': rankings,
+            'expected': all(rankings.get(contact_id) == ranking for contact_id, ranking in expect.items()),
+        })
+    return results
+
+
+def _percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else float('nan')
+
+
+def summarize(results: list) -> dict:
+    """
+    Summarize a replay.
+
+    Args:
+        results (list): The results of replay.
+
+    Returns:
+        dict: The event count, failed and unexpected event counts, and the round trip latency percentiles in ms.
+    """
+    latencies = [result['latency_ms'] for result in results]
+    return {
+        'events': len(results),
+        'failed': sum(1 for result in results if result['status'] != 200),
+        'unexpected': sum(1 for result in results if not result['expected']),
+        'mean_ms': statistics.fmean(latencies) if latencies else float('nan'),
+        'p50_ms': _percentile(latencies, 0.5),
+        'p95_ms': _percentile(latencies, 0.95),
+        'max_ms': max(latencies, default=float('nan')),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay webhooks against the ranking service.")
+    parser.add_argument('url', help="the ranking service's root URL, e.g. http://127.0.0.1:8000")
+    parser.add_argument('--events', help="a JSON lines file of events to replay")
+    parser.add_argument('--generate', type=int, metavar='N', help="generate events for N stored contacts")
+    parser.add_argument('--contacts', default=DEFAULT_CONTACTS_FILE, help="the stored contacts to generate events for")
+    parser.add_argument('--record', help="write the replayed events to this JSON lines file")
+    parser.add_argument('--seed', type=int, default=0, help="the seed of the generated events")
+    args = parser.parse_args()
+    if bool(args.events) == bool(args.generate):
+        parser.error("give one of --events and --generate")
+
+    if args.events:
+        with open(args.events) as file:
+            events = [json.loads(line) for line in file if line.strip()]
+    else:
+        events = generate_events(args.contacts, args.generate, args.seed)
+    if args.record:
+        with open(args.record, 'w') as file:
+            file.writelines(json.dumps(event) + '\n' for event in events)
+
+    summary = summarize(replay(args.url, events))
+    print(pd.Series(summary).to_string())
+    sys.exit(1 if summary['failed'] or summary['unexpected'] else 0)
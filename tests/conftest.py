@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from ghl_scripts import ghl_contacts_retriever
+from ghl_scripts import obtain_access_token as ghl_access_token
+from shared_scripts import request_scheduler
+from shared_scripts.mock_api_server import MockApiServer
+from zcrm_scripts import obtain_access_token as zcrm_access_token
+from zcrm_scripts import zcrm_records_retriever
+
+# Fast retries, so tests of throttling and faults do not wait out real backoff delays.
+TEST_SCHEDULER_SETTINGS = {"max_retries": 3, "base_delay": 0.01, "max_delay": 0.05, "headroom": 0.2, "max_in_flight": 4}
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Run in an empty directory with the retrievers' data directories, and fresh schedulers and token managers."""
+    for path in ['ghl_scripts/data', 'zcrm_scripts/data']:
+        (tmp_path / path).mkdir(parents=True)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(request_scheduler, '_schedulers', {})
+    monkeypatch.setattr(request_scheduler, 'SCHEDULER_SETTINGS',
+                        {provider: dict(TEST_SCHEDULER_SETTINGS) for provider in ['ghl', 'zcrm']})
+    monkeypatch.setattr(ghl_access_token, '_manager', None)
+    monkeypatch.setattr(zcrm_access_token, '_manager', None)
+    return tmp_path
+
+
+@pytest.fixture
+def mock_api(workspace, monkeypatch):
+    """
+    Start mock API servers and point the retrievers at them.
+
+    Returns a function taking the MockApiServer arguments and returning the started
+    server; the servers are stopped after the test.
+    """
+    servers = []
+
+    def start(contacts=(), records=None, **options) -> MockApiServer:
+        server = MockApiServer(list(contacts), records or {}, **options).start()
+        servers.append(server)
+
+        expired = {'access_token': None, 'refresh_token': 'mock', 'access_token_expiry': 0}
+        for name in ['ghl-tokens.json', 'zcrm-tokens.json']:
+            (workspace / name).write_text(json.dumps(expired))
+        monkeypatch.setenv('GHL_BASE_URL', f"{server.root_url}/")
+        monkeypatch.setenv('GHL_TOKEN_FILE', str(workspace / 'ghl-tokens.json'))
+        monkeypatch.setenv('GHL_B4B_LOCATION', 'mock-location')
+        monkeypatch.setenv('ZCRM_ACCOUNTS_URL', f"{server.root_url}/")
+        monkeypatch.setenv('ZCRM_TOKEN_FILE', str(workspace / 'zcrm-tokens.json'))
+        # The base URLs are read when the retrievers are imported
+        monkeypatch.setattr(ghl_contacts_retriever, 'BASE_URL', f"{server.root_url}/")
+        monkeypatch.setattr(zcrm_records_retriever, 'BASE_URL', server.base_url)
+        monkeypatch.setattr(zcrm_records_retriever, 'BULK_URL', server.bulk_url)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
@@ -0,0 +1,68 @@
+import pandas as pd
+
+from pipeline_scripts.deal_matching import DealIndex, match_deals
+
+DEAL_COLUMNS = ['contactName_zd', 'email_zd', 'phone_zd', 'Amount', 'Stage']
+
+
+def deals() -> pd.DataFrame:
+    # Deals 0 and 1 share a name, 2 and 3 an email and 4 and 5 a phone
+    return pd.DataFrame([
+        ('jane smith', 'jane@example.com', '+61400000001', 100.0, 'Name first'),
+        ('jane smith', 'jane.smith@example.com', '+61400000002', 200.0, 'Name second'),
+        ('ann lee', 'ann@example.com', '+61400000003', 300.0, 'Email first'),
+        ('bob ray', 'ann@example.com', '+61400000004', 400.0, 'Email second'),
+        ('sam wu', 'sam@example.com', '+61400000005', 500.0, 'Phone first'),
+        ('tom wu', 'tom@example.com', '+61400000005', 600.0, 'Phone second'),
+        (None, None, None, 700.0, 'No keys'),
+    ], columns=DEAL_COLUMNS)
+
+
+def contacts(rows: list) -> pd.DataFrame:
+    # An index other than the positions, to check the matches are aligned to it
+    return pd.DataFrame(rows, columns=['contactName_ghlc', 'email_ghlc', 'phone_ghlc'],
+                        index=range(10, 10 + len(rows)))
+
+
+def scan(contacts: pd.DataFrame, deals: pd.DataFrame) -> list:
+    # The join_data loop DealIndex replaced: keys in priority order, the first deal carrying the key wins
+    stages = []
+    for _, row in contacts.iterrows():
+        stage = None
+        for key, value in row[['contactName_ghlc', 'email_ghlc', 'phone_ghlc']].items():
+            matching_row = deals[deals[key.replace('_ghlc', '_zd')] == value]
+            if not matching_row.empty:
+                stage = matching_row['Stage'].values[0]
+                break
+        stages.append(stage)
+    return stages
+
+
+def test_name_then_email_then_phone_and_first_deal_wins():
+    people = contacts([
+        ('jane smith', 'sam@example.com', '+61400000005'),   # name beats email and phone
+        ('nobody', 'ann@example.com', '+61400000005'),       # email beats phone
+        ('nobody', 'none@example.com', '+61400000005'),      # phone
+        ('jane smith', None, None),                          # first of two deals with the name
+        (None, 'ann@example.com', None),                     # first of two deals with the email
+        (None, None, '+61400000005'),                        # first of two deals with the phone
+        (None, None, None),                                  # missing keys never match
+        ('nobody', 'none@example.com', '+61499999999'),
+    ])
+
+    matched = match_deals(people, deals())
+
+    assert matched['Stage'].tolist()[:6] == ['Name first', 'Email first', 'Phone first', 'Name first',
+                                             'Email first', 'Phone first']
+    assert matched['Stage'].iloc[6:].isna().all()
+    assert matched['Amount'].tolist()[:6] == [100.0, 300.0, 500.0, 100.0, 300.0, 500.0]
+    assert matched.index.equals(people.index)
+    assert [None if pd.isna(stage) else stage for stage in matched['Stage']] == scan(people, deals())
+
+
+def test_resolve_gives_deal_positions():
+    people = contacts([('ann lee', None, None), (None, 'tom@example.com', None), ('nobody', None, None)])
+
+    positions = DealIndex(deals()).resolve(people)
+
+    assert positions.tolist() == [2, 5, -1]
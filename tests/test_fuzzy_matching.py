@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline_scripts.fuzzy_matching import FUZZY_THRESHOLD, FuzzyDealMatcher
+
+
+def deals(rows: list) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=['contactName_zd', 'email_zd', 'phone_zd'])
+
+
+def contacts(rows: list) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=['contactName_ghlc', 'email_ghlc', 'phone_ghlc'])
+
+
+def unmatched(count: int) -> tuple:
+    return np.full(count, -1, dtype=np.int64), np.full(count, np.nan)
+
+
+@pytest.fixture
+def matcher():
+    return FuzzyDealMatcher(deals([
+        ('margaret thompson', None, None),
+        ('peter pan', 'peter@example.com', '+61400000001'),
+        ('peter pan', 'peter@example.com', '+61400000001'),
+        ('unrelated person', None, None),
+    ]))
+
+
+PEOPLE = contacts([
+    ('margaret thomson', None, None),
+    ('peter pann', 'peter@example.com', '+61400000001'),
+    ('zed quinn', None, None),
+    ('unrelated person', None, None),
+])
+
+
+def test_similar_keys_match_the_earliest_best_deal(matcher):
+    positions, confidence = matcher.resolve(PEOPLE, *unmatched(len(PEOPLE)))
+
+    # Deals 1 and 2 score the same, so the earlier one is taken
+    assert positions.tolist() == [0, 1, -1, 3]
+    assert FUZZY_THRESHOLD <= confidence[0] < 1
+    assert FUZZY_THRESHOLD <= confidence[1] < 1
+    assert np.isnan(confidence[2])
+    assert confidence[3] == 1
+
+
+def test_confidence_is_the_mean_similarity_of_the_keys_both_sides_have(matcher):
+    candidates = pd.DataFrame({'row': [0, 1, 1], 'deal': [0, 1, 2]})
+
+    scores = matcher.score(PEOPLE, candidates)
+    name_only = matcher.score(contacts([('peter pann', None, None)]), pd.DataFrame({'row': [0], 'deal': [1]}))
+
+    # Contact 0 and deal 0 only both have a name; contact 1 adds an equal email and phone to its name
+    _, confidence = matcher.resolve(PEOPLE, *unmatched(len(PEOPLE)))
+    assert scores[0] == confidence[0]
+    assert scores[1] == scores[2] == confidence[1]
+    assert scores[1] == pytest.approx((name_only[0] + 2) / 3)
+
+
+def test_threshold_decides_what_matches():
+    rows = [('margaret thompson', None, None)]
+    people = contacts([('margaret thomson', None, None)])
+    score = FuzzyDealMatcher(deals(rows)).score(people, pd.DataFrame({'row': [0], 'deal': [0]}))[0]
+
+    at = FuzzyDealMatcher(deals(rows), threshold=score).resolve(people, *unmatched(1))
+    above = FuzzyDealMatcher(deals(rows), threshold=np.nextafter(score, 1)).resolve(people, *unmatched(1))
+
+    assert at[0].tolist() == [0] and at[1][0] == score
+    assert above[0].tolist() == [-1] and np.isnan(above[1][0])
+
+
+def test_exact_matches_are_kept(matcher):
+    positions = np.array([3, -1, -1, -1])
+    confidence = np.array([1.0, np.nan, np.nan, np.nan])
+
+    resolved, resolved_confidence = matcher.resolve(PEOPLE, positions, confidence)
+
+    assert resolved.tolist() == [3, 1, -1, 3]
+    assert resolved_confidence[0] == 1
+    # The inputs are not changed in place
+    assert positions.tolist() == [3, -1, -1, -1]
+
+
+@pytest.mark.parametrize('neighbourhood, below, above, reversed_below', [
+    (1, 'g', 'h', 'p'),
+    (3, 'efg', 'hij', 'nop'),
+])
+def test_names_are_compared_with_the_neighbourhood_either_side(neighbourhood, below, above, reversed_below):
+    names = [f"contact {letter}" for letter in 'abcdefghijklmnop']
+    matcher = FuzzyDealMatcher(deals([(name, None, None) for name in names]), neighbourhood=neighbourhood)
+
+    # 'contact gz' sorts between 'contact g' and 'contact h', so the window of offsets -n to n - 1
+    # from its insertion point holds n names below it and n above. Reversed, 'zg tcatnoc' sorts
+    # after every name, so only the n below it are compared
+    candidates = matcher.candidates(contacts([('contact gz', None, None)]), np.array([0]))
+
+    compared = {names[deal] for deal in candidates['deal']}
+    assert compared == {f"contact {letter}" for letter in below + above + reversed_below}
+
+
+def test_blocks_larger_than_the_limit_are_skipped():
+    rows = [(f"person {i}", f"person{i}@example.com", f"+6140000000{i}") for i in range(3)]
+    people = contacts([('somebody else', 'other@example.com', '+61499990001')])
+
+    small = FuzzyDealMatcher(deals(rows), neighbourhood=0, max_block_size=3).candidates(people, np.array([0]))
+    large = FuzzyDealMatcher(deals(rows), neighbourhood=0, max_block_size=2).candidates(people, np.array([0]))
+
+    assert sorted(small['deal']) == [0, 1, 2]
+    assert large.empty
@@ -0,0 +1,82 @@
+import pytest
+
+from ghl_scripts import ghl_contacts_retriever
+from ghl_scripts.ghl_contacts_retriever import fetch_all_contacts, ghl_headers
+from shared_scripts.mock_api_server import sample_contacts
+from zcrm_scripts import zcrm_records_retriever
+from zcrm_scripts.zcrm_records_retriever import get_zcrm_data, search_criteria
+from zcrm_scripts.zcrm_stub_server import sample_records
+
+
+def contact_ids(contacts):
+    return [contact['id'] for contact in contacts]
+
+
+def test_contacts_are_paged_in_full(mock_api):
+    contacts = sample_contacts(230, ['mock-location'])
+    mock_api(contacts, page_size=50)
+
+    fetched = fetch_all_contacts(ghl_headers(), 'mock-location')
+
+    assert sorted(contact_ids(fetched)) == sorted(contact_ids(contacts))
+
+
+def test_contacts_fetch_survives_injected_errors(mock_api):
+    contacts = sample_contacts(230, ['mock-location'])
+    # The seed spares the token request, which the scheduler does not retry
+    server = mock_api(contacts, page_size=50, error_rate=0.2, seed=2)
+
+    fetched = fetch_all_contacts(ghl_headers(), 'mock-location')
+
+    assert sorted(contact_ids(fetched)) == sorted(contact_ids(contacts))
+    assert server.stats['injected_errors'] > 0
+
+
+def test_contacts_fetch_resumes_from_checkpoint(mock_api, monkeypatch):
+    contacts = sample_contacts(230, ['mock-location'])
+    server = mock_api(contacts, page_size=50)
+    iter_contact_pages = ghl_contacts_retriever.iter_contact_pages
+
+    def failing_pages(*args, **kwargs):
+        for number, page in enumerate(iter_contact_pages(*args, **kwargs)):
+            if number == 2:
+                raise ConnectionError("connection lost")
+            yield page
+
+    monkeypatch.setattr(ghl_contacts_retriever, 'iter_contact_pages', failing_pages)
+    with pytest.raises(ConnectionError):
+        fetch_all_contacts(ghl_headers(), 'mock-location')
+
+    monkeypatch.setattr(ghl_contacts_retriever, 'iter_contact_pages', iter_contact_pages)
+    requests_before = server.stats['requests']
+    fetched = fetch_all_contacts(ghl_headers(), 'mock-location')
+
+    assert sorted(contact_ids(fetched)) == sorted(contact_ids(contacts))
+    # Pages 1 and 2 came from the checkpoint, pages 3 to 5 from the server
+    assert server.stats['requests'] - requests_before == 3
+
+
+def test_zcrm_search_resumes_from_checkpoint(mock_api, monkeypatch):
+    records = sample_records('Leads', 1500)
+    mock_api(records={'Leads': records})
+    get_zcrm_page = zcrm_records_retriever.get_zcrm_page
+    requested = []
+
+    def failing_page(endpoint, criteria, page, *args):
+        if page == 6 and not requested:
+            requested.append(page)
+            raise ConnectionError("connection lost")
+        if requested:
+            requested.append(page)
+        return get_zcrm_page(endpoint, criteria, page, *args)
+
+    monkeypatch.setattr(zcrm_records_retriever, 'get_zcrm_page', failing_page)
+    criteria = search_criteria(['B4B'])
+    with pytest.raises(ConnectionError):
+        get_zcrm_data('Leads', criteria, fields=['Full_Name'])
+
+    response = get_zcrm_data('Leads', criteria, fields=['Full_Name'])
+
+    assert sorted(contact_ids(response['data'])) == sorted(contact_ids(records))
+    assert response['info']['more_records'] is False
+    assert min(requested[1:]) == 6
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline_scripts.normalization import (email_key, name_key, normalize_emails, normalize_names, normalize_phones,
+                                            phone_key)
+
+PHONES = ['0412 345 678', '(04) 1234-5678', '+61 412 345 678', '61412345678', '0061412345678', '412345678',
+          '+44 20 7946 0958', '+0', '61 4', '0', '0.0', '00', '+', '+61', '61', 'abc', '', '  ',
+          412345678, 61412345678.0, 0, 0.0, -5, None, np.nan, pd.NA]
+EMAILS = ['Jane@Example.com', '  jane@example.com ', 'JANE', 'foo', '', '   ', 'a b@c.d', 'ÉMILE@exemple.fr',
+          12, 1.5, None, np.nan, pd.NA]
+NAMES = [' Jane  SMITH ', 'jane\tsmith', 'Jane\nSmith', 'ÉMILE Zola', 'O\'Brien', '', '  ', 'x',
+         42, None, np.nan, pd.NA]
+
+
+def keys(values: pd.Series) -> list:
+    return [None if pd.isna(value) else value for value in values]
+
+
+@pytest.mark.parametrize('normalize, key, values', [
+    (normalize_phones, phone_key, PHONES),
+    (normalize_emails, email_key, EMAILS),
+    (normalize_names, name_key, NAMES),
+])
+def test_columns_normalize_like_single_values(normalize, key, values):
+    expected = [key(value) for value in values]
+
+    assert keys(normalize(pd.Series(values, dtype=object))) == expected
+    text = [value for value in values if isinstance(value, str)]
+    assert keys(normalize(pd.Series(text, dtype='string[pyarrow]'))) == [key(value) for value in text]
+
+
+def test_phones_read_as_floats_normalize_like_their_text():
+    phones = pd.Series([412345678.0, 61412345678.0, np.nan, 0.0])
+
+    assert keys(normalize_phones(phones)) == ['+61412345678', '+61412345678', None, None]
+
+
+@pytest.mark.parametrize('phone', ['0', '0.0', 0, 0.0, '00', '+61', '61', '+'])
+def test_phones_without_a_number_have_no_key(phone):
+    assert phone_key(phone) is None
+    assert normalize_phones(pd.Series([phone, '0412 345 678'], dtype=object)).isna().tolist() == [True, False]
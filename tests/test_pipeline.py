@@ -0,0 +1,24 @@
+import pytest
+
+import main
+from benchmarks.synthetic_data import write_dataset
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    return write_dataset(str(tmp_path_factory.mktemp('data')), 1500, formats=('parquet', 'json'))
+
+
+def run(tmp_path, paths, name, **options):
+    detailed, condensed = tmp_path / f"{name}-detailed.csv", tmp_path / f"{name}-condensed.csv"
+    main.run_pipeline(paths['contacts'], paths['leads'], paths['deals'], str(detailed), str(condensed), **options)
+    return detailed.read_bytes(), condensed.read_bytes()
+
+
+def test_json_input_ranks_like_parquet_input(dataset, tmp_path):
+    parquet = run(tmp_path, dataset['parquet'], 'parquet')
+
+    # Phones keep their text, e.g. a leading '+', rather than being read as numbers
+    assert run(tmp_path, dataset['json'], 'json') == parquet
+    assert run(tmp_path, dataset['json'], 'json-chunked', chunk_size=400) == parquet
+    assert run(tmp_path, dataset['parquet'], 'parquet-chunked', chunk_size=400) == parquet
@@ -0,0 +1,115 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline_scripts.frame_schema import GHL_CONTACT_DTYPES, ZCRM_DEAL_DTYPES, compact_frame
+from pipeline_scripts.ranking import rank_contacts
+
+
+def assign_ranking(data: pd.DataFrame) -> pd.DataFrame:
+    """The row-by-row ranking the rule table replaced, kept as it was to check the rules against"""
+    def assign_rank(row):
+        if (
+            row['tags'] is None or 'phone verified' not in row['tags']
+        ) and str(row['Amount']) == 'nan' and (
+            row['Ph_verified'] is None and row['Qualified'] is None
+        ):
+            return (1, 'Spammer')
+        else:
+            if row['Stage'] == "Deal Timed Out":
+                return (0, 'Unknown')
+            elif row['Handset_Count'] == "1-2":
+                if str(row['Amount']) != 'nan' and row['Stage'] != "Deal Timed Out":
+                    return (12, 'Sold and delivered')
+                if (row['Ph_verified'] == "True" or row['Qualified'] == "True") and str(row['Amount']) == 'nan':
+                    return (7, '1-2 line | responded | no sale')
+                if row['Ph_verified'] is None and row['Qualified'] is None:
+                    return (2, '1-2 line | no response')
+            elif row['Handset_Count'] == "3-4":
+                if str(row['Amount']) != 'nan' and (row['Stage'] == "Checked & Signed Off" and row['Stage'] != "Deal Timed Out"):
+                    return (12, 'Sold and delivered')
+                if (row['Ph_verified'] == "True" or row['Qualified'] == "True") and str(row['Amount']) == 'nan':
+                    return (8, '3-4 line | responded | no sale')
+                if row['Ph_verified'] is None and row['Qualified'] is None:
+                    return (3, '3-4 line | no response')
+            elif row['Handset_Count'] == "5-9":
+                if str(row['Amount']) != 'nan' and row['Stage'] != "Deal Timed Out":
+                    return (12, 'Sold and delivered')
+                if (row['Ph_verified'] == "True" or row['Qualified'] == "True") and str(row['Amount']) == 'nan':
+                    return (9, '5-9 line | responded | no sale')
+                if row['Ph_verified'] is None and row['Qualified'] is None:
+                    return (4, '5-9 line | no response')
+            elif row['Handset_Count'] == "10-24":
+                if str(row['Amount']) != 'nan' and row['Stage'] != "Deal Timed Out":
+                    return (12, 'Sold and delivered')
+                if (row['Ph_verified'] == "True" or row['Qualified'] == "True") and str(row['Amount']) == 'nan':
+                    return (10, '10-24 line | responded | no sale')
+                if row['Ph_verified'] is None and row['Qualified'] is None:
+                    return (5, '10-24 line | no response')
+            elif row['Handset_Count'] == "25+":
+                if str(row['Amount']) != 'nan' and row['Stage'] != "Deal Timed Out":
+                    return (12, 'Sold and delivered')
+                if (row['Ph_verified'] == "True" or row['Qualified'] == "True") and str(row['Amount']) == 'nan':
+                    return (11, '25+ line | responded | no sale')
+                if row['Ph_verified'] is None and row['Qualified'] is None:
+                    return (6, '25+ line | no response')
+            else:
+                return (0, 'Unknown')
+
+    result = data.copy()
+    result[['ranking', 'ranking_desc']] = result.apply(assign_rank, axis=1, result_type='expand')
+    return result
+
+
+def contacts() -> pd.DataFrame:
+    # Every combination of the fields the rules look at, in the dtypes the joined data has them
+    rows = itertools.product(
+        [None, [], ['b4b'], ['b4b', 'phone verified']],
+        [None, '1-2', '3-4', '5-9', '10-24', '25+', '50+'],
+        [None, 'True', 'False'],
+        [None, 'True', 'False'],
+        [0.0, 250.0, np.nan],
+        [np.nan, 'Deal Timed Out', 'Checked & Signed Off', 'Closed Won'],
+    )
+    return pd.DataFrame(list(rows), columns=['tags', 'Handset_Count', 'Ph_verified', 'Qualified', 'Amount', 'Stage'])
+
+
+def assert_same_ranking(data: pd.DataFrame, expected: pd.DataFrame) -> None:
+    ranking, ranking_desc = rank_contacts(data)
+    pd.testing.assert_series_equal(ranking, expected['ranking'])
+    pd.testing.assert_series_equal(ranking_desc, expected['ranking_desc'])
+
+
+def test_rules_rank_like_the_row_by_row_ranking():
+    data = contacts()
+    expected = assign_ranking(data)
+
+    # Some combinations match no rule, and are left unranked with a None description
+    assert expected['ranking'].isna().any()
+    assert expected.loc[expected['ranking'].isna(), 'ranking_desc'].map(lambda value: value is None).all()
+    assert_same_ranking(data, expected)
+
+
+def test_rules_rank_every_contact_as_whole_numbers():
+    data = contacts()
+    expected = assign_ranking(data)
+    ranked = expected['ranking'].notna().to_numpy()
+
+    expected = assign_ranking(data[ranked])
+    assert expected['ranking'].dtype == np.int64
+    assert_same_ranking(data[ranked], expected)
+
+
+@pytest.mark.parametrize('ranked_only', [False, True])
+def test_rules_rank_compacted_data_the_same(ranked_only):
+    data = contacts()
+    if ranked_only:
+        data = data[assign_ranking(data)['ranking'].notna().to_numpy()]
+    expected = assign_ranking(data)
+
+    compacted = compact_frame(data.copy(), {**GHL_CONTACT_DTYPES, **ZCRM_DEAL_DTYPES})
+    assert isinstance(compacted['tags'].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_bool_dtype(compacted['Ph_verified'].dtype)
+    assert_same_ranking(compacted, expected)
@@ -0,0 +1,123 @@
+import pytest
+import requests
+
+import main
+from benchmarks.synthetic_data import write_dataset
+from pipeline_scripts.campaign_rollup import SOLD_RANKING
+from pipeline_scripts.field_extraction import CUSTOM_FIELD_COLUMNS
+from pipeline_scripts.ranking_service import RankingServer
+from shared_scripts.webhook_replayer import generate_events, replay
+
+FIELD_IDS = {column: field_id for field_id, column in CUSTOM_FIELD_COLUMNS.items()}
+
+
+@pytest.fixture
+def service(tmp_path):
+    paths = write_dataset(str(tmp_path), 300)['parquet']
+    ranker = main.build_live_ranker(paths['contacts'], paths['leads'], paths['deals'])
+    server = RankingServer(ranker).start()
+    yield server, paths
+    server.stop()
+
+
+def new_contact(number: int) -> dict:
+    return {
+        'id': f"webhook-contact-{number}",
+        'name': f"Webhook Contact {number}",
+        'email': f"webhook{number}@example.com",
+        'phone': f"+6140000000{number}",
+        'source': 'facebook form',
+        'tags': ['b4b'],
+        'attributions': [{'utmCampaign': 'webhook-campaign', 'utmMedium': 'paid', 'utmContent': 'webhook-creative',
+                          'medium': 'facebook'}],
+        'customFields': [{'id': FIELD_IDS['Handset_Count'], 'value': '5-9'}],
+    }
+
+
+def new_deal(contact: dict, stage: str) -> dict:
+    return {
+        'id': f"deal-of-{contact['id']}",
+        'Deal_Name': f"{contact['name']} deal",
+        'Stage': stage,
+        'Amount': 1234.5,
+        'Generic_Email': contact['email'],
+        'Contact_Name': {'id': f"zcrm-{contact['id']}", 'name': contact['name']},
+    }
+
+
+def post(server, path: str, body: dict) -> dict:
+    response = requests.post(f"{server.root_url}{path}", json=body)
+    assert response.status_code == 200
+    return response.json()['rankings']
+
+
+def current_ranking(server, contact_id: str):
+    response = requests.get(f"{server.root_url}/contacts/{contact_id}")
+    return response.json()['ranking'] if response.status_code == 200 else response.status_code
+
+
+def test_contact_and_deal_webhooks_round_trip(service):
+    server, _ = service
+    contact = new_contact(1)
+
+    created = post(server, '/webhooks/ghl', {'type': 'ContactCreate', **contact})
+    assert created[contact['id']] != SOLD_RANKING
+    assert current_ranking(server, contact['id']) == created[contact['id']]
+
+    signed_off = post(server, '/webhooks/zcrm', {
+        'module': 'Deals', 'operation': 'insert', 'data': [new_deal(contact, 'Checked & Signed Off')]})
+    assert signed_off == {contact['id']: SOLD_RANKING}
+    assert current_ranking(server, contact['id']) == SOLD_RANKING
+    campaign = requests.get(f"{server.root_url}/campaigns", params={'utmCampaign': 'webhook-campaign'}).json()
+    assert [row['conversions'] for row in campaign['campaigns']] == [1]
+
+    timed_out = post(server, '/webhooks/zcrm', {
+        'module': 'Deals', 'operation': 'update', 'data': [new_deal(contact, 'Deal Timed Out')]})
+    assert timed_out[contact['id']] != SOLD_RANKING
+    assert current_ranking(server, contact['id']) == timed_out[contact['id']]
+
+    post(server, '/webhooks/ghl', {'type': 'ContactDelete', 'id': contact['id']})
+    assert current_ranking(server, contact['id']) == 404
+    campaign = requests.get(f"{server.root_url}/campaigns", params={'utmCampaign': 'webhook-campaign'}).json()
+    assert campaign['campaigns'] == []
+
+
+def test_replayed_events_match_the_queried_rankings(service):
+    server, paths = service
+    events = generate_events(paths['contacts'], 5)
+
+    results = replay(server.root_url, events)
+
+    assert all(result['status'] == 200 for result in results)
+    for event, result in zip(events, results):
+        if event['path'] == '/webhooks/ghl':
+            assert list(result['rankings']) == [event['body']['id']]
+    # The last answer for each contact is its current ranking
+    final = {contact_id: ranking for result in results for contact_id, ranking in result['rankings'].items()}
+    assert final
+    assert all(current_ranking(server, contact_id) == ranking for contact_id, ranking in final.items())
+    status = requests.get(f"{server.root_url}/status").json()
+    assert status['contact_events'] == 5
+    assert status['deal_events'] == 10
+
+
+def test_replayed_contacts_keep_their_campaigns(service):
+    server, paths = service
+    events = generate_events(paths['contacts'], 5)
+    before = requests.get(f"{server.root_url}/campaigns").json()['campaigns']
+
+    replay(server.root_url, [event for event in events if event['path'] == '/webhooks/ghl'])
+
+    after = requests.get(f"{server.root_url}/campaigns").json()['campaigns']
+    campaigns = {row['utmCampaign'] for row in before}
+    assert {row['utmCampaign'] for row in after} == campaigns
+    assert sum(row['contacts'] for row in after) == sum(row['contacts'] for row in before)
+
+
+def test_bad_requests_are_rejected(service):
+    server, _ = service
+
+    assert requests.post(f"{server.root_url}/webhooks/ghl", data=b'not json').status_code == 400
+    assert requests.post(f"{server.root_url}/webhooks/ghl", json={'type': 'ContactUpdate'}).status_code == 422
+    assert requests.post(f"{server.root_url}/webhooks/other", json={}).status_code == 404
+    assert requests.get(f"{server.root_url}/contacts/unknown").status_code == 404
@@ -0,0 +1,187 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from ghl_scripts.ghl_contacts_retriever import fetch_all_contacts, ghl_headers
+from shared_scripts.mock_api_server import sample_contacts
+from shared_scripts.request_scheduler import RequestScheduler
+
+
+def make_response(status: int, headers: dict = None, authorization: str = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.raw = io.BytesIO(b'')
+    response.headers.update(headers or {})
+    response.request = requests.Request('GET', 'http://api.test/', headers={
+        'Authorization': authorization} if authorization else {}).prepare()
+    return response
+
+
+class ScriptedHttp:
+    """Answers requests with a fixed sequence of responses or exceptions, counting the calls."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        outcome = self.outcomes[min(self.calls, len(self.outcomes) - 1)]
+        self.calls += 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class RejectedTokens:
+    """Stands in for a TokenManager, recording the tokens it was asked to replace."""
+
+    def __init__(self):
+        self.invalidated = []
+
+    def invalidate(self, rejected):
+        self.invalidated.append(rejected)
+
+    def __call__(self, request):
+        return request
+
+
+def scheduler(**settings) -> RequestScheduler:
+    return RequestScheduler('test', **{'max_retries': 3, 'base_delay': 0.01, 'max_delay': 0.05, **settings})
+
+
+def test_server_errors_are_retried():
+    http = ScriptedHttp(make_response(503), make_response(502), make_response(200))
+
+    response = scheduler().request('GET', 'http://api.test/', http)
+
+    assert response.status_code == 200
+    assert http.calls == 3
+
+
+def test_connection_errors_are_retried():
+    http = ScriptedHttp(requests.exceptions.ConnectionError(), make_response(200))
+
+    assert scheduler().request('GET', 'http://api.test/', http).status_code == 200
+    assert http.calls == 2
+
+
+def test_retries_give_up_after_max_retries():
+    http = ScriptedHttp(make_response(503))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        scheduler(max_retries=2).request('GET', 'http://api.test/', http)
+    assert http.calls == 3
+
+
+def test_client_errors_are_not_retried():
+    http = ScriptedHttp(make_response(404))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        scheduler().request('GET', 'http://api.test/', http)
+    assert http.calls == 1
+
+
+def test_rate_limited_requests_wait_for_retry_after():
+    http = ScriptedHttp(make_response(429, {'Retry-After': '0.2'}), make_response(200))
+    requests_scheduler = scheduler()
+
+    start = time.monotonic()
+    response = requests_scheduler.request('GET', 'http://api.test/', http)
+
+    assert response.status_code == 200
+    assert time.monotonic() - start >= 0.2
+    assert http.calls == 2
+
+
+def test_rate_limit_holds_back_other_threads():
+    requests_scheduler = scheduler()
+    requests_scheduler.pause(0.2)
+
+    start = time.monotonic()
+    requests_scheduler.request('GET', 'http://api.test/', ScriptedHttp(make_response(200)))
+
+    assert time.monotonic() - start >= 0.2
+
+
+def test_low_quota_spreads_requests_until_reset():
+    requests_scheduler = scheduler()
+
+    requests_scheduler.observe(make_response(200, {
+        'X-RateLimit-Limit': '100', 'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': '5'}))
+
+    assert requests_scheduler.interval == pytest.approx(0.5)
+
+
+def test_unauthorized_request_is_retried_once_with_a_new_token():
+    auth = RejectedTokens()
+    http = ScriptedHttp(make_response(401, authorization='Bearer stale'), make_response(200))
+
+    response = scheduler().request('GET', 'http://api.test/', http, auth=auth)
+
+    assert response.status_code == 200
+    assert auth.invalidated == ['stale']
+
+
+def test_repeated_unauthorized_request_fails():
+    auth = RejectedTokens()
+    http = ScriptedHttp(make_response(401, authorization='Bearer stale'))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        scheduler().request('GET', 'http://api.test/', http, auth=auth)
+    assert auth.invalidated == ['stale']
+    assert http.calls == 2
+
+
+def test_requests_in_flight_are_capped():
+    in_flight, peak = 0, 0
+    lock = threading.Lock()
+
+    class SlowHttp:
+        def request(self, method, url, **kwargs):
+            nonlocal in_flight, peak
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            time.sleep(0.02)
+            with lock:
+                in_flight -= 1
+            return make_response(200)
+
+    requests_scheduler, http = scheduler(max_in_flight=3), SlowHttp()
+    threads = [threading.Thread(target=requests_scheduler.request, args=('GET', 'http://api.test/', http))
+               for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak == 3
+
+
+def test_revoked_token_is_replaced_against_the_mock_server(mock_api, workspace):
+    contacts = sample_contacts(120, ['mock-location'])
+    server = mock_api(contacts, page_size=50, require_auth=True)
+    # A token the server never issued, but not yet expired locally
+    revoked = {'access_token': 'revoked', 'refresh_token': 'mock', 'access_token_expiry': time.time() + 3600}
+    (workspace / 'ghl-tokens.json').write_text(json.dumps(revoked))
+
+    fetched = fetch_all_contacts(ghl_headers(), 'mock-location')
+
+    assert len(fetched) == 120
+    assert server.stats['unauthorized'] == 1
+    assert server.stats['token_grants'] == 1
+
+
+def test_rate_limit_headers_pace_the_fetch_against_the_mock_server(mock_api):
+    contacts = sample_contacts(120, ['mock-location'])
+    server = mock_api(contacts, page_size=20, rate_limit=4, rate_window=0.5)
+
+    fetched = fetch_all_contacts(ghl_headers(), 'mock-location')
+
+    assert len(fetched) == 120
+    # The scheduler waits for the window to reset once the quota is used up, instead of being throttled
+    assert server.stats['throttled'] == 0
@@ -0,0 +1,41 @@
+import pytest
+
+import main
+from benchmarks.synthetic_data import generate
+from pipeline_scripts import sqlite_store
+
+
+@pytest.fixture
+def store(tmp_path):
+    contacts, leads, deals = generate(200)
+    db_path = str(tmp_path / 'store.db')
+    sqlite_store.upsert_ghl_contacts(contacts, db_path)
+    # The synthetic leads and deals are cleaned records, which have no Zoho CRM IDs
+    sqlite_store.upsert_zcrm_leads([{**lead, 'id': f"lead-{i}"} for i, lead in enumerate(leads)], db_path)
+    sqlite_store.upsert_zcrm_deals([{**deal, 'id': f"deal-{i}"} for i, deal in enumerate(deals)], db_path)
+    return db_path, contacts
+
+
+def test_lookup_needs_a_key(store):
+    connection = sqlite_store.connect(store[0])
+    with pytest.raises(Exception, match="contact ID, email, phone or name"):
+        sqlite_store.lookup_contacts(connection)
+    assert sqlite_store.lookup_contacts(connection, email='  ') == []
+
+
+def test_main_ranks_and_looks_up_the_store(store, tmp_path, capsys):
+    db_path, contacts = store
+    report = str(tmp_path / 'report.json')
+    contact = next(contact for contact in contacts if contact['email'])
+
+    main.rank_store(db_path)
+    connection = sqlite_store.connect(db_path)
+    assert len(sqlite_store.ranking_history(connection, contact['id'])) == 1
+
+    capsys.readouterr()
+    main.main(['lookup', '--db', db_path, '--email', contact['email'].upper(), '--report', report])
+    output = capsys.readouterr().out
+    assert f"'contact_id': '{contact['id']}'" in output
+
+    main.main(['lookup', '--db', db_path, '--id', 'no-such-contact', '--report', report])
+    assert "No matching contacts" in capsys.readouterr().out
@@ -0,0 +1,86 @@
+import os
+
+import pandas as pd
+import pytest
+
+import main
+from benchmarks.synthetic_data import write_dataset
+from pipeline_scripts import stage_cache
+from pipeline_scripts.stage_cache import StageCache, code_version
+
+
+def clean(data):
+    return data.dropna()
+
+
+def clean_differently(data):
+    return data.fillna(0)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return StageCache(str(tmp_path / 'cache'))
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    path = tmp_path / 'input.json'
+    path.write_text('[{"a": 1}]')
+    return str(path)
+
+
+def test_key_changes_with_the_input_files(cache, input_file):
+    key = cache.key('clean', [input_file], code_version(clean))
+    assert cache.key('clean', [input_file], code_version(clean)) == key
+
+    with open(input_file, 'w') as file:
+        file.write('[{"a": 2}]')
+    assert cache.key('clean', [input_file], code_version(clean)) != key
+
+
+def test_key_changes_with_the_code_and_settings(cache, input_file):
+    key = cache.key('clean', [input_file], code_version(clean), ('a', 1))
+
+    assert code_version(clean) != code_version(clean_differently)
+    assert cache.key('clean', [input_file], code_version(clean_differently), ('a', 1)) != key
+    assert cache.key('clean', [input_file], code_version(clean), ('a', 2)) != key
+    assert cache.key('join', [input_file], code_version(clean), ('a', 1)) != key
+
+
+@pytest.mark.parametrize('library', [stage_cache.pd, stage_cache.np, stage_cache.pa])
+def test_key_changes_with_the_library_versions(cache, input_file, monkeypatch, library):
+    key = cache.key('clean', [input_file], code_version(clean))
+
+    monkeypatch.setattr(library, '__version__', library.__version__ + '.other')
+    assert cache.key('clean', [input_file], code_version(clean)) != key
+
+
+def test_entries_round_trip_with_their_dtypes(cache):
+    frame = pd.DataFrame({'text': pd.array(['a', None], dtype='string[pyarrow]'),
+                          'category': pd.Categorical(['x', 'x']), 'flag': pd.array([True, None], dtype='boolean')})
+
+    assert cache.get('missing') is None
+    cache.put('frame', frame)
+    pd.testing.assert_frame_equal(cache.get('frame'), frame)
+
+
+def test_pipeline_reuses_the_joined_data_until_an_input_changes(tmp_path, monkeypatch):
+    paths = write_dataset(str(tmp_path / 'data'), 300)['parquet']
+    cache = StageCache(str(tmp_path / 'cache'))
+    outputs = [str(tmp_path / 'detailed.csv'), str(tmp_path / 'condensed.csv')]
+    main.run_pipeline(paths['contacts'], paths['leads'], paths['deals'], *outputs, cache=cache)
+    detailed = open(outputs[0], 'rb').read()
+
+    joins = []
+    load_joined_data = main.load_joined_data
+    monkeypatch.setattr(main, 'load_joined_data', lambda *args: joins.append(args) or load_joined_data(*args))
+    main.run_pipeline(paths['contacts'], paths['leads'], paths['deals'], *outputs, cache=cache)
+    assert joins == []
+    assert open(outputs[0], 'rb').read() == detailed
+
+    # Changed deals are a miss
+    write_dataset(str(tmp_path / 'other'), 300, seed=1)
+    os.replace(str(tmp_path / 'other' / 'clean-zcrm-deals.parquet'), paths['deals'])
+    main.run_pipeline(paths['contacts'], paths['leads'], paths['deals'], *outputs, cache=cache)
+    assert len(joins) == 1
+    assert open(outputs[0], 'rb').read() != detailed
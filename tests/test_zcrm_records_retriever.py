@@ -0,0 +1,80 @@
+from zcrm_scripts import zcrm_records_retriever, zcrm_stub_server
+from zcrm_scripts.zcrm_records_retriever import (
+    LEAD_SOURCES,
+    bulk_criteria,
+    search_criteria,
+    zcrm_list_deals,
+    zcrm_list_leads,
+)
+from zcrm_scripts.zcrm_stub_server import sample_records
+
+COMPARED_FIELDS = ['id', 'Contact_Name', 'Amount', 'Stage', 'Modified_Time']
+
+
+def compared(records):
+    return sorted(({field: record.get(field) for field in COMPARED_FIELDS} for record in records),
+                  key=lambda record: record['id'])
+
+
+def test_criteria_share_the_lead_sources():
+    criteria = search_criteria(LEAD_SOURCES)
+
+    assert criteria == '((Lead_Source:equals:B4B)or(Lead_Source:equals:B4B Unqualified))'
+    assert bulk_criteria(LEAD_SOURCES)['value'] == LEAD_SOURCES
+    since = bulk_criteria(LEAD_SOURCES, '2024-01-01T00:00:00+10:00')
+    assert since['group_operator'] == 'and'
+    assert since['group'][0] == bulk_criteria(LEAD_SOURCES)
+
+
+def test_small_module_is_searched(mock_api):
+    server = mock_api(records={'Leads': sample_records('Leads', 300)})
+
+    leads = zcrm_list_leads()['data']
+
+    assert len(leads) == 300
+    assert not server.jobs
+
+
+def test_bulk_read_matches_search(mock_api, monkeypatch):
+    monkeypatch.setattr(zcrm_records_retriever, 'BULK_POLL_SECONDS', 0)
+    deals = sample_records('Deals', 2500)
+    server = mock_api(records={'Deals': deals}, bulk_page_size=1000)
+
+    bulk = zcrm_list_deals()['data']
+    assert len(server.jobs) == 3
+
+    # Search everything, as if the API allowed it
+    monkeypatch.setattr(zcrm_records_retriever, 'BULK_READ_THRESHOLD', len(deals))
+    monkeypatch.setattr(zcrm_records_retriever, 'SEARCH_RECORD_LIMIT', 3000)
+    monkeypatch.setattr(zcrm_stub_server, 'SEARCH_RECORD_LIMIT', 3000)
+    searched = zcrm_list_deals()['data']
+
+    assert len(server.jobs) == 3
+    assert compared(bulk) == compared(searched) == compared(deals)
+    # The export leaves lookup names out; they are fetched by ID afterwards
+    assert all(deal['Contact_Name']['name'] for deal in bulk)
+
+
+def test_incremental_fetch_under_search_limit_is_searched(mock_api):
+    deals = sample_records('Deals', 2500)
+    for deal in deals[:500]:
+        deal['Modified_Time'] = '2024-06-01T00:00:00+10:00'
+    server = mock_api(records={'Deals': deals})
+
+    changed = zcrm_list_deals(modified_since='2024-03-01T00:00:00+10:00')['data']
+
+    assert compared(changed) == compared(deals[:500])
+    assert not server.jobs
+
+
+def test_incremental_fetch_past_search_limit_switches_to_bulk_read(mock_api, monkeypatch):
+    monkeypatch.setattr(zcrm_records_retriever, 'BULK_POLL_SECONDS', 0)
+    deals = sample_records('Deals', 3000)
+    for deal in deals[:2600]:
+        deal['Modified_Time'] = '2024-06-01T00:00:00+10:00'
+    server = mock_api(records={'Deals': deals})
+
+    changed = zcrm_list_deals(modified_since='2024-03-01T00:00:00+10:00')['data']
+
+    assert compared(changed) == compared(deals[:2600])
+    assert len(server.jobs) == 1
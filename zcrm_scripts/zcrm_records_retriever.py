@@ -1,132 +1,494 @@
 import requests
 from pprint import pprint
-import json
-
-from .obtain_access_token import initialize_zoho_tokens
+import csv
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from dotenv import load_dotenv
+
+from pipeline_scripts.columnar_store import write_zcrm_records
+from pipeline_scripts.sqlite_store import upsert_zcrm_deals, upsert_zcrm_leads
+from shared_scripts.fetch_checkpoint import PageCheckpoint
+from shared_scripts.json_records import write_json_array
+from shared_scripts.request_scheduler import get_scheduler
+from shared_scripts.sync_state import (
+    load_records,
+    load_sync_state,
+    merge_records,
+    needs_full_sync,
+    save_sync_state,
+    update_sync_state,
+)
+
+from .obtain_access_token import zoho_tokens
+
+load_dotenv()
 
 # Constants
-BASE_URL = 'https://www.zohoapis.com/crm/v6/'
-ACCESS_TOKEN = initialize_zoho_tokens()
-
-def make_api_request(url: str, headers: dict) -> dict:
+# Overridable to point at a local mock server
+BASE_URL = os.getenv('ZCRM_BASE_URL', 'https://www.zohoapis.com/crm/v6/')
+BULK_URL = os.getenv('ZCRM_BULK_URL', 'https://www.zohoapis.com/crm/bulk/v6/')
+PAGE_SIZE = 200
+PREFETCH_PAGES = 4
+# The search API returns at most this many records per query.
+SEARCH_RECORD_LIMIT = 2000
+# Modules larger than this are exported with a Bulk Read job instead of searched.
+BULK_READ_THRESHOLD = SEARCH_RECORD_LIMIT
+BULK_POLL_SECONDS = 5
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+LEAD_FIELDS = [
+    'Company', 'Contact_type', 'Converted_Account', 'Converted_Contact', 'Converted_Deal',
+    'Country', 'Created_Time', 'Deal_Name', 'Deal_Type', 'Email', 'First_Name', 'Full_Name',
+    'Generic_Email', 'Industry', 'Last_Name', 'Lead_Number', 'Lead_Source', 'Lead_Status',
+    'Lead_source_notes', 'Mobile', 'Phone'
+]
+DEAL_FIELDS = [
+    'Deal_Name', 'Checked_Signed_off', 'Stage', 'Created_Time', 'Agreement_Approved', 'Emergency_Forward_No',
+    'Solution_delivered', 'Generic_Email', 'Accepted_by_Provisioning', 'Amount', 'Contact_Name', 
+    'Lead_Source', 'SAF_Sent', 'Grand_Total', 'Monthly_Sub_Total', 'Octane_ID', 'Agreement_Returned_On',
+    'Deal_Type', 'Proposal_Sent', 'Handsets_Required', 'Lines_Required', 
+]
+# Fields requested on top of the cleaned ones, for incremental sync.
+SYNC_FIELDS = ['Modified_Time']
+# The lead sources of the records fetched from every module.
+LEAD_SOURCES = ['B4B', 'B4B Unqualified']
+# Bulk Read exports are CSV, so numeric fields come back as text.
+NUMERIC_FIELDS = ['Amount', 'Grand_Total', 'Monthly_Sub_Total']
+# Lookup field -> the module it points to and the field of that module the API returns as the lookup's name.
+LOOKUP_FIELDS = {'Contact_Name': ('Contacts', 'Full_Name')}
+# The most record IDs per Get Records request.
+RECORD_IDS_PER_REQUEST = 100
+RAW_DATA_FILES = {
+    'Leads': './zcrm_scripts/data/raw-zcrm-leads.json',
+    'Deals': './zcrm_scripts/data/raw-zcrm-deals.json',
+}
+SYNC_STATE_FILES = {
+    'Leads': './zcrm_scripts/data/leads-sync-state.json',
+    'Deals': './zcrm_scripts/data/deals-sync-state.json',
+}
+CHECKPOINT_DIR = './zcrm_scripts/data/'
+
+def make_api_request(url: str, headers: dict, session: requests.Session = None) -> dict:
     """
     Makes a GET request to the specified URL with the provided headers.
 
+    The request is paced and retried by the shared Zoho CRM request scheduler, and
+    authorized with the shared Zoho token manager.
+
     Args:
         url (str): The URL to make the request to.
         headers (dict): The headers to include in the request.
+        session (requests.Session): The session to send the request on, for connection reuse.
 
     Returns:
         dict: The parsed JSON response.
+
+    Raises:
+        requests.exceptions.RequestException: The request still failed after retrying.
     """
     print(f'Making request to {url}')
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"An error occurred: {e}")
-        return None
+    response = get_scheduler('zcrm').request('GET', url, session, headers=headers, auth=zoho_tokens())
+    # No records, or none modified since If-Modified-Since
+    if response.status_code in (204, 304):
+        return {'data': []}
+    return response.json()
 
 
-def get_zcrm_data(endpoint: str, criteria: str) -> dict:
+def get_zcrm_page(endpoint: str, criteria: str, page: int, session: requests.Session = None,
+                  modified_since: str = None, fields: list = None) -> dict:
     """
-    Makes a request to the Zoho CRM API and returns the parsed JSON response.
+    Makes a request for one page of Zoho CRM search results.
 
     Args:
         endpoint (str): The endpoint to make the request to.
         criteria (str): The criteria to include in the request.
+        page (int): The page number, starting at 1.
+        session (requests.Session): The session to send the request on.
+        modified_since (str): Only return records modified after this ISO 8601 time.
+        fields (list): The fields to return, all fields if not given.
 
     Returns:
         dict: The parsed JSON response.
     """
-    url = f"{BASE_URL}{endpoint}/search?criteria={criteria}"
-    headers = {"Authorization": f"Zoho-oauthtoken {ACCESS_TOKEN}"}
-    return make_api_request(url, headers)
+    url = f"{BASE_URL}{endpoint}/search?criteria={quote(criteria)}&page={page}&per_page={PAGE_SIZE}"
+    if fields:
+        url += f"&fields={','.join(fields)}"
+    headers = {}
+    if modified_since:
+        headers["If-Modified-Since"] = modified_since
+    return make_api_request(url, headers, session)
+
+
+def get_zcrm_data(endpoint: str, criteria: str, session: requests.Session = None,
+                  modified_since: str = None, fields: list = None) -> dict:
+    """
+    Makes requests to the Zoho CRM API for every page of search results.
+
+    After the first page, pages are prefetched PREFETCH_PAGES at a time in parallel
+    until a page reports no more records or SEARCH_RECORD_LIMIT records have been
+    fetched. Progress is checkpointed after every page, so a fetch that fails part
+    way resumes from the last completed page on the next run.
+
+    Args:
+        endpoint (str): The endpoint to make the request to.
+        criteria (str): The criteria to include in the request.
+        session (requests.Session): The session to send the request on.
+        modified_since (str): Only return records modified after this ISO 8601 time.
+        fields (list): The fields to return, all fields if not given.
+
+    Returns:
+        dict: The records of all pages under 'data', and under 'info' whether
+            'more_records' are left beyond the search limit.
+    """
+    last_page = SEARCH_RECORD_LIMIT // PAGE_SIZE
+
+    def fetch_page(page):
+        return get_zcrm_page(endpoint, criteria, page, session, modified_since, fields)
+
+    checkpoint = PageCheckpoint(
+        f"{CHECKPOINT_DIR}{endpoint.lower()}-search-checkpoint.json",
+        {'endpoint': endpoint, 'criteria': criteria, 'modified_since': modified_since, 'fields': fields},
+    )
+    cursor, records = checkpoint.resume()
+    if cursor:
+        print(f"Resuming the {endpoint} search at page {cursor['page']} after {len(records)} records")
+        more_records, next_page = True, cursor['page']
+    else:
+        response = fetch_page(1)
+        records = list(response['data'])
+        more_records = response.get('info', {}).get('more_records', False)
+        next_page = 2
+        checkpoint.save({'page': next_page}, response['data'])
+
+    with ThreadPoolExecutor(PREFETCH_PAGES) as executor:
+        while more_records and next_page <= last_page:
+            pages = range(next_page, min(next_page + PREFETCH_PAGES, last_page + 1))
+            for page, response in zip(pages, executor.map(fetch_page, pages)):
+                records.extend(response['data'])
+                checkpoint.save({'page': page + 1}, response['data'])
+                more_records = response.get('info', {}).get('more_records', False)
+                if not more_records:
+                    break
+            next_page += PREFETCH_PAGES
+
+    checkpoint.clear()
+    return {'data': records, 'info': {'more_records': more_records}}
+
+
+def zcrm_record_count(endpoint: str, criteria: str, session: requests.Session = None) -> int:
+    """
+    Makes a request to the Zoho CRM API for the number of records matching the criteria.
+
+    Args:
+        endpoint (str): The module to count.
+        criteria (str): The criteria to include in the request.
+        session (requests.Session): The session to send the request on.
+
+    Returns:
+        int: The number of records.
+    """
+    url = f"{BASE_URL}{endpoint}/actions/count?criteria={quote(criteria)}"
+    return make_api_request(url, {}, session).get('count')
+
+
+def parse_bulk_record(row: dict) -> dict:
+    """
+    Converts one row of a Bulk Read CSV export into the shape of an API record.
+
+    Empty cells become None, numeric fields become floats and lookup fields become
+    dictionaries. The export only carries the lookup ID, so the lookup name is None
+    until resolve_lookup_names fills it in.
+
+    Args:
+        row (dict): The CSV row.
+
+    Returns:
+        dict: The record.
+    """
+    record = {}
+    for field, value in row.items():
+        value = value if value != '' else None
+        if value is not None and field in NUMERIC_FIELDS:
+            value = float(value)
+        if field in LOOKUP_FIELDS and value is not None:
+            value = {'id': value, 'name': None}
+        record[field] = value
+    return record
+
+
+def resolve_lookup_names(records: list, session: requests.Session = None) -> None:
+    """
+    Fills in the names of the lookup fields of Bulk Read records, in place.
+
+    Bulk Read exports only the lookup IDs, but the name is what deals are matched on,
+    so the distinct IDs are looked up in the lookup's module, RECORD_IDS_PER_REQUEST
+    at a time.
+
+    Args:
+        records (list): The records, as parse_bulk_record returns them.
+        session (requests.Session): The session to send the requests on.
+
+    Raises:
+        Exception: Some lookup IDs were not found, so their names would be missing.
+    """
+    for field, (module, name_field) in LOOKUP_FIELDS.items():
+        lookups = [record[field] for record in records if isinstance(record.get(field), dict)]
+        ids = list(dict.fromkeys(lookup['id'] for lookup in lookups))
+        names = {}
+        for start in range(0, len(ids), RECORD_IDS_PER_REQUEST):
+            url = f"{BASE_URL}{module}?ids={','.join(ids[start:start + RECORD_IDS_PER_REQUEST])}&fields={name_field}"
+            for record in make_api_request(url, {}, session)['data']:
+                names[record['id']] = record.get(name_field)
+
+        missing = [lookup_id for lookup_id in ids if lookup_id not in names]
+        if missing:
+            raise Exception(f"{len(missing)} {field} IDs of the Bulk Read export were not found in {module}, "
+                            f"e.g. {missing[0]}")
+        for lookup in lookups:
+            lookup['name'] = names[lookup['id']]
+
+
+def bulk_read_zcrm_data(endpoint: str, criteria: dict, fields: list, session: requests.Session = None) -> dict:
+    """
+    Exports a Zoho CRM module with Bulk Read jobs.
+
+    Each job exports one page of up to 200,000 records. The job is polled until it
+    completes and its zipped CSV result is downloaded in chunks before the next page
+    is requested. Completed pages are checkpointed, so a failed export resumes from
+    the next page on the next run. The lookup names the export leaves out are then
+    resolved with resolve_lookup_names.
+
+    Args:
+        endpoint (str): The module to export.
+        criteria (dict): The Bulk Read criteria.
+        fields (list): The fields to export.
+        session (requests.Session): The session to send the requests on.
+
+    Returns:
+        dict: The records of all pages under 'data'.
+    """
+    scheduler = get_scheduler('zcrm')
+    auth = zoho_tokens()
+    checkpoint = PageCheckpoint(
+        f"{CHECKPOINT_DIR}{endpoint.lower()}-bulk-checkpoint.json",
+        {'endpoint': endpoint, 'criteria': criteria, 'fields': fields},
+    )
+    cursor, records = checkpoint.resume()
+    page = cursor['page'] if cursor else 1
+    if cursor:
+        print(f"Resuming the {endpoint} bulk read at page {page} after {len(records)} records")
+
+    while True:
+        query = {"module": {"api_name": endpoint}, "fields": fields, "criteria": criteria, "page": page}
+        print(f'Creating bulk read job for {endpoint} (page {page})')
+        response = scheduler.request('POST', f"{BULK_URL}read", session, json={"query": query}, auth=auth)
+        job_id = response.json()['data'][0]['details']['id']
+
+        while True:
+            response = scheduler.request('GET', f"{BULK_URL}read/{job_id}", session, auth=auth)
+            job = response.json()['data'][0]
+            if job['state'] == 'COMPLETED':
+                break
+            if job['state'] == 'FAILURE':
+                raise Exception(f"Bulk read job {job_id} failed.")
+            time.sleep(BULK_POLL_SECONDS)
+
+        result = job['result']
+        download_url = result['download_url']
+        if not download_url.startswith('http'):
+            download_url = f"{BULK_URL.split('/crm/')[0]}{download_url}"
+
+        print(f'Downloading bulk read result {job_id}')
+        buffer = io.BytesIO()
+        with scheduler.request('GET', download_url, session, stream=True, auth=auth) as response:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                buffer.write(chunk)
+
+        page_records = []
+        with zipfile.ZipFile(buffer) as archive:
+            for name in archive.namelist():
+                with archive.open(name) as file:
+                    reader = csv.DictReader(io.TextIOWrapper(file, encoding='utf-8'))
+                    page_records.extend(parse_bulk_record(row) for row in reader)
+        records.extend(page_records)
+        page += 1
+        checkpoint.save({'page': page}, page_records)
+
+        if not result.get('more_records'):
+            break
+
+    resolve_lookup_names(records, session)
+    checkpoint.clear()
+    return {'data': records}
+
+
+def search_criteria(lead_sources: list) -> str:
+    """
+    Builds the search API criteria for records with any of the lead sources.
+
+    Args:
+        lead_sources (list): The lead sources to match.
+
+    Returns:
+        str: The criteria, not yet URL-encoded.
+    """
+    conditions = [f"(Lead_Source:equals:{source})" for source in lead_sources]
+    return conditions[0] if len(conditions) == 1 else f"({'or'.join(conditions)})"
+
+
+def bulk_criteria(lead_sources: list, modified_since: str = None) -> dict:
+    """
+    Builds the Bulk Read criteria for records with any of the lead sources.
+
+    Args:
+        lead_sources (list): The lead sources to match.
+        modified_since (str): Only match records modified after this ISO 8601 time.
+
+    Returns:
+        dict: The criteria.
+    """
+    criteria = {"field": {"api_name": "Lead_Source"}, "comparator": "in", "value": lead_sources}
+    if modified_since is None:
+        return criteria
+    modified = {"field": {"api_name": "Modified_Time"}, "comparator": "greater_than", "value": modified_since}
+    return {"group_operator": "and", "group": [criteria, modified]}
+
+
+def list_zcrm_module(endpoint: str, fields: list, session: requests.Session = None,
+                     modified_since: str = None) -> dict:
+    """
+    Retrieves every record of a Zoho CRM module with one of the LEAD_SOURCES.
+
+    Full fetches of modules above BULK_READ_THRESHOLD records use a Bulk Read export;
+    everything else pages through the search API. An incremental fetch whose changes
+    run past the search API's SEARCH_RECORD_LIMIT is exported with Bulk Read instead.
+
+    Args:
+        endpoint (str): The module to retrieve.
+        fields (list): The fields to return.
+        session (requests.Session): The session to send the requests on.
+        modified_since (str): Only return records modified after this ISO 8601 time.
+
+    Returns:
+        dict: The records under 'data'.
+    """
+    criteria = search_criteria(LEAD_SOURCES)
+    if modified_since is None:
+        count = zcrm_record_count(endpoint, criteria, session)
+        if count is not None and count > BULK_READ_THRESHOLD:
+            return bulk_read_zcrm_data(endpoint, bulk_criteria(LEAD_SOURCES), ['id'] + fields, session)
+
+    response = get_zcrm_data(endpoint, criteria, session, modified_since, fields)
+    if not response['info']['more_records']:
+        return {'data': response['data']}
+
+    print(f"More than {SEARCH_RECORD_LIMIT} {endpoint} changed since {modified_since}, switching to a bulk read")
+    return bulk_read_zcrm_data(endpoint, bulk_criteria(LEAD_SOURCES, modified_since), ['id'] + fields, session)
 
 
 def save_cleaned_zcrm_data(data: dict, filename: str, specified_fields: list) -> None:
     """
-    Saves the cleaned Zoho CRM data to a JSON file.
+    Saves the cleaned Zoho CRM data to a Parquet file.
 
     Args:
         data (dict): The data to clean and save.
         filename (str): The filename to save the data to.
         specified_fields (list): The fields to include in the cleaned data.
     """
-    result = [{field: item[field] for field in specified_fields} for item in data['data']]
-    with open(filename, 'w') as file:
-        json.dump(result, file, indent=4)
+    write_zcrm_records(data['data'], filename, specified_fields)
 
 
 def clean_zcrm_leads(data: dict) -> None:
     """
-    Cleans the Zoho CRM leads data and saves it to a JSON file.
+    Cleans the Zoho CRM leads data and saves it to a Parquet file.
 
     Args:
         data (dict): The data to clean and save.
     """
-    specified_fields = [
-        'Company', 'Contact_type', 'Converted_Account', 'Converted_Contact', 'Converted_Deal',
-        'Country', 'Created_Time', 'Deal_Name', 'Deal_Type', 'Email', 'First_Name', 'Full_Name',
-        'Generic_Email', 'Industry', 'Last_Name', 'Lead_Number', 'Lead_Source', 'Lead_Status',
-        'Lead_source_notes', 'Mobile', 'Phone'
-    ]
-    save_cleaned_zcrm_data(data, './zcrm_scripts/data/clean-zcrm-leads.json', specified_fields)
+    save_cleaned_zcrm_data(data, './zcrm_scripts/data/clean-zcrm-leads.parquet', LEAD_FIELDS)
 
 
 def clean_zcrm_deals(data: dict) -> None:
     """
-    Cleans the Zoho CRM deals data and saves it to a JSON file.
+    Cleans the Zoho CRM deals data and saves it to a Parquet file.
 
     Args:
         data (dict): The data to clean and save.
     """
-    specified_fields = [
-        'Deal_Name', 'Checked_Signed_off', 'Stage', 'Created_Time', 'Agreement_Approved', 'Emergency_Forward_No',
-        'Solution_delivered', 'Generic_Email', 'Accepted_by_Provisioning', 'Amount', 'Contact_Name', 
-        'Lead_Source', 'SAF_Sent', 'Grand_Total', 'Monthly_Sub_Total', 'Octane_ID', 'Agreement_Returned_On',
-        'Deal_Type', 'Proposal_Sent', 'Handsets_Required', 'Lines_Required', 
-    ]
-    save_cleaned_zcrm_data(data, './zcrm_scripts/data/clean-zcrm-deals.json', specified_fields)
+    save_cleaned_zcrm_data(data, './zcrm_scripts/data/clean-zcrm-deals.parquet', DEAL_FIELDS)
 
 
-def zcrm_list_leads() -> dict:
+def zcrm_list_leads(session: requests.Session = None, modified_since: str = None) -> dict:
     """
-    Makes a request to the Zoho CRM API and returns a list of all leads with a Lead Source of 'B4B'.
+    Makes a request to the Zoho CRM API and returns a list of all leads with a Lead Source of 'B4B' or 'B4B Unqualified'.
+
+    Args:
+        session (requests.Session): The session to send the request on.
+        modified_since (str): Only return leads modified after this ISO 8601 time.
 
     Returns:
         dict: The parsed JSON response.
     """
-    criteria = "(Lead_Source:equals:B4B)&(Lead_Source:equals:B4B Unqualified)"
-    return get_zcrm_data("Leads", criteria)
+    return list_zcrm_module("Leads", LEAD_FIELDS + SYNC_FIELDS, session, modified_since)
 
 
-def zcrm_list_deals() -> dict:
+def zcrm_list_deals(session: requests.Session = None, modified_since: str = None) -> dict:
     """
-    Makes a request to the Zoho CRM API and returns a list of all deals with a Lead Source of 'B4B'.
+    Makes a request to the Zoho CRM API and returns a list of all deals with a Lead Source of 'B4B' or 'B4B Unqualified'.
+
+    Args:
+        session (requests.Session): The session to send the request on.
+        modified_since (str): Only return deals modified after this ISO 8601 time.
 
     Returns:
         dict: The parsed JSON response.
     """
-    criteria = "(Lead_Source:equals:B4B)&(Lead_Source:equals:B4B Unqualified)"
-    return get_zcrm_data("Deals", criteria)
+    return list_zcrm_module("Deals", DEAL_FIELDS + SYNC_FIELDS, session, modified_since)
 
 
-def zcrm_get_latest() -> None:
-    leads = zcrm_list_leads()
-    if leads:
-        clean_zcrm_leads(leads)
+def sync_zcrm_module(module: str, session: requests.Session = None, incremental: bool = False) -> dict:
+    """
+    Fetches a Zoho CRM module and updates the locally stored raw records.
 
-    deals = zcrm_list_deals()
-    if deals:
-        clean_zcrm_deals(deals)
+    In incremental mode only the records modified since the stored Modified_Time
+    high-water mark are fetched and merged into the stored records by ID. A full
+    fetch still runs when there is no mark yet or the last full reconciliation is
+    older than RECONCILE_AFTER_SECONDS. The fetched records are also upserted into
+    the SQLite store.
 
+    Args:
+        module (str): The module to sync, 'Leads' or 'Deals'.
+        session (requests.Session): The session to send the request on.
+        incremental (bool): Fetch only the records changed since the last sync.
+
+    Returns:
+        dict: All stored records for the module, in the shape of an API response.
 
+    Raises:
+        requests.exceptions.RequestException: The fetch failed; the stored records are left unchanged.
+    """
+    list_records = {'Leads': zcrm_list_leads, 'Deals': zcrm_list_deals}[module]
+    state = load_sync_state(SYNC_STATE_FILES[module])
+    full = not incremental or needs_full_sync(state)
 
+    response = list_records(session, None if full else state['watermark'])
 
+    records = response['data']
+    if not full:
+        records = merge_records(load_records(RAW_DATA_FILES[module]), records)
 
+    write_json_array(RAW_DATA_FILES[module], records)
+    upsert_records = {'Leads': upsert_zcrm_leads, 'Deals': upsert_zcrm_deals}[module]
+    upsert_records(response['data'], replace_all=full)
+    save_sync_state(SYNC_STATE_FILES[module], update_sync_state(state, response['data'], 'Modified_Time', full))
 
+    return {'data': records}
 
 
-    
+def zcrm_get_latest(session: requests.Session = None, incremental: bool = False) -> None:
+    clean_zcrm_leads(sync_zcrm_module('Leads', session, incremental))
+    clean_zcrm_deals(sync_zcrm_module('Deals', session, incremental))
@@ -0,0 +1,275 @@
+"""
+A local stand-in for the Zoho CRM search, record count, Get Records and Bulk Read APIs.
+
+Serves a fixed set of records per module so that paging and bulk export can be
+exercised without network access. Criteria are not evaluated beyond Modified_Time,
+given as If-Modified-Since to the search API and as a Bulk Read condition; every
+record of the module matches otherwise. Like Zoho, search stops at 2000 records. Records of modules without records of their own, such as Contacts,
+are made up from the lookups pointing at them, with the lookup name as Full_Name.
+
+Usage:
+    python -m zcrm_scripts.zcrm_stub_server [records per module]
+
+Then point the retriever at it:
+    zcrm_records_retriever.BASE_URL = server.base_url
+    zcrm_records_retriever.BULK_URL = server.bulk_url
+"""
+import csv
+import io
+import itertools
+import json
+import sys
+import threading
+import zipfile
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# The search API returns at most this many records per query.
+SEARCH_RECORD_LIMIT = 2000
+
+
+class ZcrmStubServer(ThreadingHTTPServer):
+    """An in-process HTTP server emulating the Zoho CRM paging and Bulk Read protocols."""
+
+    daemon_threads = True
+
+    def __init__(self, records: dict, address: tuple = ('127.0.0.1', 0),
+                 bulk_page_size: int = 200000, polls_until_complete: int = 1, page_size: int = 200,
+                 handler=None):
+        """
+        Args:
+            records (dict): Module name -> list of records.
+            address (tuple): The host and port to listen on, port 0 picks a free one.
+            bulk_page_size (int): The number of records per Bulk Read job.
+            polls_until_complete (int): The number of status polls a job stays IN PROGRESS for.
+            page_size (int): The most search results per page, whatever per_page asks for.
+            handler: The request handler class, defaults to ZcrmStubHandler.
+        """
+        super().__init__(address, handler or ZcrmStubHandler)
+        self.records = records
+        self.page_size = page_size
+        self.bulk_page_size = bulk_page_size
+        self.polls_until_complete = polls_until_complete
+        self.jobs = {}
+        self.job_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    @property
+    def root_url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    @property
+    def base_url(self) -> str:
+        return f"{self.root_url}/crm/v6/"
+
+    @property
+    def bulk_url(self) -> str:
+        return f"{self.root_url}/crm/bulk/v6/"
+
+    def start(self) -> 'ZcrmStubServer':
+        """Serve requests on a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class ZcrmStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status: int, body: bytes = b'', content_type: str = 'application/json') -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, payload: dict, status: int = 200) -> None:
+        self.send_body(status, json.dumps(payload).encode())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip('/').split('/')
+
+        if parts[:2] == ['crm', 'v6'] and parts[3:] == ['search']:
+            return self.search(parts[2], query)
+        if parts[:2] == ['crm', 'v6'] and len(parts) == 3 and 'ids' in query:
+            return self.get_records(parts[2], query)
+        if parts[:2] == ['crm', 'v6'] and parts[3:] == ['actions', 'count']:
+            return self.send_json({'count': len(self.server.records.get(parts[2], []))})
+        if parts[:4] == ['crm', 'bulk', 'v6', 'read'] and len(parts) == 5:
+            return self.job_status(parts[4])
+        if parts[:4] == ['crm', 'bulk', 'v6', 'read'] and parts[5:] == ['result']:
+            return self.job_result(parts[4])
+        self.send_json({'code': 'INVALID_URL_PATTERN'}, 404)
+
+    def do_POST(self):
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if parts == ['crm', 'bulk', 'v6', 'read']:
+            body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            return self.create_job(body['query'])
+        self.send_json({'code': 'INVALID_URL_PATTERN'}, 404)
+
+    def search(self, module: str, query: dict) -> None:
+        records = self.server.records.get(module, [])
+        modified_since = self.headers.get('If-Modified-Since')
+        if modified_since:
+            since = datetime.fromisoformat(modified_since)
+            records = [record for record in records
+                       if record.get('Modified_Time') and datetime.fromisoformat(record['Modified_Time']) > since]
+
+        page = int(query.get('page', ['1'])[0])
+        per_page = min(int(query.get('per_page', ['200'])[0]), self.server.page_size)
+        if page * per_page > SEARCH_RECORD_LIMIT:
+            return self.send_json({'code': 'LIMIT_REACHED', 'status': 'error'}, 400)
+        page_records = records[(page - 1) * per_page:page * per_page]
+        if not page_records:
+            return self.send_body(304 if modified_since and page == 1 else 204)
+
+        if 'fields' in query:
+            fields = ['id'] + query['fields'][0].split(',')
+            page_records = [{field: record.get(field) for field in fields} for record in page_records]
+
+        self.send_json({
+            'data': page_records,
+            'info': {
+                'per_page': per_page,
+                'count': len(page_records),
+                'page': page,
+                'more_records': page * per_page < len(records),
+            },
+        })
+
+    def get_records(self, module: str, query: dict) -> None:
+        ids = set(query['ids'][0].split(','))
+        if module in self.server.records:
+            records = [record for record in self.server.records[module] if record.get('id') in ids]
+        else:
+            lookups = {value['id']: value.get('name') for records in self.server.records.values()
+                       for record in records for value in record.values()
+                       if isinstance(value, dict) and value.get('id') in ids}
+            records = [{'id': lookup_id, 'Full_Name': name} for lookup_id, name in lookups.items()]
+        if not records:
+            return self.send_body(204)
+        if 'fields' in query:
+            fields = ['id'] + query['fields'][0].split(',')
+            records = [{field: record.get(field) for field in fields} for record in records]
+        self.send_json({'data': records, 'info': {'count': len(records), 'more_records': False}})
+
+    def create_job(self, query: dict) -> None:
+        with self.server.lock:
+            job_id = str(next(self.server.job_ids))
+            self.server.jobs[job_id] = {'query': query, 'polls': 0}
+        self.send_json({'data': [{
+            'status': 'success',
+            'code': 'ADDED_SUCCESSFULLY',
+            'details': {'id': job_id, 'operation': 'read', 'state': 'ADDED'},
+        }]}, 201)
+
+    def job_page(self, job: dict) -> tuple:
+        module = job['query']['module']['api_name']
+        page = job['query'].get('page', 1)
+        size = self.server.bulk_page_size
+        records = [record for record in self.server.records.get(module, [])
+                   if modified_after(record, job['query'].get('criteria'))]
+        return records[(page - 1) * size:page * size], page * size < len(records), page
+
+    def job_status(self, job_id: str) -> None:
+        job = self.server.jobs.get(job_id)
+        if job is None:
+            return self.send_json({'code': 'INVALID_DATA'}, 400)
+
+        job['polls'] += 1
+        details = {'id': job_id, 'operation': 'read', 'state': 'IN PROGRESS'}
+        if job['polls'] > self.server.polls_until_complete:
+            records, more_records, page = self.job_page(job)
+            details['state'] = 'COMPLETED'
+            details['result'] = {
+                'page': page,
+                'count': len(records),
+                'download_url': f"/crm/bulk/v6/read/{job_id}/result",
+                'more_records': more_records,
+            }
+        self.send_json({'data': [details]})
+
+    def job_result(self, job_id: str) -> None:
+        job = self.server.jobs.get(job_id)
+        if job is None:
+            return self.send_json({'code': 'INVALID_DATA'}, 400)
+
+        records, _, _ = self.job_page(job)
+        fields = job['query']['fields']
+        text = io.StringIO()
+        writer = csv.DictWriter(text, fieldnames=fields)
+        writer.writeheader()
+        for record in records:
+            row = {}
+            for field in fields:
+                value = record.get(field)
+                if isinstance(value, dict):
+                    value = value.get('id')
+                row[field] = '' if value is None else value
+            writer.writerow(row)
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as file:
+            file.writestr(f"{job_id}.csv", text.getvalue())
+        self.send_body(200, archive.getvalue(), 'application/zip')
+
+
+def modified_after(record: dict, criteria: dict) -> bool:
+    """
+    Check a record against the Modified_Time conditions of Bulk Read criteria.
+
+    Args:
+        record (dict): The record.
+        criteria (dict): The criteria, possibly a group; None matches every record.
+
+    Returns:
+        bool: False if the record was not modified after a greater_than condition's time.
+    """
+    if not criteria:
+        return True
+    if 'group' in criteria:
+        return all(modified_after(record, condition) for condition in criteria['group'])
+    if criteria['field']['api_name'] != 'Modified_Time' or criteria['comparator'] != 'greater_than':
+        return True
+    return (record.get('Modified_Time') is not None
+            and datetime.fromisoformat(record['Modified_Time']) > datetime.fromisoformat(criteria['value']))
+
+
+def sample_records(module: str, count: int) -> list:
+    """
+    Build placeholder records for a module.
+
+    Args:
+        module (str): The module name.
+        count (int): The number of records.
+
+    Returns:
+        list: The records.
+    """
+    return [{
+        'id': f"{module.lower()}-{i}",
+        'Modified_Time': '2024-01-01T00:00:00+10:00',
+        'Full_Name': f"Contact {i}",
+        'Email': f"contact{i}@example.com",
+        'Contact_Name': {'id': f"contact-{i}", 'name': f"Contact {i}"},
+        'Amount': float(i),
+        'Stage': 'Checked & Signed Off',
+        'Lead_Source': 'B4B',
+    } for i in range(count)]
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    server = ZcrmStubServer({module: sample_records(module, count) for module in ['Leads', 'Deals']})
+    print(f"Serving Zoho CRM stub at {server.base_url} (bulk: {server.bulk_url})")
+    server.serve_forever()